@@ -3,15 +3,76 @@ import sys
 import json
 import datetime
 import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
 # 导入公共工具
 from common_utils import (
     get_application_path, ensure_directory, get_game_path, 
     get_config_dir, prepare_git_environment, run_git_command,
-    Colors, colored_print, generate_safe_branch_name
+    Colors, colored_print, generate_safe_branch_name, get_ref_index
 )
 
+# 导入MOD列表
+from mod_catalog import get_mod_catalog, find_first_txt
+
+# 导入临时索引工具
+from install_engine import TempIndex, hash_files, commit_tree, update_branch, resolve_commit, list_tree_entries
+
+# 导入MOD文件清单
+from mod_manifest import (
+    find_mod_json_files, load_manifest, save_manifest, build_manifest, manifest_oids, check_manifest,
+    classify_mod_files, build_semantic_patch, save_semantic_patch, has_semantic_patch,
+    KIND_NEW, KIND_REPLACE, KIND_EDIT, KIND_SEMANTIC, EMPTY_PATCH_NAME
+)
+
+# 导入安装事件
+from install_events import timed_phase
+
+# 并行生成补丁的线程数，每个线程使用自己的临时索引
+PATCH_WORKERS = os.cpu_count() or 4
+
+# 分支和标签的写入在各线程之间串行进行
+_ref_lock = threading.Lock()
+
+class ModOutputBuffer:
+    """并行处理时的stdout代理：工作线程的输出先缓存，处理完一个MOD后整段写出
+
+    其他线程（例如界面线程）的输出直接写入原来的stdout。
+    """
+    
+    def __init__(self, target):
+        self.target = target
+        self.local = threading.local()
+        self.lock = threading.Lock()
+    
+    def write(self, text):
+        buffer = getattr(self.local, "buffer", None)
+        if buffer is None:
+            return self.target.write(text)
+        buffer.append(text)
+        return len(text)
+    
+    def flush(self):
+        if getattr(self.local, "buffer", None) is None:
+            self.target.flush()
+    
+    def __getattr__(self, name):
+        return getattr(self.target, name)
+    
+    def run(self, func, *args):
+        """在当前线程中执行func，结束后把它的全部输出一次写出"""
+        buffer = []
+        self.local.buffer = buffer
+        try:
+            return func(*args)
+        finally:
+            self.local.buffer = None
+            with self.lock:
+                self.target.write(''.join(buffer))
+                self.target.flush()
+
 def generate_default_config(mod_dir, mod_name, patch_file=None):
     """为指定的MOD目录生成默认的modConfig.json文件"""
     # 获取当前日期
@@ -36,25 +97,20 @@ def generate_default_config(mod_dir, mod_name, patch_file=None):
     if patch_file:
         default_config["patchFile"] = patch_file
     
-    # 查找并读取txt文件作为remark
-    txt_files = []
-    for root, _, files in os.walk(mod_dir):
-        for file in files:
-            if file.lower().endswith('.txt'):
-                txt_path = os.path.join(root, file)
-                txt_files.append(txt_path)
+    # 查找第一个txt文件作为remark
+    txt_file = find_first_txt(mod_dir)
     
-    # 如果找到txt文件，读取第一个作为remark
-    if txt_files:
+    # 如果找到txt文件，读取它作为remark
+    if txt_file:
         try:
-            with open(txt_files[0], 'r', encoding='utf-8', errors='ignore') as f:
+            with open(txt_file, 'r', encoding='utf-8', errors='ignore') as f:
                 txt_content = f.read().strip()
                 if txt_content:
                     # 限制remark长度，避免过长
                     if len(txt_content) > 500:
                         txt_content = txt_content[:497] + "..."
                     default_config["remark"] = txt_content
-                    print(f"已从 {os.path.basename(txt_files[0])} 读取说明信息")
+                    print(f"已从 {os.path.basename(txt_file)} 读取说明信息")
         except Exception as e:
             print(f"读取txt文件时出错: {e}")
     
@@ -67,7 +123,10 @@ def generate_default_config(mod_dir, mod_name, patch_file=None):
     return config_path
 
 def process_mod_files(mod_dir, config_dir, mod_name):
-    """处理MOD文件，复制到游戏目录并生成补丁"""
+    """处理MOD文件，在临时索引中生成MOD提交和补丁
+
+    文件清单（路径 -> 对象ID）与当前文件一致且MOD分支未变时不重新生成。
+    """
     colored_print(f"[处理] MOD: {mod_name}", Colors.CYAN)
     
     # 读取MOD配置
@@ -87,12 +146,7 @@ def process_mod_files(mod_dir, config_dir, mod_name):
     ensure_directory(patches_dir)
     
     # 查找所有json文件
-    json_files = []
-    for root, _, files in os.walk(mod_dir):
-        for file in files:
-            if file.lower().endswith('.json') and file != "modConfig.json":
-                json_path = os.path.join(root, file)
-                json_files.append(json_path)
+    json_files = find_mod_json_files(mod_dir)
     
     if not json_files:
         colored_print(f"[警告] {mod_name} 中没有找到json文件", Colors.YELLOW)
@@ -102,93 +156,54 @@ def process_mod_files(mod_dir, config_dir, mod_name):
     safe_mod_name = generate_safe_branch_name(mod_name)
     branch_name = f"mod_{safe_mod_name}"
     
-    # 检查分支是否已存在
-    stdout, stderr, code = run_git_command(['git', 'branch'], cwd=config_dir)
-    if code != 0:
-        colored_print(f"[错误] 无法获取分支列表: {stderr}", Colors.RED)
-        return None
-        
-    existing_branches = [b.strip().replace('* ', '') for b in stdout.split('\n') if b.strip()]
-    
-    # 检查是否已有该MOD的标签，以及版本是否一致
-    stdout, stderr, code = run_git_command(['git', 'tag', '-l', f"{branch_name}_v*"], cwd=config_dir)
-    existing_tags = stdout.strip().split('\n') if stdout.strip() else []
-    expected_tag = f"{branch_name}_v{mod_version}"
-    
-    # 如果分支存在且标签与当前版本一致，则跳过
-    if branch_name in existing_branches and expected_tag in existing_tags:
-        colored_print(f"[信息] MOD {mod_name} (版本 {mod_version}) 已存在且版本一致，跳过处理", Colors.BLUE)
-        # 确保返回正确的补丁文件路径
-        patch_files = [f for f in os.listdir(patches_dir) if f.endswith('.patch')]
-        if patch_files:
-            return os.path.join(patches_dir, patch_files[0])
-        else:
-            # 如果没有找到补丁文件，尝试生成一个
-            colored_print(f"[警告] 未找到MOD {mod_name} 的补丁文件，尝试重新生成", Colors.YELLOW)
-            # 切换到分支并生成补丁
-            current_branch = None
-            stdout, stderr, code = run_git_command(['git', 'branch', '--show-current'], cwd=config_dir)
-            if code == 0:
-                current_branch = stdout.strip()
-            
-            # 切换到MOD分支
-            stdout, stderr, code = run_git_command(['git', 'checkout', branch_name], cwd=config_dir)
-            if code == 0:
-                # 生成补丁
-                patch_file = os.path.join(patches_dir, f"{mod_name}.patch")
-                stdout, stderr, code = run_git_command(['git', 'format-patch', '-1', 'HEAD', '-o', patches_dir], cwd=config_dir)
-                if code == 0 and stdout.strip():
-                    # 重命名生成的补丁文件
-                    generated_patch = os.path.join(patches_dir, stdout.strip())
-                    if os.path.exists(generated_patch):
-                        os.rename(generated_patch, patch_file)
-                        colored_print(f"[信息] 已重新生成补丁文件: {patch_file}", Colors.GREEN)
-                
-                # 切回原分支
-                if current_branch:
-                    run_git_command(['git', 'checkout', current_branch], cwd=config_dir, check=False)
-                
-                return patch_file
-            else:
-                colored_print(f"[错误] 无法切换到分支 {branch_name}: {stderr}", Colors.RED)
-                return None
-    
-    # 如果分支存在但版本不一致，则删除分支
-    if branch_name in existing_branches:
-        colored_print(f"[信息] MOD {mod_name} 已存在但版本不一致，重新创建分支", Colors.BLUE)
-        # 先切换到主分支
-        run_git_command(['git', 'checkout', 'master'], cwd=config_dir, check=False)
-        # 删除分支
-        run_git_command(['git', 'branch', '-D', branch_name], cwd=config_dir, check=False)
-    
-    # 从主分支创建新分支
-    stdout, stderr, code = run_git_command(['git', 'checkout', 'master'], cwd=config_dir)
-    if code != 0:
-        print(f"[错误] 无法切换到主分支: {stderr}")
+    # 把MOD文件写入对象库
+    oids = hash_files(config_dir, [json_path for _, json_path in json_files])
+    if oids is None:
+        print("[错误] 无法读取MOD文件")
         return None
     
-    stdout, stderr, code = run_git_command(['git', 'checkout', '-b', branch_name], cwd=config_dir)
-    if code != 0:
-        print(f"[错误] 无法创建分支 {branch_name}: {stderr}")
+    # 检查分支是否已存在
+    ref_index = get_ref_index(config_dir)
+    branch_exists = ref_index.has_branch(branch_name)
+    
+    # 文件内容与清单一致且分支仍指向清单中的提交时，跳过处理
+    manifest = load_manifest(mod_dir)
+    branch_commit = resolve_commit(config_dir, f"refs/heads/{branch_name}") if branch_exists else None
+    file_oids = {rel_path: oid for (rel_path, _), oid in zip(json_files, oids)}
+    if (manifest and branch_commit and manifest.get("commit") == branch_commit
+            and manifest_oids(manifest) == file_oids and has_semantic_patch(mod_dir, manifest)):
+        colored_print(f"[信息] MOD {mod_name} 的文件未变化，跳过处理", Colors.BLUE)
+        patch_file = os.path.join(patches_dir, manifest.get("patch") or "")
+        if manifest.get("patch") and os.path.exists(patch_file):
+            return patch_file
+        
+        # 如果没有找到补丁文件，直接从MOD分支的提交生成（不切换分支）
+        colored_print(f"[警告] 未找到MOD {mod_name} 的补丁文件，尝试重新生成", Colors.YELLOW)
+        kinds = {path: info.get("kind") for path, info in manifest["files"].items()}
+        patch_file = write_mod_patch(config_dir, branch_commit, patches_dir, kinds)
+        if not patch_file:
+            colored_print(f"[错误] 无法从分支 {branch_name} 生成补丁", Colors.RED)
+            return None
+        manifest["patch"] = os.path.basename(patch_file)
+        save_manifest(mod_dir, manifest)
+        colored_print(f"[信息] 已重新生成补丁文件: {patch_file}", Colors.GREEN)
+        return patch_file
+    
+    # 如果分支存在但文件已变化，重新创建分支（下面会直接移动分支）
+    if branch_exists:
+        colored_print(f"[信息] MOD {mod_name} 的文件已变化，重新创建分支", Colors.BLUE)
+    
+    # 在主分支的树上构建MOD提交，使用临时索引，不切换分支也不改动游戏目录
+    base_commit = resolve_commit(config_dir, 'master')
+    if not base_commit:
+        print("[错误] 无法获取主分支提交")
         return None
     
-    # 复制文件到游戏目录
-    copied_files = []
-    for json_file in json_files:
-        # 计算相对路径
-        rel_path = os.path.relpath(json_file, mod_dir)
-        target_file = os.path.join(config_dir, rel_path)
-        
-        # 确保目标目录存在
-        ensure_directory(os.path.dirname(target_file))
-        
-        # 复制文件
-        shutil.copy2(json_file, target_file)
-        copied_files.append(rel_path)
-        print(f"  - 复制: {rel_path}")
+    entries = []
+    for (rel_path, _), oid in zip(json_files, oids):
+        entries.append(("100644", oid, rel_path))
+        print(f"  - 添加: {rel_path}")
     
-    # 添加并提交更改
-    run_git_command(['git', 'add', '.'], cwd=config_dir)
     commit_msg = f"应用MOD: {mod_name}\n版本: {mod_version}"
     if mod_config.get("author"):
         commit_msg += f"\n作者: {mod_config.get('author')}"
@@ -199,48 +214,101 @@ def process_mod_files(mod_dir, config_dir, mod_name):
         else:
             commit_msg += f"\n来源: {source}"
     
-    stdout, stderr, code = run_git_command(['git', 'commit', '-m', commit_msg], cwd=config_dir)
-    if code != 0:
-        print(f"[错误] 无法提交更改: {stderr}")
-        # 重置更改
-        run_git_command(['git', 'reset', '--hard', 'HEAD'], cwd=config_dir)
-        run_git_command(['git', 'checkout', 'master'], cwd=config_dir, check=False)
-        return None
+    with TempIndex(config_dir, f"mod_{safe_mod_name}") as mod_index:
+        tree = None
+        if mod_index.read_tree(base_commit) and mod_index.update_entries(entries):
+            tree = mod_index.write_tree()
+    commit = commit_tree(config_dir, tree, [base_commit], commit_msg) if tree else None
     
-    # 创建版本标签
     tag_name = f"{branch_name}_v{mod_version}"
-    stdout, stderr, code = run_git_command(['git', 'tag', tag_name], cwd=config_dir)
+    with _ref_lock:
+        if not commit or not update_branch(config_dir, branch_name, commit):
+            print(f"[错误] 无法提交更改: {branch_name}")
+            return None
+        
+        # 创建版本标签（版本号未变但文件变化时移动到新的提交）
+        stdout, stderr, code = run_git_command(['git', 'tag', '-f', tag_name, commit], cwd=config_dir, check=False)
     if code != 0:
         print(f"[警告] 无法创建标签 {tag_name}: {stderr}")
     else:
         print(f"[信息] 已创建标签: {tag_name}")
     
-    # 生成补丁
-    patch_file = os.path.join(patches_dir, f"{mod_name}.patch")
-    stdout, stderr, code = run_git_command(['git', 'format-patch', '-1', 'HEAD', '-o', patches_dir], cwd=config_dir)
-    if code != 0:
-        print(f"[错误] 无法生成补丁: {stderr}")
-        # 重置更改
-        run_git_command(['git', 'reset', '--hard', 'HEAD~1'], cwd=config_dir)
-        run_git_command(['git', 'checkout', 'master'], cwd=config_dir, check=False)
+    # 对文件分类：新增和整文件替换在安装时直接写入索引，只有局部修改生成补丁
+    rel_paths = [rel_path for rel_path, _ in json_files]
+    kinds = classify_mod_files(config_dir, base_commit, commit, rel_paths)
+    # 能解析的整文件替换改为只记录修改过的键
+    semantic = build_semantic_patch(config_dir, base_commit, kinds, file_oids)
+    kind_counts = {kind: list(kinds.values()).count(kind) for kind in (KIND_NEW, KIND_REPLACE, KIND_EDIT, KIND_SEMANTIC)}
+    print(f"[信息] 新增 {kind_counts[KIND_NEW]} 个文件，整文件替换 {kind_counts[KIND_REPLACE]} 个，"
+          f"局部修改 {kind_counts[KIND_EDIT]} 个，键路径修改 {kind_counts[KIND_SEMANTIC]} 个")
+    try:
+        save_semantic_patch(mod_dir, semantic)
+    except OSError as e:
+        print(f"[错误] 无法保存键路径修改: {e}")
         return None
     
-    # 获取生成的补丁文件名
-    patch_files = [f for f in os.listdir(patches_dir) if f.endswith('.patch')]
-    if not patch_files:
+    # 生成补丁
+    patch_file = write_mod_patch(config_dir, commit, patches_dir, kinds)
+    if not patch_file:
         print(f"[错误] 未找到生成的补丁文件")
         return None
     
-    # 使用最新的补丁文件
-    latest_patch = sorted(patch_files)[-1]
-    patch_file = os.path.join(patches_dir, latest_patch)
-    
-    # 切换回主分支
-    run_git_command(['git', 'checkout', 'master'], cwd=config_dir, check=False)
+    # 记录文件清单，下次检查时判断文件是否变化
+    try:
+        save_manifest(mod_dir, build_manifest(
+            json_files, oids, kinds, commit, os.path.basename(patch_file),
+            list_tree_entries(config_dir, base_commit, rel_paths)
+        ))
+    except OSError as e:
+        print(f"[警告] 无法保存文件清单: {e}")
     
     print(f"[成功] 已处理MOD: {mod_name}, 创建分支: {branch_name}, 标签: {tag_name}")
     return patch_file
 
+def write_mod_patch(config_dir, commit, patches_dir, kinds):
+    """只为局部修改的文件生成补丁；没有局部修改时写入空补丁，安装时跳过"""
+    edit_paths = [path for path, kind in kinds.items() if kind == KIND_EDIT]
+    if edit_paths:
+        return format_mod_patch(config_dir, commit, patches_dir, edit_paths)
+    patch_file = os.path.join(patches_dir, EMPTY_PATCH_NAME)
+    open(patch_file, 'w').close()
+    return patch_file
+
+def format_mod_patch(config_dir, commit, patches_dir, paths):
+    """为MOD提交中的指定文件生成补丁文件，返回补丁路径，失败时返回None"""
+    stdout, stderr, code = run_git_command(
+        ['git', 'format-patch', '-1', commit, '-o', patches_dir, '--'] + list(paths),
+        cwd=config_dir, check=False
+    )
+    if code != 0:
+        print(f"[错误] 无法生成补丁: {stderr}")
+        return None
+    generated_patch = stdout.strip().splitlines()[-1] if stdout.strip() else ""
+    generated_patch = os.path.join(config_dir, generated_patch)
+    return generated_patch if os.path.isfile(generated_patch) else None
+
+def update_patch_config(config_file, mod_dir, mod_name, patch_file):
+    """更新现有配置文件中的补丁路径，保留原有属性"""
+    try:
+        with open(config_file, 'r', encoding='utf-8') as f:
+            config = json.load(f)
+        
+        # 更新补丁文件路径
+        config["patchFile"] = os.path.relpath(patch_file, mod_dir)
+        
+        # 移除更新标记
+        if "updatePatches" in config:
+            del config["updatePatches"]
+        
+        # 写回配置文件
+        with open(config_file, 'w', encoding='utf-8') as f:
+            json.dump(config, f, ensure_ascii=False, indent=2)
+        
+        print(f"已更新 {mod_name} 的配置文件")
+    except Exception as e:
+        print(f"更新配置文件时出错: {e}")
+
+@timed_phase("check_configs")
 def check_mod_configs():
     """检查所有MOD目录并生成补丁和配置文件"""
     
@@ -276,45 +344,56 @@ def check_mod_configs():
     total_mods = 0
     processed_mods = 0
     
-    # 遍历Mods目录下的所有文件夹
-    for mod_name in os.listdir(mods_dir):
-        mod_dir = os.path.join(mods_dir, mod_name)
+    # 需要生成补丁的MOD
+    pending_mods = []
+    
+    # 遍历Mods目录下的所有文件夹（配置文件已并行读取）
+    for record in get_mod_catalog(mods_dir).refresh():
+        mod_name = record.name
+        mod_dir = record.dir
         
-        # 只处理目录
-        if not os.path.isdir(mod_dir):
-            continue
-            
         total_mods += 1
         
         # 检查是否存在modConfig.json
-        config_file = os.path.join(mod_dir, "modConfig.json")
+        config_file = record.config_file
         
         # 检查是否需要更新补丁
         need_update = False
-        if os.path.exists(config_file):
-            try:
-                with open(config_file, 'r', encoding='utf-8') as f:
-                    config = json.load(f)
-                
-                # 检查是否设置了更新标记或者没有补丁文件
-                if config.get("updatePatches", False) or "patchFile" not in config:
+        if record.error:
+            print(f"[错误] 读取配置文件时出错: {record.error}")
+            need_update = True  # 如果配置文件有问题，重新生成
+        elif record.has_config:
+            config = record.config
+            
+            # 检查是否设置了更新标记或者没有补丁文件
+            if config.get("updatePatches", False) or "patchFile" not in config:
+                need_update = True
+                if config.get("updatePatches", False):
+                    print(f"[更新] {mod_name} 设置了更新标记，将重新生成补丁")
+                else:
+                    print(f"[更新] {mod_name} 没有补丁文件，将生成补丁")
+            else:
+                # 检查补丁文件是否存在，以及MOD文件是否与清单一致
+                manifest = load_manifest(mod_dir)
+                if not os.path.exists(record.patch_file):
+                    need_update = True
+                    print(f"[更新] {mod_name} 的补丁文件不存在，将重新生成")
+                elif manifest is None and not find_mod_json_files(mod_dir):
+                    # 只提供补丁、没有json文件的MOD直接使用自带的补丁
+                    print(f"[跳过] {mod_name} 只包含补丁文件")
+                    continue
+                elif manifest is None:
+                    need_update = True
+                    print(f"[更新] {mod_name} 没有文件清单，将重新生成补丁")
+                elif not has_semantic_patch(mod_dir, manifest):
+                    need_update = True
+                    print(f"[更新] {mod_name} 的键路径修改文件不存在，将重新生成")
+                elif not check_manifest(config_dir, mod_dir, manifest):
                     need_update = True
-                    if config.get("updatePatches", False):
-                        print(f"[更新] {mod_name} 设置了更新标记，将重新生成补丁")
-                    else:
-                        print(f"[更新] {mod_name} 没有补丁文件，将生成补丁")
+                    print(f"[更新] {mod_name} 的文件已修改，将重新生成补丁")
                 else:
-                    # 检查补丁文件是否存在
-                    patch_path = os.path.join(mod_dir, config["patchFile"])
-                    if not os.path.exists(patch_path):
-                        need_update = True
-                        print(f"[更新] {mod_name} 的补丁文件不存在，将重新生成")
-                    else:
-                        print(f"[跳过] {mod_name} 已有配置文件和补丁文件")
-                        continue
-            except Exception as e:
-                print(f"[错误] 读取配置文件时出错: {e}")
-                need_update = True  # 如果配置文件有问题，重新生成
+                    print(f"[跳过] {mod_name} 已有配置文件和补丁文件")
+                    continue
         else:
             need_update = True
             print(f"[新建] {mod_name} 没有配置文件，将生成配置和补丁")
@@ -325,32 +404,25 @@ def check_mod_configs():
             if not os.path.exists(config_file):
                 print(f"为 {mod_name} 生成配置文件")
                 generate_default_config(mod_dir, mod_name)
-            
-            # 处理MOD文件并生成补丁
-            patch_file = process_mod_files(mod_dir, config_dir, mod_name)
-            
-            if patch_file:
-                # 更新现有配置文件，保留原有属性
-                try:
-                    with open(config_file, 'r', encoding='utf-8') as f:
-                        config = json.load(f)
-                    
-                    # 更新补丁文件路径
-                    config["patchFile"] = os.path.relpath(patch_file, mod_dir)
-                    
-                    # 移除更新标记
-                    if "updatePatches" in config:
-                        del config["updatePatches"]
-                    
-                    # 写回配置文件
-                    with open(config_file, 'w', encoding='utf-8') as f:
-                        json.dump(config, f, ensure_ascii=False, indent=2)
-                    
-                    print(f"已更新 {mod_name} 的配置文件")
-                except Exception as e:
-                    print(f"更新配置文件时出错: {e}")
-            
+            pending_mods.append((mod_name, mod_dir, config_file))
+    
+    # 各MOD的补丁互不依赖，在线程池中并行生成（不使用工作目录）
+    if pending_mods:
+        # 各线程的输出按MOD整段写出，避免多个MOD的日志逐行交错
+        output = ModOutputBuffer(sys.stdout)
+        sys.stdout = output
+        try:
+            with ThreadPoolExecutor(max_workers=min(PATCH_WORKERS, len(pending_mods))) as executor:
+                patch_files = list(executor.map(
+                    lambda item: output.run(process_mod_files, item[1], config_dir, item[0]),
+                    pending_mods
+                ))
+        finally:
+            sys.stdout = output.target
+        
+        for (mod_name, mod_dir, config_file), patch_file in zip(pending_mods, patch_files):
             if patch_file:
+                update_patch_config(config_file, mod_dir, mod_name, patch_file)
                 processed_mods += 1
     
     # 打印统计信息
@@ -1,6 +1,7 @@
 import os
 import sys
 import json
+import time
 import subprocess
 import shutil
 import urllib.request
@@ -11,6 +12,16 @@ from tkinter import messagebox
 from pathlib import Path
 from datetime import datetime
 
+# 导入Git后端
+from git_backend import (
+    get_popen_kwargs, try_fast_git_command, before_git_command, after_git_command,
+    get_ref_index, get_commit_subject, get_git_dir
+)
+
+# 导入安装事件和性能记录
+from install_events import timed_phase
+from install_profile import record_git_command
+
 def print_header(title):
     """打印标题栏"""
     print("=" * 38)
@@ -35,24 +46,30 @@ def get_application_path():
     return application_path
 
 
-def get_game_build_guid(game_path):
-    """获取游戏的build-guid作为版本标识"""
-    boot_config_path = os.path.join(game_path, "Sultan's Game_Data", "boot.config")
-    
+def _stat_signature(path):
+    try:
+        stat = os.stat(path)
+        return [stat.st_size, stat.st_mtime_ns]
+    except OSError:
+        return None
+
+# 游戏版本信息缓存，boot.config或游戏exe的文件状态变化时自动失效
+_game_version_cache = {}
+
+def _read_build_guid(boot_config_path):
+    """读取boot.config中的build-guid"""
     if not os.path.exists(boot_config_path):
         print(f"[警告] 找不到boot.config文件: {boot_config_path}")
         return None
     
     try:
         with open(boot_config_path, 'r', encoding='utf-8', errors='replace') as f:
-            content = f.read()
-            
-        # 查找build-guid行
-        for line in content.splitlines():
-            if line.startswith('build-guid='):
-                build_guid = line.split('=', 1)[1].strip()
-                print(f"[信息] 找到游戏build-guid: {build_guid}")
-                return build_guid
+            # 查找build-guid行
+            for line in f:
+                if line.startswith('build-guid='):
+                    build_guid = line.split('=', 1)[1].strip()
+                    print(f"[信息] 找到游戏build-guid: {build_guid}")
+                    return build_guid
         
         print("[警告] boot.config中未找到build-guid属性")
         return None
@@ -60,6 +77,66 @@ def get_game_build_guid(game_path):
         print(f"[错误] 读取boot.config文件时出错: {e}")
         return None
 
+def get_game_version_info(game_path):
+    """获取游戏版本信息 {"build_guid", "exe_time"}，文件未变化时直接使用缓存"""
+    boot_config_path = os.path.join(game_path, "Sultan's Game_Data", "boot.config")
+    game_exe_path = os.path.join(game_path, "Sultan's Game.exe")
+    signature = (_stat_signature(boot_config_path), _stat_signature(game_exe_path))
+    
+    key = os.path.normcase(os.path.abspath(game_path))
+    info = _game_version_cache.get(key)
+    if info and info["signature"] == signature:
+        return info
+    
+    exe_signature = signature[1]
+    info = {
+        "signature": signature,
+        "build_guid": _read_build_guid(boot_config_path),
+        "exe_time": datetime.fromtimestamp(exe_signature[1] / 1e9) if exe_signature else None,
+        "commits": {},
+    }
+    _game_version_cache[key] = info
+    return info
+
+def get_game_build_guid(game_path):
+    """获取游戏的build-guid作为版本标识"""
+    return get_game_version_info(game_path)["build_guid"]
+
+def get_legacy_version_tag(game_path):
+    """旧版本使用的基于游戏exe修改时间的标签，找不到exe时返回None"""
+    exe_time = get_game_version_info(game_path)["exe_time"]
+    return f"game_version_{exe_time.strftime('%Y%m%d%H%M%S')}" if exe_time else None
+
+def get_game_version_tag(game_path):
+    """当前游戏版本对应的标签名，优先使用build-guid，无法确定时返回None"""
+    build_guid = get_game_build_guid(game_path)
+    if build_guid:
+        return f"game_version_{build_guid}"
+    return get_legacy_version_tag(game_path)
+
+def resolve_game_version(config_dir, game_path):
+    """解析当前游戏版本在仓库中的标签和提交，返回 (标签名, 提交ID)
+
+    build-guid标签不存在时回退到旧版基于时间的标签；都不存在时提交ID为None。
+    结果按游戏文件状态缓存，标签被删除时重新解析。
+    """
+    info = get_game_version_info(game_path)
+    ref_index = get_ref_index(config_dir)
+    key = os.path.normcase(os.path.abspath(config_dir))
+    
+    cached = info["commits"].get(key)
+    if cached and ref_index.has_tag(cached[0]):
+        return cached
+    
+    tag_name = get_game_version_tag(game_path)
+    for candidate in (tag_name, get_legacy_version_tag(game_path)):
+        if candidate and ref_index.has_tag(candidate):
+            stdout, stderr, code = run_git_command(['git', 'rev-parse', f'{candidate}^{{commit}}'], cwd=config_dir, check=False)
+            if code == 0:
+                info["commits"][key] = (candidate, stdout.strip())
+                return info["commits"][key]
+    return tag_name, None
+
 def get_game_path():
     """获取游戏路径"""
     # 首先尝试从配置文件获取
@@ -192,30 +269,37 @@ def download_and_install_git():
             
         return False
 
-def run_git_command(cmd, cwd=None, check=True):
-    """运行Git命令并返回输出"""
+def run_git_command(cmd, cwd=None, check=True, env=None, input=None):
+    """运行Git命令并返回输出，env用于传入临时索引等额外的环境变量，input为写入标准输入的文本"""
+    start_time = time.perf_counter()
     try:
-        startupinfo = None
-        creationflags = 0
+        # 只读命令优先通过常驻进程完成，避免每次都启动新的git进程
+        if env is None and input is None:
+            fast_result = try_fast_git_command(cmd, cwd)
+            if fast_result is not None:
+                record_git_command(cmd, cwd, time.perf_counter() - start_time,
+                                   len(fast_result[0]) + len(fast_result[1]), fast_result[2])
+                return fast_result
 
-        if os.name == "nt":  # 仅在 Windows 下设置
-            startupinfo = subprocess.STARTUPINFO()
-            startupinfo.dwFlags |= subprocess.STARTF_USESHOWWINDOW
-            creationflags = subprocess.CREATE_NO_WINDOW
+        before_git_command(cmd, cwd)
 
         process = subprocess.Popen(
             cmd,
             cwd=cwd,
+            stdin=subprocess.PIPE if input is not None else None,
             stdout=subprocess.PIPE,
             stderr=subprocess.PIPE,
             text=True,
             encoding='utf-8',
             errors='replace',
-            startupinfo=startupinfo,
-            creationflags=creationflags
+            env=env,
+            **get_popen_kwargs()
         )
 
-        stdout, stderr = process.communicate()
+        stdout, stderr = process.communicate(input)
+        after_git_command(cmd, cwd, process.returncode)
+        record_git_command(cmd, cwd, time.perf_counter() - start_time,
+                           len(stdout) + len(stderr), process.returncode)
 
         if check and process.returncode != 0:
             raise subprocess.CalledProcessError(process.returncode, cmd, output=stdout, stderr=stderr)
@@ -328,8 +412,7 @@ def init_git_repo(config_dir):
                     if build_guid:
                         tag_name = f"game_version_{build_guid}"
                         # 检查标签是否存在
-                        stdout, stderr, code = run_git_command(['git', 'tag', '-l', tag_name], cwd=config_dir, check=False)
-                        if not stdout.strip():
+                        if not get_ref_index(config_dir).has_tag(tag_name):
                             # 标签不存在，说明游戏需要更新
                             print(f"\n[Git] 检测到游戏版本更新: {tag_name}")
                     
@@ -392,11 +475,7 @@ def init_git_repo(config_dir):
             
             # 检查是否存在游戏版本标签
             print("\r[Git] 检查是否存在游戏版本标签...                     ", end="")
-            tag_stdout, tag_stderr, tag_code = run_git_command(
-                ['git', 'tag', '-l', 'game_version_*'], 
-                cwd=config_dir, 
-                check=False
-            )
+            game_version_tags = get_ref_index(config_dir).tags_with_prefix('game_version_')
             
             # 检查是否存在游戏版本更新或初始化提交
             print("\r[Git] 检查是否存在游戏版本更新或初始化提交...          ", end="")
@@ -407,7 +486,7 @@ def init_git_repo(config_dir):
             )
             
             # 如果没有游戏版本标签或相关提交，则创建一个初始化提交
-            if not tag_stdout.strip() or not log_stdout.strip():
+            if not game_version_tags or not log_stdout.strip():
                 print("\r[Git] 已存在仓库但未找到游戏版本标签或初始化提交，将创建初始化提交...")
                 
                 # 配置用户信息（确保存在）
@@ -429,20 +508,11 @@ def init_git_repo(config_dir):
                     # 创建主分支标签
                     # 获取build-guid作为版本标识
                     print("\r[Git] 获取游戏版本标识...                      ", end="")
-                    build_guid = get_game_build_guid(game_path)
-                    
-                    if build_guid:
-                        tag_name = f"game_version_{build_guid}"
-                    else:
-                        # 兼容旧版本，使用时间戳
-                        game_exe_path = os.path.join(game_path, "Sultan's Game.exe")
-                        if os.path.exists(game_exe_path):
-                            mod_time = os.path.getmtime(game_exe_path)
-                            mod_time_str = datetime.fromtimestamp(mod_time).strftime("%Y%m%d%H%M%S")
-                            tag_name = f"game_version_{mod_time_str}"
-                        else:
-                            # 如果找不到游戏可执行文件，使用当前时间
-                            tag_name = f"game_version_{datetime.now().strftime('%Y%m%d%H%M%S')}"
+                    # 优先使用build-guid，兼容旧版本使用exe修改时间
+                    tag_name = get_game_version_tag(game_path)
+                    if not tag_name:
+                        # 如果找不到游戏可执行文件，使用当前时间
+                        tag_name = f"game_version_{datetime.now().strftime('%Y%m%d%H%M%S')}"
                     
                     print(f"\r[Git] 创建游戏版本标签: {tag_name}...           ", end="")
                     stdout, stderr, code = run_git_command(
@@ -485,20 +555,11 @@ def init_git_repo(config_dir):
         # 创建主分支标签
         # 获取build-guid作为版本标识
         print("\r[Git] 获取游戏版本标识...                            ", end="")
-        build_guid = get_game_build_guid(game_path)
-        
-        if build_guid:
-            tag_name = f"game_version_{build_guid}"
-        else:
-            # 兼容旧版本，使用时间戳
-            game_exe_path = os.path.join(game_path, "Sultan's Game.exe")
-            if os.path.exists(game_exe_path):
-                mod_time = os.path.getmtime(game_exe_path)
-                mod_time_str = datetime.fromtimestamp(mod_time).strftime("%Y%m%d%H%M%S")
-                tag_name = f"game_version_{mod_time_str}"
-            else:
-                # 如果找不到游戏可执行文件，使用当前时间
-                tag_name = f"game_version_{datetime.now().strftime('%Y%m%d%H%M%S')}"
+        # 优先使用build-guid，兼容旧版本使用exe修改时间
+        tag_name = get_game_version_tag(game_path)
+        if not tag_name:
+            # 如果找不到游戏可执行文件，使用当前时间
+            tag_name = f"game_version_{datetime.now().strftime('%Y%m%d%H%M%S')}"
         
         print(f"\r[Git] 创建游戏版本标签: {tag_name}...                 ", end="")
         stdout, stderr, code = run_git_command(
@@ -516,66 +577,100 @@ def init_git_repo(config_dir):
         animation_thread.join(0.5)  # 等待动画线程结束，最多等待0.5秒
         print("\r" + " " * 60 + "\r", end="")  # 清除动画行
 
+def commit_game_version(config_dir, main_branch, mod_added_files, tag_name):
+    """用临时索引把工作目录（去掉MOD添加的文件）提交为新的游戏版本并打标签
+
+    复制当前索引可以复用其中的文件状态，git add 只会重新计算变化文件的哈希。
+    """
+    git_dir = get_git_dir(config_dir)
+    temp_index = os.path.join(git_dir, f"game_version_{os.getpid()}.index")
+    env = dict(os.environ, GIT_INDEX_FILE=temp_index)
+    try:
+        if os.path.exists(os.path.join(git_dir, 'index')):
+            shutil.copy2(os.path.join(git_dir, 'index'), temp_index)
+        
+        stdout, stderr, code = run_git_command(['git', 'add', '--all'], cwd=config_dir, check=False, env=env)
+        if code != 0:
+            print(f"[错误] 无法添加游戏文件: {stderr}")
+            return False
+        
+        # 从索引中移除MOD添加的文件，分批执行避免命令行过长
+        for i in range(0, len(mod_added_files), 200):
+            run_git_command(
+                ['git', 'update-index', '--force-remove', '--'] + mod_added_files[i:i + 200],
+                cwd=config_dir, check=False, env=env
+            )
+        if mod_added_files:
+            print(f"[Git] 已排除 {len(mod_added_files)} 个MOD添加的文件")
+        
+        stdout, stderr, code = run_git_command(['git', 'write-tree'], cwd=config_dir, check=False, env=env)
+        if code != 0:
+            print(f"[错误] 无法生成游戏版本树: {stderr}")
+            return False
+        tree = stdout.strip()
+    finally:
+        if os.path.exists(temp_index):
+            os.remove(temp_index)
+    
+    cmd = ['git', 'commit-tree', tree, '-m', f'游戏版本更新 {datetime.now().strftime("%Y-%m-%d %H:%M:%S")}']
+    stdout, stderr, code = run_git_command(['git', 'rev-parse', '--verify', '-q', main_branch], cwd=config_dir, check=False)
+    if code == 0:
+        cmd += ['-p', stdout.strip()]
+    stdout, stderr, code = run_git_command(cmd, cwd=config_dir, check=False)
+    if code != 0:
+        print(f"[错误] 无法提交游戏版本更新: {stderr}")
+        return False
+    commit = stdout.strip()
+    
+    stdout, stderr, code = run_git_command(['git', 'update-ref', f'refs/heads/{main_branch}', commit], cwd=config_dir, check=False)
+    if code != 0:
+        print(f"[错误] 无法更新主分支 {main_branch}: {stderr}")
+        return False
+    
+    # 创建标签
+    stdout, stderr, code = run_git_command(['git', 'tag', tag_name, commit], cwd=config_dir, check=False)
+    if code != 0:
+        print(f"[错误] 无法创建标签: {stderr}")
+        return False
+    print(f"[Git] 已提交游戏版本更新: {commit[:8]}")
+    return True
+
+@timed_phase("reset")
 def reset_to_game_version(config_dir, game_path):
     """重置Git仓库到游戏当前版本"""
     print("[Git] 正在重置仓库到游戏当前版本...")
     
     # 获取build-guid作为版本标识
     build_guid = get_game_build_guid(game_path)
+    tag_name = get_game_version_tag(game_path)
     
     if build_guid:
-        tag_name = f"game_version_{build_guid}"
         print(f"[Git] 使用build-guid作为版本标识: {build_guid}")
-    else:
+    elif tag_name:
         # 兼容旧版本，使用时间戳
-        game_exe_path = os.path.join(game_path, "Sultan's Game.exe")
-        if not os.path.exists(game_exe_path):
-            print("[错误] 找不到游戏可执行文件")
-            return False
+        print(f"[Git] 使用文件修改时间作为版本标识: {tag_name[len('game_version_'):]}")
+    else:
+        print("[错误] 找不到游戏可执行文件")
+        return False
+    
+    # 检查是否存在对应标签（如果通过build-guid没找到，会回退到基于exe更新时间的标签）
+    ref_index = get_ref_index(config_dir)
+    found_tag, commit_hash = resolve_game_version(config_dir, game_path)
+    is_version_updated = commit_hash is None
+    
+    if found_tag != tag_name and commit_hash:
+        print(f"[Git] 找到基于时间的标签: {found_tag}，认为游戏版本未更新")
         
-        mod_time = os.path.getmtime(game_exe_path)
-        mod_time_str = datetime.fromtimestamp(mod_time).strftime("%Y%m%d%H%M%S")
-        tag_name = f"game_version_{mod_time_str}"
-        print(f"[Git] 使用文件修改时间作为版本标识: {mod_time_str}")
-    
-    # 检查是否存在对应标签
-    stdout, stderr, code = run_git_command(['git', 'tag', '-l', tag_name], cwd=config_dir)
-    is_version_updated = stdout.strip() == ""
-    
-    # 如果通过build-guid没找到标签，尝试通过exe文件更新时间查找
-    if is_version_updated and build_guid:
-        print("[Git] 通过build-guid未找到标签，尝试通过exe文件更新时间查找...")
-        game_exe_path = os.path.join(game_path, "Sultan's Game.exe")
-        if os.path.exists(game_exe_path):
-            mod_time = os.path.getmtime(game_exe_path)
-            mod_time_str = datetime.fromtimestamp(mod_time).strftime("%Y%m%d%H%M%S")
-            old_tag_name = f"game_version_{mod_time_str}"
-            
-            # 检查是否存在基于时间的标签
-            stdout, stderr, code = run_git_command(['git', 'tag', '-l', old_tag_name], cwd=config_dir)
-            if stdout.strip() != "":
-                print(f"[Git] 找到基于时间的标签: {old_tag_name}，认为游戏版本未更新")
-                
-                # 获取该标签对应的提交
-                commit_stdout, commit_stderr, commit_code = run_git_command(
-                    ['git', 'rev-parse', old_tag_name], 
-                    cwd=config_dir
-                )
-                if commit_code == 0:
-                    commit_hash = commit_stdout.strip()
-                    
-                    # 给该提交添加新的build-guid标签
-                    tag_stdout, tag_stderr, tag_code = run_git_command(
-                        ['git', 'tag', tag_name, commit_hash],
-                        cwd=config_dir
-                    )
-                    if tag_code == 0:
-                        print(f"[Git] 已将build-guid标签 {tag_name} 添加到原有提交 {commit_hash[:8]}")
-                        is_version_updated = False
-                    else:
-                        print(f"[警告] 无法添加build-guid标签: {tag_stderr}")
-                else:
-                    print(f"[警告] 无法获取标签对应的提交: {commit_stderr}")
+        # 给该提交添加新的build-guid标签
+        tag_stdout, tag_stderr, tag_code = run_git_command(
+            ['git', 'tag', tag_name, commit_hash],
+            cwd=config_dir
+        )
+        if tag_code == 0:
+            print(f"[Git] 已将build-guid标签 {tag_name} 添加到原有提交 {commit_hash[:8]}")
+        else:
+            print(f"[警告] 无法添加build-guid标签: {tag_stderr}")
+            is_version_updated = True
     
     # 如果版本没有更新，直接丢弃未提交的更改
     if not is_version_updated:
@@ -599,81 +694,23 @@ def reset_to_game_version(config_dir, game_path):
             print(f"[Git] 找到上次游戏版本更新提交: {last_update_commit[:8]}")
             # 获取从上次更新到现在添加的文件列表
             stdout, stderr, code = run_git_command(
-                ['git', 'diff', '--name-only', '--diff-filter=A', last_update_commit], 
+                ['git', '-c', 'core.quotepath=false', 'diff', '--name-only', '--diff-filter=A', last_update_commit], 
                 cwd=config_dir, 
                 check=False
             )
             mod_added_files = stdout.strip().split('\n') if stdout.strip() else []
             print(f"[Git] 找到 {len(mod_added_files)} 个MOD添加的文件")
-        
-        # 创建临时目录用于存储当前游戏文件
-        temp_dir = os.path.join(os.path.dirname(config_dir), "temp_game_files")
-        if os.path.exists(temp_dir):
-            shutil.rmtree(temp_dir)
-        os.makedirs(temp_dir)
-        
-        # 复制当前游戏配置文件到临时目录，但排除MOD添加的文件
-        for item in os.listdir(config_dir):
-            if item != '.git':  # 排除.git目录
-                src_path = os.path.join(config_dir, item)
-                rel_path = item
-                
-                # 检查是否是MOD添加的文件
-                if rel_path in mod_added_files:
-                    print(f"[Git] 排除MOD添加的文件: {rel_path}")
-                    continue
-                
-                # 如果是目录，需要递归检查
-                if os.path.isdir(src_path):
-                    for root, dirs, files in os.walk(src_path):
-                        for file in files:
-                            file_path = os.path.join(root, file)
-                            rel_file_path = os.path.relpath(file_path, config_dir).replace('\\', '/')
-                            if rel_file_path in mod_added_files:
-                                print(f"[Git] 排除MOD添加的文件: {rel_file_path}")
-                                # 不复制这个文件
-                                continue
-                    
-                    # 复制目录（不包含MOD添加的文件）
-                    dst_path = os.path.join(temp_dir, item)
-                    if not os.path.exists(dst_path):
-                        os.makedirs(dst_path)
-                    
-                    for root, dirs, files in os.walk(src_path):
-                        for dir_name in dirs:
-                            dir_path = os.path.join(root, dir_name)
-                            rel_dir_path = os.path.relpath(dir_path, src_path)
-                            dst_dir_path = os.path.join(dst_path, rel_dir_path)
-                            if not os.path.exists(dst_dir_path):
-                                os.makedirs(dst_dir_path)
-                        
-                        for file in files:
-                            file_path = os.path.join(root, file)
-                            rel_file_path = os.path.relpath(file_path, config_dir).replace('\\', '/')
-                            if rel_file_path not in mod_added_files:
-                                rel_path_in_dir = os.path.relpath(file_path, src_path)
-                                dst_file_path = os.path.join(dst_path, rel_path_in_dir)
-                                dst_dir = os.path.dirname(dst_file_path)
-                                if not os.path.exists(dst_dir):
-                                    os.makedirs(dst_dir)
-                                shutil.copy2(file_path, dst_file_path)
-                else:
-                    # 复制文件
-                    dst_path = os.path.join(temp_dir, item)
-                    shutil.copy2(src_path, dst_path)
     
     # 获取当前分支
-    current_branch_stdout, _, _ = run_git_command(['git', 'branch', '--show-current'], cwd=config_dir, check=False)
-    current_branch = current_branch_stdout.strip()
+    current_branch = ref_index.current_branch()
     
     # 获取所有分支
-    all_branches_stdout, _, _ = run_git_command(['git', 'branch'], cwd=config_dir, check=False)
-    all_branches = [b.strip().replace('* ', '') for b in all_branches_stdout.split('\n') if b.strip()]
+    all_branches = ref_index.branch_names()
     
     # 确定主分支
     main_branch = None
     for branch_name in ['master', 'main']:
-        if branch_name in all_branches:
+        if ref_index.has_branch(branch_name):
             main_branch = branch_name
             break
     
@@ -698,6 +735,11 @@ def reset_to_game_version(config_dir, game_path):
             return False
         main_branch = 'master'
     
+    # 游戏版本已更新：直接从工作目录构建新的版本提交，不移动任何文件
+    if is_version_updated:
+        if not commit_game_version(config_dir, main_branch, mod_added_files, tag_name):
+            return False
+    
     # 切换到主分支
     if current_branch != main_branch:
         print(f"[Git] 切换到主分支: {main_branch}")
@@ -709,46 +751,6 @@ def reset_to_game_version(config_dir, game_path):
     
     # 不再删除所有其他分支，保留所有MOD分支
     
-    # 如果游戏版本已更新，处理文件更新
-    if is_version_updated and 'temp_dir' in locals() and os.path.exists(temp_dir):
-        # 清空仓库中的所有文件（除了.git目录）
-        for item in os.listdir(config_dir):
-            if item != '.git':
-                item_path = os.path.join(config_dir, item)
-                if os.path.isdir(item_path):
-                    shutil.rmtree(item_path)
-                else:
-                    os.remove(item_path)
-        
-        # 将临时目录中的文件复制回仓库
-        for item in os.listdir(temp_dir):
-            src_path = os.path.join(temp_dir, item)
-            dst_path = os.path.join(config_dir, item)
-            if os.path.isdir(src_path):
-                shutil.copytree(src_path, dst_path)
-            else:
-                shutil.copy2(src_path, dst_path)
-        
-        # 删除临时目录
-        shutil.rmtree(temp_dir)
-        
-        # 添加所有文件并提交（包括删除的文件）
-        run_git_command(['git', 'add', '--all'], cwd=config_dir)
-        stdout, stderr, code = run_git_command(
-            ['git', 'commit', '-m', f'游戏版本更新 {datetime.now().strftime("%Y-%m-%d %H:%M:%S")}'],
-            cwd=config_dir,
-            check=False
-        )
-        
-        if code != 0 and "nothing to commit" not in stderr:
-            print(f"[警告] 提交游戏版本更新时出现问题: {stderr}")
-        
-        # 创建标签
-        stdout, stderr, code = run_git_command(['git', 'tag', tag_name], cwd=config_dir)
-        if code != 0:
-            print(f"[错误] 无法创建标签: {stderr}")
-            return False
-    
     # 硬重置到标签
     stdout, stderr, code = run_git_command(['git', 'reset', '--hard', tag_name], cwd=config_dir)
     if code != 0:
@@ -768,13 +770,88 @@ def reset_to_game_version(config_dir, game_path):
     print(f"[Git] 已重置到游戏版本 {tag_name}")
     return True
 
-def prepare_git_environment(game_path):
-    """准备Git环境"""
+# 环境指纹文件，保存在.git目录中
+ENV_FINGERPRINT_FILE = "mod_env_fingerprint.json"
+
+def get_environment_fingerprint(config_dir, game_path):
+    """计算Git环境指纹：HEAD、游戏版本文件、索引和配置目录的状态，无法计算时返回None"""
+    git_dir = get_git_dir(config_dir)
+    if not os.path.isdir(git_dir):
+        return None
+    
+    stdout, stderr, code = run_git_command(['git', 'rev-parse', 'HEAD'], cwd=config_dir, check=False)
+    if code != 0:
+        return None
+    
+    # 目录的修改时间可以反映文件的增删
+    directories = {}
+    try:
+        for entry in os.scandir(config_dir):
+            if entry.is_dir() and entry.name != '.git':
+                directories[entry.name] = entry.stat().st_mtime_ns
+    except OSError:
+        return None
+    
+    return {
+        "head": stdout.strip(),
+        "branch": get_ref_index(config_dir).current_branch(),
+        "boot_config": _stat_signature(os.path.join(game_path, "Sultan's Game_Data", "boot.config")),
+        "game_exe": _stat_signature(os.path.join(game_path, "Sultan's Game.exe")),
+        "index": _stat_signature(os.path.join(git_dir, "index")),
+        "config_dir": _stat_signature(config_dir),
+        "directories": directories,
+    }
+
+def is_worktree_clean(config_dir):
+    """工作目录中没有修改过的已跟踪文件，也没有未跟踪的文件（包括忽略的文件）"""
+    stdout, stderr, code = run_git_command(['git', 'diff-files', '--quiet'], cwd=config_dir, check=False)
+    if code != 0:
+        return False
+    # reset之后会执行clean -fdx，这里同样把忽略的文件算作未跟踪
+    stdout, stderr, code = run_git_command(['git', 'ls-files', '-o', '--directory'], cwd=config_dir, check=False)
+    return code == 0 and not stdout.strip()
+
+def is_environment_unchanged(config_dir, game_path):
+    """判断上次准备完成后Git环境是否没有任何变化
+
+    指纹只反映HEAD、索引和目录的状态，跳过重置前还要确认工作目录是干净的。
+    """
+    fingerprint_file = os.path.join(get_git_dir(config_dir), ENV_FINGERPRINT_FILE)
+    try:
+        with open(fingerprint_file, 'r', encoding='utf-8') as f:
+            saved = json.load(f)
+    except (OSError, ValueError):
+        return False
+    return saved == get_environment_fingerprint(config_dir, game_path) and is_worktree_clean(config_dir)
+
+def save_environment_fingerprint(config_dir, game_path):
+    """记录准备完成后的环境指纹"""
+    fingerprint = get_environment_fingerprint(config_dir, game_path)
+    if fingerprint is None:
+        return
+    fingerprint_file = os.path.join(get_git_dir(config_dir), ENV_FINGERPRINT_FILE)
+    try:
+        with open(fingerprint_file, 'w', encoding='utf-8') as f:
+            json.dump(fingerprint, f)
+    except OSError:
+        pass
+
+@timed_phase("prepare_env")
+def prepare_git_environment(game_path, force=False):
+    """准备Git环境
+
+    force为True时总是重置和清理，用于还原和重置游戏，不走环境未变化的快速路径。
+    """
     config_dir = get_config_dir(game_path)
     
     # 确保配置目录存在
     ensure_directory(config_dir)
     
+    # 上次准备之后没有任何变化时，无需再初始化、重置和清理
+    if not force and is_environment_unchanged(config_dir, game_path):
+        print("[Git] Git环境未发生变化，跳过重置")
+        return True
+    
     # 初始化Git仓库
     if not init_git_repo(config_dir):
         return False
@@ -783,6 +860,7 @@ def prepare_git_environment(game_path):
     if not reset_to_game_version(config_dir, game_path):
         return False
     
+    save_environment_fingerprint(config_dir, game_path)
     return True
 
 # 添加彩色输出支持
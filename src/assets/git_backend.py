@@ -0,0 +1,575 @@
+import os
+import atexit
+import threading
+import subprocess
+
+
+def get_popen_kwargs():
+    """获取启动Git子进程时使用的平台相关参数（Windows下隐藏控制台窗口）"""
+    if os.name != "nt":
+        return {}
+
+    startupinfo = subprocess.STARTUPINFO()
+    startupinfo.dwFlags |= subprocess.STARTF_USESHOWWINDOW
+    return {
+        "startupinfo": startupinfo,
+        "creationflags": subprocess.CREATE_NO_WINDOW
+    }
+
+
+class GitCatFile:
+    """常驻的 git cat-file --batch 进程，用于在不启动新进程的情况下解析引用和读取对象"""
+
+    def __init__(self, repo_dir):
+        self.repo_dir = repo_dir
+        self.lock = threading.Lock()
+        self.process = None
+        self.closed = False  # 已从池中释放，不再启动新进程
+
+    def _start(self):
+        self.process = subprocess.Popen(
+            ['git', 'cat-file', '--batch'],
+            cwd=self.repo_dir,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            **get_popen_kwargs()
+        )
+
+    def _request(self, rev):
+        """发送一个请求，返回 (oid, type, 内容bytes)，对象不存在时返回None"""
+        if '\n' in rev or not rev.strip():
+            return None
+
+        with self.lock:
+            if not self.closed:
+                return self._request_locked(rev)
+        # 其他线程已释放本实例，交给池中当前的实例处理
+        return get_cat_file(self.repo_dir)._request(rev)
+
+    def _request_locked(self, rev):
+        """在持有锁时与常驻进程通信"""
+        for _ in range(2):
+            try:
+                if self.process is None or self.process.poll() is not None:
+                    self._start()
+                self.process.stdin.write(rev.encode('utf-8') + b'\n')
+                self.process.stdin.flush()
+                header = self.process.stdout.readline()
+                if not header:
+                    raise BrokenPipeError("cat-file进程已退出")
+                parts = header.decode('utf-8', errors='replace').split()
+                # 对象不存在或有歧义: "<rev> missing" / "<rev> ambiguous"
+                if len(parts) != 3:
+                    return None
+                oid, obj_type, size = parts[0], parts[1], int(parts[2])
+                content = self.process.stdout.read(size)
+                self.process.stdout.read(1)  # 每个对象后跟一个换行符
+                return oid, obj_type, content
+            except (OSError, ValueError):
+                # 进程异常退出，重启后重试一次
+                self._stop()
+        return None
+
+    def resolve(self, rev):
+        """将引用或对象名解析为完整的对象ID，不存在时返回None"""
+        result = self._request(rev)
+        return result[0] if result else None
+
+    def info(self, rev):
+        """返回 (oid, type, size)，不存在时返回None"""
+        result = self._request(rev)
+        if not result:
+            return None
+        return result[0], result[1], len(result[2])
+
+    def read(self, rev):
+        """读取对象内容，返回 (oid, type, 内容bytes)，不存在时返回None"""
+        return self._request(rev)
+
+    def close(self):
+        """关闭常驻进程，之后的请求转交给池中的新实例"""
+        with self.lock:
+            self.closed = True
+            self._stop()
+
+    def _stop(self):
+        if self.process is None:
+            return
+        try:
+            self.process.stdin.close()
+        except OSError:
+            pass
+        try:
+            self.process.wait(timeout=2)
+        except Exception:
+            self.process.kill()
+        self.process = None
+
+
+# 每个仓库一个常驻进程
+_cat_file_pool = {}
+_pool_lock = threading.Lock()
+
+
+def get_cat_file(repo_dir):
+    """获取指定仓库的常驻 cat-file 进程"""
+    key = os.path.normcase(os.path.abspath(repo_dir))
+    with _pool_lock:
+        helper = _cat_file_pool.get(key)
+        if helper is None:
+            helper = GitCatFile(repo_dir)
+            _cat_file_pool[key] = helper
+        return helper
+
+
+def release_cat_file(repo_dir):
+    """关闭指定仓库的常驻进程（下次读取时自动重启）"""
+    key = os.path.normcase(os.path.abspath(repo_dir))
+    with _pool_lock:
+        helper = _cat_file_pool.pop(key, None)
+    if helper:
+        helper.close()
+
+
+def close_all():
+    """关闭所有常驻Git进程"""
+    with _pool_lock:
+        for helper in _cat_file_pool.values():
+            helper.close()
+        _cat_file_pool.clear()
+
+
+atexit.register(close_all)
+
+
+def get_git_dir(repo_dir):
+    """获取仓库的.git目录路径"""
+    git_dir = os.path.join(repo_dir, '.git')
+    if os.path.isfile(git_dir):
+        # 工作树或子模块中.git是一个指向真实目录的文件
+        try:
+            with open(git_dir, 'r', encoding='utf-8') as f:
+                content = f.read().strip()
+            if content.startswith('gitdir:'):
+                path = content[len('gitdir:'):].strip()
+                return path if os.path.isabs(path) else os.path.join(repo_dir, path)
+        except OSError:
+            pass
+    return git_dir
+
+
+def get_commit_subject(repo_dir, rev):
+    """读取提交的标题（与 git log --format=%s 一致），读取失败时返回None"""
+    result = get_cat_file(repo_dir).read(rev + "^{commit}")
+    if not result:
+        return None
+    text = result[2].decode('utf-8', errors='replace')
+    message = text.split('\n\n', 1)[1] if '\n\n' in text else ""
+    return ' '.join(message.strip().split('\n\n', 1)[0].split('\n')).strip()
+
+
+class RefIndex:
+    """仓库分支和标签的内存索引
+
+    通过一次 `git for-each-ref` 构建，之后按名称和前缀查询都不再启动git进程。
+    本工具通过 run_git_command 创建或删除引用时会增量更新；
+    外部修改（例如用户手动执行git）通过 refs 目录和 packed-refs 的状态变化检测后重建。
+    """
+
+    # 需要按前缀快速列出的分支和标签
+    BRANCH_PREFIXES = ('mod_', 'failed_mod_', 'history_', 'backup_')
+    TAG_PREFIXES = ('game_version_', 'mod_')
+
+    def __init__(self, repo_dir):
+        self.repo_dir = repo_dir
+        self.git_dir = get_git_dir(repo_dir)
+        self.lock = threading.RLock()
+        self.branches = set()
+        self.tags = set()
+        self.branch_groups = {}
+        self.tag_groups = {}
+        self.mod_version_tags = {}  # mod_<name> -> {mod_<name>_v<version>, ...}
+        self.signature = None
+        self.refresh()
+
+    def _stat_signature(self):
+        """引用存储的状态签名，用于发现外部修改"""
+        signature = []
+        for rel in ('packed-refs', os.path.join('refs', 'heads'), os.path.join('refs', 'tags')):
+            try:
+                st = os.stat(os.path.join(self.git_dir, rel))
+                signature.append((st.st_mtime_ns, st.st_size))
+            except OSError:
+                signature.append(None)
+        return tuple(signature)
+
+    def refresh(self):
+        """重新读取所有引用"""
+        with self.lock:
+            signature = self._stat_signature()
+            process = subprocess.run(
+                ['git', 'for-each-ref', '--format=%(refname)', 'refs/heads', 'refs/tags'],
+                cwd=self.repo_dir,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.DEVNULL,
+                **get_popen_kwargs()
+            )
+            self.branches = set()
+            self.tags = set()
+            self.branch_groups = {prefix: set() for prefix in self.BRANCH_PREFIXES}
+            self.tag_groups = {prefix: set() for prefix in self.TAG_PREFIXES}
+            self.mod_version_tags = {}
+
+            for line in process.stdout.decode('utf-8', errors='replace').splitlines():
+                if line.startswith('refs/heads/'):
+                    self._add_branch(line[len('refs/heads/'):])
+                elif line.startswith('refs/tags/'):
+                    self._add_tag(line[len('refs/tags/'):])
+            self.signature = signature
+
+    def validate(self):
+        """如果引用被外部修改则重建索引"""
+        with self.lock:
+            if self._stat_signature() != self.signature:
+                self.refresh()
+
+    def _prefix_of(self, name, prefixes):
+        for prefix in prefixes:
+            if name.startswith(prefix):
+                return prefix
+        return None
+
+    def _add_branch(self, name):
+        self.branches.add(name)
+        prefix = self._prefix_of(name, self.BRANCH_PREFIXES)
+        if prefix:
+            self.branch_groups[prefix].add(name)
+
+    def _remove_branch(self, name):
+        self.branches.discard(name)
+        prefix = self._prefix_of(name, self.BRANCH_PREFIXES)
+        if prefix:
+            self.branch_groups[prefix].discard(name)
+
+    def _add_tag(self, name):
+        self.tags.add(name)
+        prefix = self._prefix_of(name, self.TAG_PREFIXES)
+        if prefix:
+            self.tag_groups[prefix].add(name)
+        if name.startswith('mod_') and '_v' in name:
+            self.mod_version_tags.setdefault(name.rsplit('_v', 1)[0], set()).add(name)
+
+    def _remove_tag(self, name):
+        self.tags.discard(name)
+        prefix = self._prefix_of(name, self.TAG_PREFIXES)
+        if prefix:
+            self.tag_groups[prefix].discard(name)
+        if name.startswith('mod_') and '_v' in name:
+            self.mod_version_tags.get(name.rsplit('_v', 1)[0], set()).discard(name)
+
+    def invalidate(self):
+        """无法判断命令对引用的影响时调用，下次使用前重建索引"""
+        with self.lock:
+            self.signature = None
+
+    def _touch(self):
+        # 自己的修改已同步到索引，更新签名避免重复重建
+        self.signature = self._stat_signature()
+
+    def add_branch(self, name):
+        with self.lock:
+            self._add_branch(name)
+            self._touch()
+
+    def remove_branch(self, name):
+        with self.lock:
+            self._remove_branch(name)
+            self._touch()
+
+    def add_tag(self, name):
+        with self.lock:
+            self._add_tag(name)
+            self._touch()
+
+    def remove_tag(self, name):
+        with self.lock:
+            self._remove_tag(name)
+            self._touch()
+
+    # 查询都在锁内进行并返回副本，其他线程（例如并行生成补丁）可能同时修改索引
+    def has_branch(self, name):
+        with self.lock:
+            return name in self.branches
+
+    def has_tag(self, name):
+        with self.lock:
+            return name in self.tags
+
+    def branch_names(self):
+        """所有分支名（按名称排序，与 git branch 的输出顺序一致）"""
+        with self.lock:
+            return sorted(self.branches)
+
+    def branches_with_prefix(self, prefix):
+        """列出指定前缀的分支，前缀必须是 BRANCH_PREFIXES 之一"""
+        with self.lock:
+            return sorted(self.branch_groups[prefix])
+
+    def tags_with_prefix(self, prefix):
+        """列出指定前缀的标签，前缀必须是 TAG_PREFIXES 之一"""
+        with self.lock:
+            return sorted(self.tag_groups[prefix])
+
+    def versions_of_mod(self, branch_name):
+        """列出MOD分支对应的版本标签（mod_<name>_v*）"""
+        with self.lock:
+            return sorted(self.mod_version_tags.get(branch_name, ()))
+
+    def current_branch(self):
+        """读取当前分支名，分离头指针时返回空字符串"""
+        try:
+            with open(os.path.join(self.git_dir, 'HEAD'), 'r', encoding='utf-8') as f:
+                head = f.read().strip()
+        except OSError:
+            return ""
+        if head.startswith('ref: refs/heads/'):
+            return head[len('ref: refs/heads/'):]
+        return ""
+
+
+_ref_indexes = {}
+
+
+def get_ref_index(repo_dir):
+    """获取仓库的引用索引（首次调用时构建，之后自动校验）"""
+    key = os.path.normcase(os.path.abspath(repo_dir))
+    with _pool_lock:
+        index = _ref_indexes.get(key)
+    if index is None:
+        index = RefIndex(repo_dir)
+        with _pool_lock:
+            _ref_indexes[key] = index
+    else:
+        index.validate()
+    return index
+
+
+def _track_ref_changes(cmd, index):
+    """根据成功执行的Git命令增量更新引用索引"""
+    args = cmd[2:]
+    positional = [a for a in args if not a.startswith('-')]
+    if cmd[1] == 'branch':
+        if '-D' in args or '-d' in args or '--delete' in args:
+            for name in positional:
+                index.remove_branch(name)
+        elif positional and not any(a.startswith('-') for a in args):
+            index.add_branch(positional[0])
+        else:
+            index.validate()
+    elif cmd[1] in ('checkout', 'switch'):
+        for flag in ('-b', '-B', '-c', '-C'):
+            if flag in args and args.index(flag) + 1 < len(args):
+                index.add_branch(args[args.index(flag) + 1])
+                return
+        index.validate()
+    elif cmd[1] == 'tag':
+        _track_tag_changes(args, index)
+    elif cmd[1] == 'update-ref':
+        refs = [a for a in positional if a.startswith('refs/')]
+        if not refs:
+            return
+        ref = refs[0]
+        deleting = '-d' in args
+        if ref.startswith('refs/heads/'):
+            (index.remove_branch if deleting else index.add_branch)(ref[len('refs/heads/'):])
+        elif ref.startswith('refs/tags/'):
+            (index.remove_tag if deleting else index.add_tag)(ref[len('refs/tags/'):])
+    else:
+        index.validate()
+
+
+# git tag 中带一个参数值的选项
+TAG_VALUE_OPTIONS = {'-m', '-F', '-u', '--message', '--file', '--local-user', '--cleanup'}
+# 创建标签时可以出现的选项
+TAG_CREATE_FLAGS = {'-f', '--force', '-a', '--annotate', '-s', '--sign'}
+TAG_DELETE_FLAGS = {'-d', '--delete'}
+# 只列出标签的选项
+TAG_LIST_FLAGS = {'-l', '--list', '-n', '--contains', '--no-contains', '--points-at', '--merged', '--no-merged'}
+
+
+def _track_tag_changes(args, index):
+    """根据 git tag 的参数更新引用索引，无法识别的用法使索引失效"""
+    flags = set()
+    names = []
+    i = 0
+    while i < len(args):
+        arg = args[i]
+        if arg in TAG_VALUE_OPTIONS:
+            # -m <说明> 等选项的值不是标签名
+            flags.add(arg)
+            i += 2
+            continue
+        if arg.startswith('-'):
+            flags.add(arg.split('=', 1)[0])
+        else:
+            names.append(arg)
+        i += 1
+
+    if flags & TAG_LIST_FLAGS or not (names or flags):
+        return
+    if flags & TAG_DELETE_FLAGS:
+        for name in names:
+            index.remove_tag(name)
+    elif names and flags <= TAG_CREATE_FLAGS | TAG_VALUE_OPTIONS:
+        # git tag [-f] [-a] [-m <说明>] <标签名> [<提交>]
+        index.add_tag(names[0])
+    else:
+        index.invalidate()
+
+
+# 不会修改引用的命令，执行后无需同步引用索引（与是否经过常驻进程无关）
+READ_ONLY_COMMANDS = {
+    'status', 'log', 'diff', 'show', 'rev-parse', 'cat-file', 'ls-files',
+    'ls-tree', 'for-each-ref', 'format-patch', 'config', 'hash-object', 'apply'
+}
+
+
+def after_git_command(cmd, cwd, returncode):
+    """Git命令执行成功后同步引用索引"""
+    if cwd is None or returncode != 0 or len(cmd) < 2 or cmd[1] in READ_ONLY_COMMANDS:
+        return
+    key = os.path.normcase(os.path.abspath(cwd))
+    with _pool_lock:
+        index = _ref_indexes.get(key)
+    if index is None:
+        return
+    if cmd[1] == 'init':
+        with _pool_lock:
+            _ref_indexes.pop(key, None)
+        return
+    _track_ref_changes(cmd, index)
+
+
+# 这些命令结束时可能触发 `git gc --auto`，Windows下常驻进程打开的pack文件会导致清理失败
+GC_TRIGGERING_COMMANDS = {'am', 'commit', 'merge', 'gc', 'repack', 'prune'}
+
+
+def before_git_command(cmd, cwd):
+    """执行普通Git命令前的准备工作"""
+    if cwd is not None and len(cmd) > 1 and cmd[1] in GC_TRIGGERING_COMMANDS:
+        release_cat_file(cwd)
+
+
+def _parse_tree(content, oid_size):
+    """解析tree对象的原始内容，返回 {名称: (模式, 对象ID)}"""
+    entries = {}
+    pos = 0
+    while pos < len(content):
+        space = content.index(b' ', pos)
+        nul = content.index(b'\0', space)
+        name = content[space + 1:nul].decode('utf-8', errors='replace')
+        entries[name] = (content[pos:space].decode('ascii'), content[nul + 1:nul + 1 + oid_size].hex())
+        pos = nul + 1 + oid_size
+    return entries
+
+
+def list_tree_blobs(repo_dir, rev, paths):
+    """通过常驻进程逐级读取tree对象，返回指定文件的 {路径: (模式, 对象ID)}
+
+    不存在的路径不出现在结果中。路径指向目录、子模块或带通配符时返回None，由调用方交给git处理。
+    """
+    cat_file = get_cat_file(repo_dir)
+    root = cat_file.read(rev + "^{tree}")
+    if not root:
+        return None
+    oid_size = len(root[0]) // 2
+    trees = {root[0]: _parse_tree(root[2], oid_size)}
+    result = {}
+    for path in paths:
+        if not path or any(c in path for c in '*?[\\') or path.startswith('/') or path.endswith('/'):
+            return None
+        entries = trees[root[0]]
+        parts = path.split('/')
+        for i, name in enumerate(parts):
+            entry = entries.get(name)
+            if entry is None:
+                break
+            mode, oid = entry
+            if i == len(parts) - 1:
+                if not mode.startswith('100') and mode != '120000':
+                    return None
+                result[path] = (mode, oid)
+                break
+            if mode != '40000':
+                break
+            if oid not in trees:
+                tree = cat_file.read(oid)
+                if not tree or tree[1] != 'tree':
+                    return None
+                trees[oid] = _parse_tree(tree[2], oid_size)
+            entries = trees[oid]
+    return result
+
+
+def try_fast_git_command(cmd, cwd):
+    """尝试通过常驻进程完成只读Git命令
+
+    支持 `git rev-parse <rev>`、`git cat-file -t/-s/-e/-p <rev>`、`git show <rev>:<路径>`，
+    以及指定文件的 `git ls-tree -r -z <rev> -- <路径>...`。
+    返回 (stdout, stderr, returncode)；无法处理或未命中时返回None，由调用方走普通子进程，
+    这样失败时的错误信息与原来保持一致。
+    """
+    if cwd is None or len(cmd) < 3 or cmd[0] != 'git':
+        return None
+
+    if len(cmd) == 3 and cmd[1] == 'rev-parse':
+        rev = cmd[2]
+        if rev.startswith('-'):
+            return None
+        oid = get_cat_file(cwd).resolve(rev)
+        if oid is None:
+            return None
+        return oid + "\n", "", 0
+
+    if len(cmd) == 4 and cmd[1] == 'cat-file' and cmd[2] in ('-t', '-s', '-e', '-p'):
+        result = get_cat_file(cwd).read(cmd[3])
+        if result is None:
+            return None
+        oid, obj_type, content = result
+        if cmd[2] == '-t':
+            return obj_type + "\n", "", 0
+        if cmd[2] == '-s':
+            return f"{len(content)}\n", "", 0
+        if cmd[2] == '-e':
+            return "", "", 0
+        # tree对象的 -p 输出是格式化后的列表，交给git处理
+        if obj_type == 'tree':
+            return None
+        return _blob_text(content), "", 0
+
+    # 路径相对于工作目录，只在仓库根目录下处理
+    if not os.path.exists(os.path.join(cwd, '.git')):
+        return None
+
+    if len(cmd) == 3 and cmd[1] == 'show' and ':' in cmd[2] and not cmd[2].startswith('-'):
+        result = get_cat_file(cwd).read(cmd[2])
+        if result is None or result[1] != 'blob':
+            return None
+        return _blob_text(result[2]), "", 0
+
+    if len(cmd) > 6 and cmd[1:4] == ['ls-tree', '-r', '-z'] and cmd[5] == '--' and not cmd[4].startswith('-'):
+        entries = list_tree_blobs(cwd, cmd[4], cmd[6:])
+        if entries is None:
+            return None
+        # 文件的完整路径按字节排序与git的tree顺序一致
+        paths = sorted(entries, key=lambda path: path.encode('utf-8'))
+        return ''.join(f"{entries[path][0]} blob {entries[path][1]}\t{path}\0" for path in paths), "", 0
+
+    return None
+
+
+def _blob_text(content):
+    # 与文本模式的子进程输出保持一致（统一换行符）
+    text = content.decode('utf-8', errors='replace')
+    return text.replace('\r\n', '\n').replace('\r', '\n')
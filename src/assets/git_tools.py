@@ -8,7 +8,7 @@ from pathlib import Path
 # 导入公共工具
 from common_utils import (
     get_application_path, get_game_path, get_config_dir, 
-    run_git_command, prepare_git_environment, 
+    run_git_command, prepare_git_environment, get_ref_index, get_commit_subject,
     Colors, colored_print, print_header, show_confirm_dialog
 )
 
@@ -66,14 +66,7 @@ def get_conflict_dir(game_path):
 def switch_to_branch(config_dir, branch_name):
     """切换到指定分支"""
     # 检查分支是否存在
-    stdout, stderr, code = run_git_command(['git', 'branch'], cwd=config_dir)
-    if code != 0:
-        colored_print(f"[错误] 无法获取分支列表: {stderr}", Colors.RED)
-        return False
-    
-    existing_branches = [b.strip().replace('* ', '') for b in stdout.strip().split('\n') if b.strip()]
-    
-    if branch_name not in existing_branches:
+    if not get_ref_index(config_dir).has_branch(branch_name):
         colored_print(f"[错误] 分支 {branch_name} 不存在", Colors.RED)
         return False
     
@@ -92,34 +85,25 @@ def switch_to_branch(config_dir, branch_name):
 
 def list_history_branches(config_dir):
     """列出所有历史版本分支"""
-    stdout, stderr, code = run_git_command(['git', 'branch'], cwd=config_dir)
-    if code != 0:
-        colored_print(f"[错误] 无法获取分支列表: {stderr}", Colors.RED)
-        return []
-    
-    all_branches = stdout.strip().split('\n')
     history_branches = []
     
-    for branch in all_branches:
-        branch = branch.strip().replace('* ', '')
-        if branch.startswith('history_'):
-            # 获取分支的提交信息
-            stdout, stderr, code = run_git_command(['git', 'log', '-1', '--pretty=format:%s', branch], cwd=config_dir)
-            commit_msg = stdout.strip() if code == 0 else "未知"
-            
-            # 从分支名中提取日期
-            date_str = branch.replace('history_', '')
-            try:
-                date_obj = datetime.strptime(date_str, "%Y%m%d_%H%M%S")
-                formatted_date = date_obj.strftime("%Y-%m-%d %H:%M:%S")
-            except:
-                formatted_date = date_str
-            
-            history_branches.append({
-                'name': branch,
-                'date': formatted_date,
-                'message': commit_msg
-            })
+    for branch in get_ref_index(config_dir).branches_with_prefix('history_'):
+        # 获取分支的提交信息
+        commit_msg = get_commit_subject(config_dir, branch) or "未知"
+        
+        # 从分支名中提取日期
+        date_str = branch.replace('history_', '')
+        try:
+            date_obj = datetime.strptime(date_str, "%Y%m%d_%H%M%S")
+            formatted_date = date_obj.strftime("%Y-%m-%d %H:%M:%S")
+        except:
+            formatted_date = date_str
+        
+        history_branches.append({
+            'name': branch,
+            'date': formatted_date,
+            'message': commit_msg
+        })
     
     # 按日期排序，最新的在前
     history_branches.sort(key=lambda x: x['name'], reverse=True)
@@ -127,29 +111,20 @@ def list_history_branches(config_dir):
 
 def list_failed_mod_branches(config_dir):
     """列出所有失败MOD分支"""
-    stdout, stderr, code = run_git_command(['git', 'branch'], cwd=config_dir)
-    if code != 0:
-        colored_print(f"[错误] 无法获取分支列表: {stderr}", Colors.RED)
-        return []
-    
-    all_branches = stdout.strip().split('\n')
     failed_branches = []
     
-    for branch in all_branches:
-        branch = branch.strip().replace('* ', '')
-        if branch.startswith('failed_mod_'):
-            # 获取分支的提交信息
-            stdout, stderr, code = run_git_command(['git', 'log', '-1', '--pretty=format:%s', branch], cwd=config_dir)
-            commit_msg = stdout.strip() if code == 0 else "未知"
-            
-            # 从分支名中提取MOD名称
-            mod_name = branch.replace('failed_mod_', '')
-            
-            failed_branches.append({
-                'name': branch,
-                'mod_name': mod_name,
-                'message': commit_msg
-            })
+    for branch in get_ref_index(config_dir).branches_with_prefix('failed_mod_'):
+        # 获取分支的提交信息
+        commit_msg = get_commit_subject(config_dir, branch) or "未知"
+        
+        # 从分支名中提取MOD名称
+        mod_name = branch.replace('failed_mod_', '')
+        
+        failed_branches.append({
+            'name': branch,
+            'mod_name': mod_name,
+            'message': commit_msg
+        })
     
     # 按MOD名称排序
     failed_branches.sort(key=lambda x: x['mod_name'])
@@ -157,23 +132,13 @@ def list_failed_mod_branches(config_dir):
 
 def try_merge_failed_mod(config_dir, failed_branch):
     """尝试合并失败的MOD分支"""
-    # 获取当前分支
-    stdout, stderr, code = run_git_command(['git', 'branch', '--show-current'], cwd=config_dir)
-    if code != 0:
-        colored_print(f"[错误] 无法获取当前分支: {stderr}", Colors.RED)
-        return False
+    ref_index = get_ref_index(config_dir)
     
-    current_branch = stdout.strip()
+    # 获取当前分支
+    current_branch = ref_index.current_branch()
     
     # 检查失败分支是否存在
-    stdout, stderr, code = run_git_command(['git', 'branch'], cwd=config_dir)
-    if code != 0:
-        colored_print(f"[错误] 无法获取分支列表: {stderr}", Colors.RED)
-        return False
-    
-    existing_branches = [b.strip().replace('* ', '') for b in stdout.strip().split('\n') if b.strip()]
-    
-    if failed_branch not in existing_branches:
+    if not ref_index.has_branch(failed_branch):
         colored_print(f"[错误] 分支 {failed_branch} 不存在", Colors.RED)
         return False
     
@@ -640,7 +605,7 @@ def main():
             # 重置游戏到纯净状态
             colored_print("[警告] 此操作将重置游戏到纯净状态，所有MOD更改将丢失", Colors.YELLOW)
             if show_confirm_dialog("重置游戏", "确定要继续吗？"):
-                if prepare_git_environment(game_path):
+                if prepare_git_environment(game_path, force=True):
                     colored_print("[成功] 已重置游戏到纯净状态", Colors.GREEN)
                 else:
                     colored_print("[错误] 重置游戏失败", Colors.RED)
@@ -631,7 +631,7 @@ class GitToolsGUI:
             
             colored_print("[重置] 正在重置游戏到纯净状态...", Colors.BLUE)
             # 直接调用函数准备Git环境，这会重置游戏到纯净状态
-            prepare_git_environment(self.game_path)
+            prepare_git_environment(self.game_path, force=True)
             
             colored_print("[成功] 游戏已重置到纯净状态", Colors.GREEN)
             self.root.after(0, lambda: self.status_var.set("游戏已重置到纯净状态"))
@@ -0,0 +1,495 @@
+import os
+import json
+import shutil
+import hashlib
+import tempfile
+
+# 导入公共工具
+from common_utils import run_git_command
+from git_backend import get_git_dir, get_cat_file
+
+# 导入JSON结构化合并
+from json_merge import merge_json_text, apply_ops_text
+
+# 安装缓存最多保留的条目数
+INSTALL_CACHE_LIMIT = 2000
+
+# update-index --index-info 中表示删除的对象ID
+NULL_OID = "0" * 40
+
+# 提交信息中记录安装步骤键的尾注
+STEP_TRAILER = "Mod-Step: "
+
+# MOD提交信息的前缀，以及提交信息中跟在MOD名称后面的字段
+MOD_COMMIT_PREFIX = "应用MOD:"
+MOD_COMMIT_FIELDS = (" 作者:", " 来源:", " 版本:")
+
+
+class TempIndex:
+    """基于 GIT_INDEX_FILE 的临时索引，在不改动工作目录的情况下构建提交"""
+
+    def __init__(self, config_dir, name):
+        self.config_dir = config_dir
+        self.path = os.path.join(get_git_dir(config_dir), f"mod_installer_{name}_{os.getpid()}.index")
+        self.env = dict(os.environ, GIT_INDEX_FILE=self.path)
+
+    def run(self, cmd, check=False):
+        return run_git_command(cmd, cwd=self.config_dir, check=check, env=self.env)
+
+    def read_tree(self, rev):
+        """用指定提交的树初始化索引"""
+        stdout, stderr, code = self.run(['git', 'read-tree', rev])
+        return code == 0
+
+    def apply(self, patch_file):
+        """将补丁应用到索引，返回 (是否成功, 错误信息)"""
+        stdout, stderr, code = self.run(['git', 'apply', '--cached', '--ignore-whitespace', patch_file])
+        return code == 0, stderr
+
+    def list_entries(self, paths):
+        """读取索引中指定文件的 {路径: (模式, 对象ID)}"""
+        stdout, stderr, code = self.run(['git', 'ls-files', '-s', '-z', '--'] + list(paths))
+        return parse_index_entries(stdout) if code == 0 else {}
+
+    def update_entries(self, entries):
+        """批量写入索引项，entries为 [(模式, 对象ID, 路径), ...]"""
+        if not entries:
+            return True
+        index_info = ''.join(f"{mode} {oid}\t{path}\0" for mode, oid, path in entries)
+        stdout, stderr, code = run_git_command(
+            ['git', 'update-index', '-z', '--index-info'],
+            cwd=self.config_dir, check=False, env=self.env, input=index_info
+        )
+        return code == 0
+
+    def write_tree(self):
+        """将索引写为树对象，返回树ID"""
+        stdout, stderr, code = self.run(['git', 'write-tree'])
+        return stdout.strip() if code == 0 else None
+
+    def checkout_to(self, target_dir, paths):
+        """将索引中的指定文件导出到目录（不存在的文件会被忽略）"""
+        prefix = target_dir.replace('\\', '/').rstrip('/') + '/'
+        self.run(['git', 'checkout-index', '-f', '-q', f'--prefix={prefix}', '--'] + list(paths))
+
+    def close(self):
+        """删除临时索引文件"""
+        for path in (self.path, self.path + '.lock'):
+            if os.path.exists(path):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+def parse_index_entries(output):
+    """解析 ls-files -s -z / ls-tree -z 的输出为 {路径: (模式, 对象ID)}"""
+    entries = {}
+    for record in output.split('\0'):
+        if '\t' not in record:
+            continue
+        info, path = record.split('\t', 1)
+        fields = info.split()
+        # ls-files: 模式 对象ID 阶段；ls-tree: 模式 类型 对象ID
+        oid = fields[2] if fields[1] in ('blob', 'tree', 'commit') else fields[1]
+        entries[path] = (fields[0], oid)
+    return entries
+
+
+def list_tree_entries(config_dir, rev, paths):
+    """读取提交中指定文件的 {路径: (模式, 对象ID)}"""
+    stdout, stderr, code = run_git_command(
+        ['git', 'ls-tree', '-r', '-z', rev, '--'] + list(paths),
+        cwd=config_dir, check=False
+    )
+    return parse_index_entries(stdout) if code == 0 else {}
+
+
+def extract_mod_name(subject):
+    """从提交标题中取出MOD名称，不是MOD提交时返回None
+
+    git log 的 %s 会把第一段的多行合并成一行，例如 "应用MOD: 名称 作者: xx 版本: 1.0"
+    """
+    if not subject.startswith(MOD_COMMIT_PREFIX):
+        return None
+    name = subject[len(MOD_COMMIT_PREFIX):]
+    for field in MOD_COMMIT_FIELDS:
+        pos = name.find(field)
+        if pos != -1:
+            name = name[:pos]
+    return name.strip()
+
+
+def build_file_mod_index(config_dir, rev):
+    """一次遍历历史，建立 {文件路径: [修改过它的MOD名称, ...]}（最近的在前）"""
+    stdout, stderr, code = run_git_command(
+        ['git', '-c', 'core.quotepath=false', 'log', '--name-only', '--format=%x01%s', rev],
+        cwd=config_dir, check=False
+    )
+    file_mods = {}
+    if code != 0:
+        return file_mods
+    for entry in stdout.split('\x01')[1:]:
+        lines = entry.split('\n')
+        mod_name = extract_mod_name(lines[0])
+        if not mod_name:
+            continue
+        record_mod_paths(file_mods, mod_name, [path for path in lines[1:] if path], newest=False)
+    return file_mods
+
+
+def record_mod_paths(file_mods, mod_name, paths, newest=True):
+    """记录MOD修改过的文件，newest为True时放在最前面"""
+    for path in paths:
+        mods = file_mods.setdefault(path, [])
+        if mod_name in mods:
+            continue
+        if newest:
+            mods.insert(0, mod_name)
+        else:
+            mods.append(mod_name)
+
+
+def hash_files(config_dir, file_paths, write=True):
+    """计算文件的对象ID（与git add相同的换行转换），write为True时同时写入对象库
+
+    返回与file_paths对应的对象ID列表，失败时返回None
+    """
+    if not file_paths:
+        return []
+    stdout, stderr, code = run_git_command(
+        ['git', 'hash-object'] + (['-w'] if write else []) + ['--stdin-paths'],
+        cwd=config_dir, check=False, input=''.join(path + '\n' for path in file_paths)
+    )
+    oids = stdout.split()
+    return oids if code == 0 and len(oids) == len(file_paths) else None
+
+
+def commit_tree(config_dir, tree, parents, message):
+    """用树对象创建提交，返回提交ID"""
+    cmd = ['git', 'commit-tree', tree]
+    for parent in parents:
+        cmd += ['-p', parent]
+    cmd += ['-m', message]
+    stdout, stderr, code = run_git_command(cmd, cwd=config_dir, check=False)
+    return stdout.strip() if code == 0 else None
+
+
+def update_branch(config_dir, branch, commit):
+    """创建或移动分支到指定提交（不切换分支）"""
+    stdout, stderr, code = run_git_command(
+        ['git', 'update-ref', f'refs/heads/{branch}', commit],
+        cwd=config_dir, check=False
+    )
+    return code == 0
+
+
+def resolve_commit(config_dir, rev):
+    """解析提交ID，失败时返回None"""
+    stdout, stderr, code = run_git_command(['git', 'rev-parse', rev], cwd=config_dir, check=False)
+    return stdout.strip() if code == 0 else None
+
+
+def is_ancestor(config_dir, ancestor, descendant):
+    """判断 ancestor 是否是 descendant 的祖先提交"""
+    stdout, stderr, code = run_git_command(
+        ['git', 'merge-base', '--is-ancestor', ancestor, descendant],
+        cwd=config_dir, check=False
+    )
+    return code == 0
+
+
+def collect_rejects(temp_index, patch_file, paths):
+    """在临时目录中重放补丁以生成.rej文件，不触碰游戏配置目录
+
+    返回 (临时目录, [(相对路径, .rej文件路径), ...])，调用方负责删除临时目录。
+    """
+    scratch_dir = tempfile.mkdtemp(prefix="mod_reject_")
+    temp_index.checkout_to(scratch_dir, paths)
+
+    # 在仓库之外执行git apply，行为与普通的patch命令一致
+    run_git_command(
+        ['git', 'apply', '--reject', '--ignore-whitespace', os.path.abspath(patch_file)],
+        cwd=scratch_dir, check=False
+    )
+
+    return scratch_dir, find_rejects(scratch_dir, paths)
+
+
+def find_rejects(root_dir, paths):
+    """只检查补丁涉及的文件旁是否生成了.rej，返回 [(相对路径, .rej文件路径), ...]"""
+    rejects = []
+    for rel_path in paths:
+        reject_path = os.path.join(root_dir, rel_path + '.rej')
+        if os.path.exists(reject_path):
+            rejects.append((rel_path, reject_path))
+    return rejects
+
+
+def list_untracked_rejects(config_dir):
+    """通过git status列出工作目录中未跟踪的.rej文件，返回 [(相对路径, .rej文件路径), ...]"""
+    stdout, stderr, code = run_git_command(
+        ['git', 'status', '--porcelain', '-z', '--untracked-files=all'],
+        cwd=config_dir, check=False
+    )
+    rejects = []
+    if code != 0:
+        return rejects
+    for record in stdout.split('\0'):
+        if record.startswith('?? ') and record.endswith('.rej'):
+            reject_rel = record[3:]
+            rejects.append((reject_rel[:-4], os.path.join(config_dir, reject_rel)))
+    return rejects
+
+
+def remove_scratch_dir(scratch_dir):
+    """删除临时目录"""
+    if scratch_dir and os.path.exists(scratch_dir):
+        shutil.rmtree(scratch_dir, ignore_errors=True)
+
+
+def hash_patch_step(prev_key, patch_file, message):
+    """计算安装步骤的缓存键：上一步的键 + 补丁内容 + 提交信息"""
+    digest = hashlib.sha1(prev_key.encode('utf-8'))
+    with open(patch_file, 'rb') as f:
+        for chunk in iter(lambda: f.read(65536), b''):
+            digest.update(chunk)
+    digest.update(message.encode('utf-8'))
+    return digest.hexdigest()
+
+
+class InstallCache:
+    """以内容寻址的安装结果缓存
+
+    键由基础提交ID和依次应用的补丁哈希滚动计算，值为该前缀应用后的提交ID，
+    相同或前缀相同的MOD组合再次安装时可以直接复用之前的提交。
+    """
+
+    def __init__(self, config_dir):
+        self.config_dir = config_dir
+        self.path = os.path.join(get_git_dir(config_dir), "mod_install_cache.json")
+        self.entries = {}
+        self.dirty = False
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if isinstance(data, dict):
+                self.entries = data
+        except (OSError, ValueError):
+            self.entries = {}
+
+    def lookup(self, key):
+        """查找缓存的提交，提交已不存在（如被gc清理）时返回None"""
+        commit = self.entries.get(key)
+        if not commit:
+            return None
+        info = get_cat_file(self.config_dir).info(commit)
+        if not info or info[1] != 'commit':
+            self.entries.pop(key, None)
+            self.dirty = True
+            return None
+        return commit
+
+    def store(self, key, commit):
+        # 重新插入使最近使用的条目排在最后
+        self.entries.pop(key, None)
+        self.entries[key] = commit
+        self.dirty = True
+
+    def save(self):
+        """写回缓存文件，超出上限时丢弃最早的条目"""
+        if not self.dirty:
+            return
+        while len(self.entries) > INSTALL_CACHE_LIMIT:
+            self.entries.pop(next(iter(self.entries)))
+        temp_path = self.path + '.tmp'
+        try:
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump(self.entries, f)
+            os.replace(temp_path, self.path)
+            self.dirty = False
+        except OSError:
+            pass
+
+
+def add_step_trailer(message, step_key):
+    """在提交信息末尾记录安装步骤键"""
+    return f"{message}\n\n{STEP_TRAILER}{step_key}"
+
+
+def load_step_commits(config_dir, tip, stop_commit):
+    """沿第一父提交从tip回溯到stop_commit，返回 {安装步骤键: 提交ID}
+
+    用于增量安装：上次安装链上与本次相同的前缀可以直接复用。
+    """
+    steps = {}
+    cat_file = get_cat_file(config_dir)
+    commit = cat_file.resolve(f"{tip}^{{commit}}")
+    while commit and commit != stop_commit:
+        result = cat_file.read(commit)
+        if not result or result[1] != 'commit':
+            return {}
+        header, _, body = result[2].decode('utf-8', errors='replace').partition('\n\n')
+        parents = [line[7:] for line in header.splitlines() if line.startswith('parent ')]
+        for line in reversed(body.splitlines()):
+            if line.startswith(STEP_TRAILER):
+                steps[line[len(STEP_TRAILER):].strip()] = commit
+                break
+        commit = parents[0] if parents else None
+    # 没有回溯到基础提交说明这条链不是基于当前版本
+    return steps if commit == stop_commit else {}
+
+
+def _read_blob_text(config_dir, oid):
+    result = get_cat_file(config_dir).read(oid)
+    if not result:
+        raise ValueError(f"无法读取对象 {oid}")
+    return result[2].decode('utf-8')
+
+
+def merge_patch_into_index(temp_index, patch_file, base_rev, paths):
+    """补丁无法直接应用时，按JSON结构三方合并到临时索引
+
+    base为补丁所基于的版本，theirs为补丁应用到base后的结果，ours为临时索引中的当前内容。
+    返回 (是否成功, 冲突描述列表)，失败时不修改索引。
+    """
+    config_dir = temp_index.config_dir
+    with TempIndex(config_dir, "merge") as theirs_index:
+        if not theirs_index.read_tree(base_rev):
+            return False, ["无法读取基础版本"]
+        ok, stderr = theirs_index.apply(patch_file)
+        if not ok:
+            return False, ["补丁无法应用到基础版本"]
+        theirs_entries = theirs_index.list_entries(paths)
+    base_entries = list_tree_entries(config_dir, base_rev, paths)
+    ours_entries = temp_index.list_entries(paths)
+    return _merge_entries_into_index(temp_index, paths, base_entries, ours_entries, theirs_entries)
+
+
+def apply_overlays(temp_index, overlays):
+    """把整文件替换的MOD文件写入临时索引
+
+    overlays为 {文件路径: (对象ID, 所基于的游戏文件对象ID)}。以MOD生成时的游戏文件为基础做三方合并：
+    当前文件与基础相同时直接替换为MOD的版本；之后被其他MOD或游戏更新修改过时按JSON结构合并，
+    不会用MOD中过时的副本覆盖新内容。返回 (是否成功, 冲突描述列表)，失败时不修改索引。
+    """
+    if not overlays:
+        return True, []
+    paths = list(overlays)
+    ours_entries = temp_index.list_entries(paths)
+    base_entries = {}
+    theirs_entries = {}
+    for path, (oid, base_oid) in overlays.items():
+        mode = ours_entries[path][0] if path in ours_entries else "100644"
+        if base_oid:
+            base_entries[path] = (mode, base_oid)
+        theirs_entries[path] = (mode, oid)
+    return _merge_entries_into_index(temp_index, paths, base_entries, ours_entries, theirs_entries)
+
+
+def _merge_entries_into_index(temp_index, paths, base_entries, ours_entries, theirs_entries):
+    """按 基础/当前/MOD 三方的索引项更新临时索引，双方都修改过的JSON文件做结构化合并"""
+    config_dir = temp_index.config_dir
+    updates = {}
+    merged_texts = {}
+    conflicts = []
+    for path in paths:
+        base, ours, theirs = base_entries.get(path), ours_entries.get(path), theirs_entries.get(path)
+        if ours == theirs or base == theirs:
+            continue
+        if ours == base:
+            updates[path] = theirs
+            continue
+        if ours is None or theirs is None or not path.lower().endswith('.json'):
+            conflicts.append(path)
+            continue
+        try:
+            base_text = _read_blob_text(config_dir, base[1]) if base else None
+            merged, paths_in_conflict = merge_json_text(
+                base_text, _read_blob_text(config_dir, ours[1]), _read_blob_text(config_dir, theirs[1])
+            )
+        except (ValueError, UnicodeDecodeError) as e:
+            merged, paths_in_conflict = None, [str(e)]
+        if merged is None:
+            conflicts.append(f"{path}: {', '.join(paths_in_conflict)}")
+            continue
+        merged_texts[path] = (ours[0], merged)
+
+    if conflicts:
+        return False, conflicts
+    return _write_texts_to_index(temp_index, updates, merged_texts)
+
+
+def apply_semantic_patch(temp_index, semantic):
+    """把MOD的键路径修改重放到临时索引中的当前文件
+
+    semantic为 {文件路径: [修改, ...]}，每个修改都检查原值，当前文件已被其他MOD或新版本游戏
+    改动过的其他位置不受影响。返回 (是否成功, 冲突描述列表)，失败时不修改索引。
+    """
+    if not semantic:
+        return True, []
+    config_dir = temp_index.config_dir
+    entries = temp_index.list_entries(list(semantic))
+    texts = {}
+    conflicts = []
+    for path, ops in semantic.items():
+        entry = entries.get(path)
+        if entry is None:
+            conflicts.append(f"{path}: 文件不存在")
+            continue
+        try:
+            text = _read_blob_text(config_dir, entry[1])
+        except (ValueError, UnicodeDecodeError) as e:
+            conflicts.append(f"{path}: {e}")
+            continue
+        new_text, paths_in_conflict = apply_ops_text(text, ops)
+        if new_text is None:
+            conflicts.append(f"{path}: {', '.join(paths_in_conflict)}")
+        elif new_text != text:
+            texts[path] = (entry[0], new_text)
+
+    if conflicts:
+        return False, conflicts
+    return _write_texts_to_index(temp_index, {}, texts)
+
+
+def _write_texts_to_index(temp_index, updates, texts):
+    """把文本写为对象，连同updates中的索引项一起更新到临时索引
+
+    updates为 {路径: (模式, 对象ID) 或 None(删除)}，texts为 {路径: (模式, 文本)}。
+    """
+    config_dir = temp_index.config_dir
+    updates = dict(updates)
+    if texts:
+        # 文本写为对象
+        scratch_dir = tempfile.mkdtemp(prefix="mod_merge_")
+        try:
+            files = []
+            for i, (path, (mode, text)) in enumerate(texts.items()):
+                file_path = os.path.join(scratch_dir, str(i))
+                with open(file_path, 'w', encoding='utf-8', newline='') as f:
+                    f.write(text)
+                files.append(file_path)
+            stdout, stderr, code = run_git_command(
+                ['git', 'hash-object', '-w', '--no-filters', '--stdin-paths'],
+                cwd=config_dir, check=False, input='\n'.join(files) + '\n'
+            )
+            if code != 0:
+                return False, [stderr.strip()]
+            for (path, (mode, text)), oid in zip(texts.items(), stdout.split()):
+                updates[path] = (mode, oid)
+        finally:
+            remove_scratch_dir(scratch_dir)
+
+    # 通过标准输入传给update-index，文件很多时也不会超出命令行长度限制；模式为0表示删除
+    entries = [(entry[0], entry[1], path) if entry is not None else ("0", NULL_OID, path)
+               for path, entry in updates.items()]
+    if not temp_index.update_entries(entries):
+        return False, ["无法更新临时索引"]
+    return True, []
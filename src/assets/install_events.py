@@ -0,0 +1,123 @@
+import json
+import time
+import threading
+import functools
+
+# 事件类型
+INSTALL_STARTED = "install_started"        # total: 待安装的MOD数量
+INSTALL_FINISHED = "install_finished"      # success, failed, skipped, ignored
+MOD_STARTED = "mod_started"                # mod, index, total
+MOD_APPLIED = "mod_applied"                # mod, seconds, cached
+MOD_FAILED = "mod_failed"                  # mod, seconds, branch
+CONFLICT_DETECTED = "conflict_detected"    # mod, files: {文件路径: [可能冲突的MOD, ...]}
+PHASE_STARTED = "phase_started"            # phase
+PHASE_FINISHED = "phase_finished"          # phase, seconds
+
+# 阶段名称 -> 显示名称
+PHASE_NAMES = {
+    "check_configs": "检查MOD配置",
+    "prepare_env": "准备Git环境",
+    "reset": "重置游戏版本",
+    "scan": "读取MOD列表",
+    "precheck": "补丁预检",
+    "apply": "应用补丁",
+    "checkout": "写入游戏目录",
+    "conflict_report": "冲突分析",
+}
+
+_listeners = []
+_listeners_lock = threading.Lock()
+
+
+def add_listener(listener):
+    """注册事件监听函数，listener(event)会在发出事件的线程中调用"""
+    with _listeners_lock:
+        if listener not in _listeners:
+            _listeners.append(listener)
+
+
+def remove_listener(listener):
+    with _listeners_lock:
+        if listener in _listeners:
+            _listeners.remove(listener)
+
+
+def emit(event_type, **fields):
+    """发出一个事件，监听函数出错不影响安装流程"""
+    event = {"type": event_type, "time": time.time()}
+    event.update(fields)
+    with _listeners_lock:
+        listeners = list(_listeners)
+    for listener in listeners:
+        try:
+            listener(event)
+        except Exception:
+            pass
+    return event
+
+
+class Phase:
+    """记录一个阶段的开始和耗时，可用作with语句，也可以手动调用finish()"""
+
+    def __init__(self, name):
+        self.name = name
+        self.finished = False
+        emit(PHASE_STARTED, phase=name)
+        self.start = time.perf_counter()
+
+    def finish(self):
+        if not self.finished:
+            self.finished = True
+            emit(PHASE_FINISHED, phase=self.name, seconds=round(time.perf_counter() - self.start, 3))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.finish()
+        return False
+
+
+def phase(name):
+    """开始一个阶段"""
+    return Phase(name)
+
+
+def timed_phase(name):
+    """把整个函数作为一个阶段记录的装饰器"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with phase(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def console_listener(event):
+    """在控制台输出各阶段的耗时"""
+    if event["type"] == PHASE_FINISHED:
+        name = PHASE_NAMES.get(event["phase"], event["phase"])
+        print(f"[耗时] {name}: {event['seconds']:.2f}秒")
+
+
+class JsonlEventWriter:
+    """把事件逐行写入JSONL文件的监听器"""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._file = open(path, 'w', encoding='utf-8')
+
+    def __call__(self, event):
+        line = json.dumps(event, ensure_ascii=False)
+        with self._lock:
+            if self._file:
+                self._file.write(line + '\n')
+                self._file.flush()
+
+    def close(self):
+        with self._lock:
+            if self._file:
+                self._file.close()
+                self._file = None
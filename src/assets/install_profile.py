@@ -0,0 +1,179 @@
+import os
+import json
+import time
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+
+import install_events
+
+# 设置该环境变量为非0值时开启性能记录
+PROFILE_ENV_VAR = "SULTAN_MOD_PROFILE"
+PROFILE_DIR_NAME = "profile"
+
+# 报告中列出的条目数
+REPORT_TOP_COMMANDS = 20
+REPORT_TOP_CHECKOUTS = 10
+
+# 写入工作目录或索引的命令，单独列出最慢的调用
+CHECKOUT_COMMANDS = {"checkout", "checkout-index", "read-tree", "reset", "am", "apply"}
+
+_enabled = os.environ.get(PROFILE_ENV_VAR, "") not in ("", "0")
+_lock = threading.Lock()
+_git_calls = []     # [(命令, 工作目录, 耗时, 输出大小, 返回码), ...]
+_phases = []        # [(阶段, 耗时), ...]
+_mods = []          # [(MOD名称, 耗时, 结果), ...]
+
+
+def is_enabled():
+    return _enabled
+
+
+def enable():
+    """开启性能记录（命令行参数 --profile）"""
+    global _enabled
+    _enabled = True
+
+
+def reset():
+    with _lock:
+        _git_calls.clear()
+        _phases.clear()
+        _mods.clear()
+
+
+def command_label(cmd):
+    """命令的统计名称，例如 git -c core.quotepath=false diff ... -> git diff"""
+    args = list(cmd[1:])
+    while args and args[0].startswith('-'):
+        # -c/-C 带一个参数
+        option = args.pop(0)
+        if option in ('-c', '-C') and args:
+            args.pop(0)
+    return f"{cmd[0]} {args[0]}" if args else str(cmd[0])
+
+
+def record_git_command(cmd, cwd, seconds, output_size, returncode):
+    """记录一次Git命令的耗时，未开启时不做任何事"""
+    if not _enabled:
+        return
+    with _lock:
+        _git_calls.append((list(cmd), cwd, seconds, output_size, returncode))
+
+
+def profile_listener(event):
+    """从安装事件中收集阶段和每个MOD的耗时"""
+    event_type = event["type"]
+    with _lock:
+        if event_type == install_events.PHASE_FINISHED:
+            _phases.append((event["phase"], event["seconds"]))
+        elif event_type == install_events.MOD_APPLIED:
+            _mods.append((event["mod"], event["seconds"], "缓存" if event.get("cached") else "成功"))
+        elif event_type == install_events.MOD_FAILED:
+            _mods.append((event["mod"], event["seconds"], "失败"))
+
+
+def build_profile(total_seconds):
+    """汇总记录的数据"""
+    with _lock:
+        git_calls = list(_git_calls)
+        phases = list(_phases)
+        mods = list(_mods)
+
+    commands = {}
+    for cmd, cwd, seconds, output_size, returncode in git_calls:
+        stats = commands.setdefault(command_label(cmd), {"count": 0, "seconds": 0.0, "max": 0.0, "output": 0})
+        stats["count"] += 1
+        stats["seconds"] += seconds
+        stats["max"] = max(stats["max"], seconds)
+        stats["output"] += output_size
+
+    phase_totals = {}
+    for name, seconds in phases:
+        stats = phase_totals.setdefault(name, {"count": 0, "seconds": 0.0})
+        stats["count"] += 1
+        stats["seconds"] += seconds
+
+    checkouts = [
+        {"command": ' '.join(cmd), "cwd": cwd, "seconds": seconds}
+        for cmd, cwd, seconds, _, _ in git_calls
+        if command_label(cmd).split(' ')[-1] in CHECKOUT_COMMANDS
+    ]
+    checkouts.sort(key=lambda item: item["seconds"], reverse=True)
+
+    return {
+        "time": datetime.now().isoformat(timespec="seconds"),
+        "total_seconds": round(total_seconds, 3),
+        "git_seconds": round(sum(call[2] for call in git_calls), 3),
+        "git_count": len(git_calls),
+        "phases": phase_totals,
+        "commands": dict(sorted(commands.items(), key=lambda item: item[1]["seconds"], reverse=True)),
+        "mods": [{"mod": name, "seconds": seconds, "result": result}
+                 for name, seconds, result in sorted(mods, key=lambda item: item[1], reverse=True)],
+        "slowest_checkouts": checkouts[:REPORT_TOP_CHECKOUTS],
+    }
+
+
+def format_report(profile):
+    """生成便于阅读的文本报告"""
+    lines = [
+        f"MOD安装性能报告 {profile['time']}",
+        "=" * 50,
+        f"总耗时: {profile['total_seconds']:.2f}秒",
+        f"Git命令: {profile['git_count']} 次，共 {profile['git_seconds']:.2f}秒",
+        "",
+        "[阶段耗时]",
+    ]
+    for name, stats in profile["phases"].items():
+        display_name = install_events.PHASE_NAMES.get(name, name)
+        lines.append(f"  {display_name:<12} {stats['seconds']:>8.2f}秒  ({stats['count']}次)")
+
+    lines += ["", "[累计耗时最多的命令]"]
+    for label, stats in list(profile["commands"].items())[:REPORT_TOP_COMMANDS]:
+        lines.append(
+            f"  {label:<24} {stats['seconds']:>8.2f}秒  {stats['count']:>5}次  "
+            f"最长 {stats['max']:.3f}秒  输出 {stats['output']} 字符"
+        )
+
+    lines += ["", "[每个MOD的耗时]"]
+    for mod in profile["mods"]:
+        lines.append(f"  {mod['mod']:<24} {mod['seconds']:>8.3f}秒  {mod['result']}")
+
+    lines += ["", "[最慢的检出/写入索引命令]"]
+    for checkout in profile["slowest_checkouts"]:
+        lines.append(f"  {checkout['seconds']:>8.3f}秒  {checkout['command']}")
+    return '\n'.join(lines) + '\n'
+
+
+def write_report(app_path, total_seconds):
+    """把性能报告写入程序目录下的profile文件夹，返回文本报告的路径"""
+    profile = build_profile(total_seconds)
+    profile_dir = os.path.join(app_path, PROFILE_DIR_NAME)
+    os.makedirs(profile_dir, exist_ok=True)
+    base_name = os.path.join(profile_dir, f"profile_{datetime.now().strftime('%Y%m%d_%H%M%S')}")
+    # JSON用于不同版本之间对比，文本用于直接阅读
+    with open(base_name + ".json", 'w', encoding='utf-8') as f:
+        json.dump(profile, f, ensure_ascii=False, indent=2)
+    with open(base_name + ".txt", 'w', encoding='utf-8') as f:
+        f.write(format_report(profile))
+    return base_name + ".txt"
+
+
+@contextmanager
+def profile_session(app_path):
+    """开启时在安装过程中收集性能数据，结束后写入报告"""
+    if not _enabled:
+        yield
+        return
+    reset()
+    install_events.add_listener(profile_listener)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        install_events.remove_listener(profile_listener)
+        try:
+            report_file = write_report(app_path, time.perf_counter() - start)
+            print(f"[性能] 性能报告已保存到: {report_file}")
+        except OSError as e:
+            print(f"[警告] 无法保存性能报告: {e}")
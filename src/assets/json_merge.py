@@ -0,0 +1,272 @@
+import copy
+import json
+
+# 表示键不存在
+MISSING = object()
+
+
+def strip_jsonc(text):
+    """去掉游戏配置中的 // 和 /* */ 注释以及多余的尾逗号（字符串中的内容保持不变）"""
+    result = []
+    i = 0
+    length = len(text)
+    in_string = False
+    # 字符串外最近一个逗号在result中的位置，后面紧跟 } 或 ] 时删除
+    pending_comma = None
+    while i < length:
+        c = text[i]
+        if in_string:
+            result.append(c)
+            if c == '\\' and i + 1 < length:
+                result.append(text[i + 1])
+                i += 2
+                continue
+            if c == '"':
+                in_string = False
+            i += 1
+            continue
+        if c == '"':
+            in_string = True
+            pending_comma = None
+        elif c == '/' and text.startswith('//', i):
+            end = text.find('\n', i)
+            i = length if end == -1 else end
+            continue
+        elif c == '/' and text.startswith('/*', i):
+            end = text.find('*/', i + 2)
+            i = length if end == -1 else end + 2
+            continue
+        elif c in '}]':
+            if pending_comma is not None:
+                result[pending_comma] = ''
+            pending_comma = None
+        elif c == ',':
+            pending_comma = len(result)
+        elif not c.isspace():
+            pending_comma = None
+        result.append(c)
+        i += 1
+    return ''.join(result)
+
+
+def load_jsonc(text):
+    """解析带注释的JSON文本，失败时抛出ValueError"""
+    if text.startswith('\ufeff'):
+        text = text[1:]
+    return json.loads(strip_jsonc(text))
+
+
+def detect_format(text):
+    """检测JSON文本的缩进、换行符、BOM和结尾换行，返回格式字典"""
+    indent = 4
+    for line in text.splitlines()[1:]:
+        stripped = line.lstrip(' \t')
+        if stripped and len(stripped) < len(line):
+            whitespace = line[:len(line) - len(stripped)]
+            indent = '\t' if whitespace.startswith('\t') else len(whitespace)
+            break
+    return {
+        "indent": indent,
+        "newline": '\r\n' if '\r\n' in text else '\n',
+        "bom": text.startswith('\ufeff'),
+        "final_newline": text.endswith('\n'),
+    }
+
+
+def dump_json(value, fmt):
+    """按检测到的格式序列化JSON"""
+    text = json.dumps(value, ensure_ascii=False, indent=fmt["indent"])
+    if fmt["newline"] != '\n':
+        text = text.replace('\n', fmt["newline"])
+    if fmt["final_newline"]:
+        text += fmt["newline"]
+    if fmt["bom"]:
+        text = '\ufeff' + text
+    return text
+
+
+def same_value(a, b):
+    """按JSON语义比较两个值（true与1视为不同）"""
+    if isinstance(a, dict) and isinstance(b, dict):
+        return a.keys() == b.keys() and all(same_value(a[key], b[key]) for key in a)
+    if isinstance(a, list) and isinstance(b, list):
+        return len(a) == len(b) and all(map(same_value, a, b))
+    return type(a) is type(b) and a == b
+
+
+def merge_values(base, ours, theirs, path, conflicts):
+    """三方合并单个值，无法合并的位置记录到conflicts并返回ours"""
+    if same_value(ours, theirs):
+        return ours
+    if same_value(base, ours):
+        return theirs
+    if same_value(base, theirs):
+        return ours
+
+    if isinstance(ours, dict) and isinstance(theirs, dict):
+        base_dict = base if isinstance(base, dict) else {}
+        merged = {}
+        keys = list(ours.keys()) + [key for key in theirs if key not in ours]
+        for key in keys:
+            value = merge_values(
+                base_dict.get(key, MISSING), ours.get(key, MISSING), theirs.get(key, MISSING),
+                f"{path}/{key}", conflicts
+            )
+            if value is not MISSING:
+                merged[key] = value
+        return merged
+
+    if isinstance(ours, list) and isinstance(theirs, list) and isinstance(base, list):
+        # 长度未变时按下标逐个合并
+        if len(ours) == len(base) == len(theirs):
+            return [merge_values(b, o, t, f"{path}/{i}", conflicts)
+                    for i, (b, o, t) in enumerate(zip(base, ours, theirs))]
+        # 双方都只在末尾追加元素
+        if same_value(ours[:len(base)], base) and same_value(theirs[:len(base)], base):
+            added = ours[len(base):]
+            return ours + [item for item in theirs[len(base):]
+                           if not any(same_value(item, other) for other in added)]
+
+    conflicts.append(path or '/')
+    return ours
+
+
+def merge_json_text(base_text, ours_text, theirs_text):
+    """对三份JSON文本做结构化三方合并
+
+    返回 (合并后的文本, 冲突路径列表)；任意一方无法解析或存在冲突时文本为None。
+    合并结果与某一方相同时直接返回该方原文，以保留其中的注释和格式。
+    """
+    try:
+        base = load_jsonc(base_text) if base_text is not None else MISSING
+        ours = load_jsonc(ours_text)
+        theirs = load_jsonc(theirs_text)
+    except ValueError as e:
+        return None, [f"解析失败: {e}"]
+
+    conflicts = []
+    merged = merge_values(base, ours, theirs, "", conflicts)
+    if conflicts:
+        return None, conflicts
+    if same_value(merged, ours):
+        return ours_text, []
+    if same_value(merged, theirs):
+        return theirs_text, []
+    return dump_json(merged, detect_format(ours_text)), []
+
+
+def format_path(path):
+    """键路径的显示形式，例如 ["cost", "gold"] -> /cost/gold"""
+    return '/' + '/'.join(str(key) for key in path)
+
+
+def diff_values(base, target, path=None, ops=None):
+    """计算把base变为target的最少键路径修改
+
+    只比较键和值，不受格式和键顺序影响。修改为 {"op": "set", "path": [...], "value": ..., "old": ...}、
+    {"op": "remove", "path": [...], "old": ...} 或 {"op": "append", "path": [...], "items": [...]}，
+    set中没有old表示该键原本不存在。
+    """
+    path = [] if path is None else path
+    ops = [] if ops is None else ops
+    if isinstance(base, dict) and isinstance(target, dict):
+        for key, value in base.items():
+            if key not in target:
+                ops.append({"op": "remove", "path": path + [key], "old": value})
+            else:
+                diff_values(value, target[key], path + [key], ops)
+        for key, value in target.items():
+            if key not in base:
+                ops.append({"op": "set", "path": path + [key], "value": value})
+    elif isinstance(base, list) and isinstance(target, list) and len(base) == len(target):
+        for i, (old, new) in enumerate(zip(base, target)):
+            diff_values(old, new, path + [i], ops)
+    elif (isinstance(base, list) and isinstance(target, list) and len(target) > len(base)
+            and same_value(target[:len(base)], base)):
+        ops.append({"op": "append", "path": path, "items": target[len(base):]})
+    elif not same_value(base, target):
+        ops.append({"op": "set", "path": path, "value": target, "old": base})
+    return ops
+
+
+def _apply_op(holder, op):
+    """应用单个修改，返回是否成功；当前值已是修改后的值时视为成功
+
+    根节点放在holder[""]中，这样替换整个文件也可以按 父节点[键] 处理。
+    """
+    parent, key = holder, ""
+    for step in op["path"]:
+        parent, key = parent[key], step
+        if isinstance(parent, dict) and isinstance(key, str):
+            continue
+        if isinstance(parent, list) and isinstance(key, int) and 0 <= key < len(parent):
+            continue
+        return False
+    current = parent.get(key, MISSING) if isinstance(parent, dict) else parent[key]
+
+    if op["op"] == "set":
+        if same_value(current, op["value"]):
+            return True
+        if not same_value(current, op.get("old", MISSING)):
+            return False
+        parent[key] = copy.deepcopy(op["value"])
+    elif op["op"] == "remove":
+        if current is MISSING:
+            return True
+        if not isinstance(parent, dict) or not same_value(current, op["old"]):
+            return False
+        del parent[key]
+    elif op["op"] == "append":
+        items = op["items"]
+        if not isinstance(current, list):
+            return False
+        # 已经追加过时不重复追加
+        if len(current) < len(items) or not same_value(current[len(current) - len(items):], items):
+            current.extend(copy.deepcopy(items))
+    else:
+        return False
+    return True
+
+
+def apply_ops(value, ops):
+    """在value的副本上重放键路径修改
+
+    每个修改都以原值为前提：目标位置的值既不是原值也不是新值时记为冲突。
+    返回 (修改后的值, 冲突路径列表)。
+    """
+    holder = {"": copy.deepcopy(value)}
+    conflicts = []
+    for op in ops:
+        try:
+            applied = _apply_op(holder, op)
+        except (KeyError, TypeError):
+            applied = False
+        if not applied:
+            conflicts.append(format_path(op.get("path", [])))
+    return holder[""], conflicts
+
+
+def diff_json_text(base_text, target_text):
+    """计算两份JSON文本之间的键路径修改，任意一方无法解析时返回None"""
+    try:
+        return diff_values(load_jsonc(base_text), load_jsonc(target_text))
+    except ValueError:
+        return None
+
+
+def apply_ops_text(text, ops):
+    """把键路径修改重放到JSON文本上
+
+    返回 (修改后的文本, 冲突路径列表)，无法解析或存在冲突时文本为None。
+    内容没有变化时返回原文，以保留其中的注释和格式。
+    """
+    try:
+        value = load_jsonc(text)
+    except ValueError as e:
+        return None, [f"解析失败: {e}"]
+    result, conflicts = apply_ops(value, ops)
+    if conflicts:
+        return None, conflicts
+    if same_value(result, value):
+        return text, []
+    return dump_json(result, detect_format(text)), []
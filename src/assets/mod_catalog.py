@@ -0,0 +1,260 @@
+import os
+import json
+import hashlib
+import threading
+from dataclasses import dataclass, field
+from typing import Optional
+from concurrent.futures import ThreadPoolExecutor
+
+from patch_analysis import get_patch_paths
+
+# 读取MOD配置使用的线程数（Mods目录可能位于网络同步盘上，IO等待较多）
+CATALOG_WORKERS = 16
+
+MOD_CONFIG_NAME = "modConfig.json"
+
+# 与Mods目录同级的缓存文件
+CATALOG_CACHE_NAME = "mod_catalog_cache.json"
+CATALOG_CACHE_VERSION = 1
+
+
+@dataclass
+class ModRecord:
+    """Mods目录下的一个MOD"""
+    name: str
+    dir: str
+    config_file: str
+    config: Optional[dict] = None       # 没有配置文件或读取失败时为None
+    error: Optional[str] = None         # 读取配置文件失败的原因
+    signature: Optional[tuple] = field(default=None, repr=False)  # 配置文件的 (大小, 修改时间)
+    dir_signature: Optional[int] = field(default=None, repr=False)  # MOD目录的修改时间
+    patch_signature: Optional[tuple] = field(default=None, repr=False)  # 补丁文件的 (大小, 修改时间)
+    patch_hash: Optional[str] = None    # 补丁内容的SHA1
+    touched_files: list = field(default_factory=list)  # 补丁修改的文件
+
+    @property
+    def has_config(self):
+        return self.config is not None
+
+    @property
+    def patch_file(self):
+        """补丁文件的完整路径，配置中没有补丁时返回None"""
+        if not self.config or "patchFile" not in self.config:
+            return None
+        return os.path.join(self.dir, self.config["patchFile"])
+
+    @property
+    def priority(self):
+        return self.config.get("priority", 100) if self.config else 100
+
+    @property
+    def ignore(self):
+        return self.config.get("ignore", False) if self.config else False
+
+
+def _file_signature(path):
+    try:
+        stat = os.stat(path)
+        return (stat.st_size, stat.st_mtime_ns)
+    except OSError:
+        return None
+
+
+def _hash_file(path):
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(65536), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _update_patch_info(record):
+    """补丁文件变化时重新计算哈希和修改的文件列表"""
+    patch_file = record.patch_file
+    patch_signature = _file_signature(patch_file) if patch_file else None
+    if patch_signature == record.patch_signature:
+        return
+    record.patch_signature = patch_signature
+    record.patch_hash = None
+    record.touched_files = []
+    if patch_signature is None:
+        return
+    try:
+        record.patch_hash = _hash_file(patch_file)
+        record.touched_files = get_patch_paths(patch_file)
+    except Exception:
+        record.patch_signature = None
+
+
+def _load_record(name, mod_dir, previous):
+    """读取单个MOD的配置，目录和配置文件都未变化时复用上次的结果"""
+    config_file = os.path.join(mod_dir, MOD_CONFIG_NAME)
+    signature = _file_signature(config_file)
+    try:
+        dir_signature = os.stat(mod_dir).st_mtime_ns
+    except OSError:
+        dir_signature = None
+
+    if (previous is not None and previous.dir == mod_dir and previous.signature == signature
+            and previous.dir_signature == dir_signature):
+        record = previous
+    else:
+        record = ModRecord(name=name, dir=mod_dir, config_file=config_file,
+                           signature=signature, dir_signature=dir_signature)
+        if signature is not None:
+            _read_config(record)
+        if previous is not None:
+            # 配置变化不影响补丁信息，补丁未变化时沿用
+            record.patch_signature = previous.patch_signature
+            record.patch_hash = previous.patch_hash
+            record.touched_files = previous.touched_files
+
+    _update_patch_info(record)
+    return record
+
+
+def _cache_state(records):
+    """用于判断缓存是否需要写回的签名列表"""
+    return [(record.name, record.signature, record.dir_signature, record.patch_signature)
+            for record in records]
+
+
+def _read_config(record):
+    """读取MOD配置文件"""
+    config_file = record.config_file
+    try:
+        with open(config_file, 'r', encoding='utf-8') as f:
+            config = json.load(f)
+        if isinstance(config, dict):
+            record.config = config
+        else:
+            record.error = "配置文件内容不是JSON对象"
+    except Exception as e:
+        record.error = str(e)
+
+
+class ModCatalog:
+    """Mods目录的MOD列表，使用os.scandir扫描并在线程池中读取配置
+
+    同一进程中的检查、安装和界面共用一个实例，每次使用前调用refresh()，
+    只有发生变化的配置文件才会重新读取。解析结果保存在Mods旁边的缓存文件中，
+    程序启动时可以先用缓存显示，再在后台校验。
+    """
+
+    def __init__(self, mods_dir):
+        self.mods_dir = mods_dir
+        self.cache_file = os.path.join(os.path.dirname(os.path.abspath(mods_dir)), CATALOG_CACHE_NAME)
+        self.records = []
+        self._by_name = {}
+        self._cache_loaded = False
+        self._lock = threading.Lock()
+
+    def load_cached(self):
+        """从缓存文件读取上次的MOD列表（不访问各MOD目录），没有缓存时返回空列表"""
+        with self._lock:
+            self._load_cache()
+            return list(self.records)
+
+    def _load_cache(self):
+        if self._cache_loaded:
+            return
+        self._cache_loaded = True
+        try:
+            with open(self.cache_file, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if data.get("version") != CATALOG_CACHE_VERSION:
+                return
+            records = []
+            for entry in data["mods"]:
+                records.append(ModRecord(
+                    name=entry["name"],
+                    dir=os.path.join(self.mods_dir, entry["name"]),
+                    config_file=os.path.join(self.mods_dir, entry["name"], MOD_CONFIG_NAME),
+                    config=entry.get("config"),
+                    error=entry.get("error"),
+                    signature=tuple(entry["signature"]) if entry.get("signature") else None,
+                    dir_signature=entry.get("dir_signature"),
+                    patch_signature=tuple(entry["patch_signature"]) if entry.get("patch_signature") else None,
+                    patch_hash=entry.get("patch_hash"),
+                    touched_files=entry.get("touched_files", []),
+                ))
+        except (OSError, ValueError, KeyError, TypeError, AttributeError):
+            return
+        self.records = records
+        self._by_name = {record.name: record for record in records}
+
+    def _save_cache(self):
+        data = {
+            "version": CATALOG_CACHE_VERSION,
+            "mods": [{
+                "name": record.name,
+                "config": record.config,
+                "error": record.error,
+                "signature": record.signature,
+                "dir_signature": record.dir_signature,
+                "patch_signature": record.patch_signature,
+                "patch_hash": record.patch_hash,
+                "touched_files": record.touched_files,
+            } for record in self.records],
+        }
+        temp_file = self.cache_file + ".tmp"
+        try:
+            with open(temp_file, 'w', encoding='utf-8') as f:
+                json.dump(data, f, ensure_ascii=False, separators=(',', ':'))
+            os.replace(temp_file, self.cache_file)
+        except OSError:
+            pass
+
+    def refresh(self):
+        """重新扫描Mods目录，返回按目录顺序排列的MOD记录列表"""
+        with self._lock:
+            try:
+                with os.scandir(self.mods_dir) as entries:
+                    mod_dirs = [(entry.name, entry.path) for entry in entries if entry.is_dir()]
+            except OSError:
+                mod_dirs = []
+
+            self._load_cache()
+            previous = self._by_name
+            with ThreadPoolExecutor(max_workers=CATALOG_WORKERS) as executor:
+                records = list(executor.map(
+                    lambda item: _load_record(item[0], item[1], previous.get(item[0])),
+                    mod_dirs
+                ))
+
+            # 只有内容发生变化时才写回缓存
+            changed = _cache_state(records) != _cache_state(self.records)
+            self.records = records
+            self._by_name = {record.name: record for record in records}
+            if changed:
+                self._save_cache()
+            return list(records)
+
+    def get(self, name):
+        """按名称获取MOD记录"""
+        return self._by_name.get(name)
+
+
+# 每个Mods目录一个实例
+_catalogs = {}
+_catalogs_lock = threading.Lock()
+
+
+def get_mod_catalog(mods_dir):
+    """获取指定Mods目录的MOD列表（进程内共享）"""
+    key = os.path.normcase(os.path.abspath(mods_dir))
+    with _catalogs_lock:
+        catalog = _catalogs.get(key)
+        if catalog is None:
+            catalog = ModCatalog(mods_dir)
+            _catalogs[key] = catalog
+        return catalog
+
+
+def find_first_txt(mod_dir):
+    """按os.walk的顺序查找第一个.txt文件，找到后立即停止遍历"""
+    for root, _, files in os.walk(mod_dir):
+        for file in files:
+            if file.lower().endswith('.txt'):
+                return os.path.join(root, file)
+    return None
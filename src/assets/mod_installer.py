@@ -1,6 +1,7 @@
 import os
 import sys
 import json
+import time
 import shutil
 import subprocess
 from pathlib import Path
@@ -10,56 +11,61 @@ from datetime import datetime
 from common_utils import (
     print_header, ensure_directory, get_application_path, get_game_path,
     get_config_dir, prepare_git_environment, run_git_command,
-    Colors, colored_print, generate_safe_branch_name
+    Colors, colored_print, generate_safe_branch_name, get_ref_index,
+    get_game_version_info
 )
 
 # 导入MOD配置检查工具
 from check_mod_configs import check_mod_configs
 
+# 导入MOD列表
+from mod_catalog import get_mod_catalog
 
-def apply_patch(patch_file, config_dir, mod_name, mod_config):
-    """应用补丁文件"""
-    colored_print(f"[应用] MOD: {mod_name}", Colors.CYAN)
-    
-    if not os.path.exists(patch_file):
-        colored_print(f"[错误] 补丁文件不存在: {patch_file}", Colors.RED)
-        return False
-    
-    # 尝试修复补丁文件编码
+# 导入基于临时索引的安装引擎
+from install_engine import (
+    TempIndex, commit_tree, update_branch, resolve_commit, is_ancestor,
+    collect_rejects, remove_scratch_dir, InstallCache, hash_patch_step,
+    add_step_trailer, load_step_commits, merge_patch_into_index, apply_overlays,
+    apply_semantic_patch,
+    build_file_mod_index, record_mod_paths, find_rejects, list_untracked_rejects
+)
+
+# 导入补丁分析工具
+from patch_analysis import get_patch_paths, precheck_mods, ensure_utf8_patch
+
+# 导入MOD文件清单
+from mod_manifest import (
+    load_overlays, overlay_signature, load_semantic_patch, semantic_signature, get_patch_base,
+    EMPTY_PATCH_NAME
+)
+
+# 导入性能记录
+from install_profile import enable as enable_profiling, profile_session
+
+# 导入安装事件
+from install_events import (
+    emit, phase, timed_phase, add_listener, remove_listener, console_listener, JsonlEventWriter,
+    INSTALL_STARTED, INSTALL_FINISHED, MOD_STARTED, MOD_APPLIED, MOD_FAILED, CONFLICT_DETECTED
+)
+
+
+# 安装事件记录文件
+INSTALL_EVENTS_FILE = "install_events.jsonl"
+
+def prepare_patch_file(patch_file):
+    """检查补丁文件编码，非UTF-8时转换为UTF-8副本，返回实际使用的补丁路径"""
     try:
-        # 读取补丁文件内容
-        with open(patch_file, 'rb') as f:
-            patch_content = f.read()
-        
-        # 尝试检测编码并修复
-        try:
-            # 尝试用UTF-8解码
-            patch_text = patch_content.decode('utf-8')
-        except UnicodeDecodeError:
-            # UTF-8解码失败，尝试用GBK或其他编码
-            try:
-                patch_text = patch_content.decode('gbk')
-                # 转换为UTF-8
-                patch_content = patch_text.encode('utf-8')
-                # 创建临时补丁文件
-                temp_patch_file = patch_file + ".utf8"
-                with open(temp_patch_file, 'wb') as f:
-                    f.write(patch_content)
-                patch_file = temp_patch_file
-                colored_print(f"[信息] 已修复补丁文件编码", Colors.BLUE)
-            except UnicodeDecodeError:
-                # 如果GBK也失败，尝试latin-1（这个编码可以解码任何字节序列）
-                patch_text = patch_content.decode('latin-1')
-                patch_content = patch_text.encode('utf-8')
-                temp_patch_file = patch_file + ".utf8"
-                with open(temp_patch_file, 'wb') as f:
-                    f.write(patch_content)
-                patch_file = temp_patch_file
-                colored_print(f"[信息] 已使用通用编码修复补丁文件", Colors.BLUE)
+        # 流式检测和转码，不把整个补丁读入内存
+        patch_file, converted = ensure_utf8_patch(patch_file)
+        if converted:
+            colored_print(f"[信息] 已修复补丁文件编码", Colors.BLUE)
     except Exception as e:
         colored_print(f"[警告] 修复补丁文件编码时出错: {e}", Colors.YELLOW)
     
-    # 准备提交信息
+    return patch_file
+
+def build_commit_message(mod_name, mod_config):
+    """生成MOD提交信息"""
     author = mod_config.get("author", "未知作者")
     source = mod_config.get("source", "")
     version = mod_config.get("version", "")
@@ -71,6 +77,111 @@ def apply_patch(patch_file, config_dir, mod_name, mod_config):
         commit_msg += f"\n来源: {source}"
     if version:
         commit_msg += f"\n版本: {version}"
+    return commit_msg
+
+@timed_phase("conflict_report")
+def write_conflict_report(config_dir, mod_name, conflict_files, file_mods=None):
+    """分析冲突文件，查找可能导致冲突的MOD，并保存到冲突文件夹
+    
+    conflict_files为 [(相对路径, .rej文件路径), ...]，
+    file_mods为 {文件路径: [修改过它的MOD名称, ...]}，未提供时从当前分支的历史中一次性建立
+    """
+    colored_print(f"[错误] 补丁应用存在冲突，无法自动解决", Colors.RED)
+    
+    if file_mods is None:
+        file_mods = build_file_mod_index(config_dir, "HEAD")
+    
+    # 分析冲突文件，查找可能导致冲突的MOD
+    conflict_analysis = {}  # 用于存储分析结果
+    for rel_path, reject_path in conflict_files:
+        colored_print(f"\n[分析] 分析冲突文件: {rel_path}", Colors.MAGENTA)
+        
+        conflict_mods = [name for name in file_mods.get(rel_path, []) if name != mod_name]
+        if conflict_mods:
+            colored_print(f"[提示] 以下MOD可能与当前MOD({mod_name})在文件 {rel_path} 上存在冲突:", Colors.YELLOW)
+            for i, conflict_mod in enumerate(conflict_mods, 1):
+                colored_print(f"  {i}. {conflict_mod}", Colors.YELLOW)
+            colored_print("[建议] 请检查这些MOD的兼容性，或调整它们的安装顺序", Colors.YELLOW)
+        else:
+            colored_print(f"[信息] 未找到修改过文件 {rel_path} 的MOD记录", Colors.BLUE)
+        
+        # 保存分析结果
+        conflict_analysis[rel_path] = {
+            'reject_path': reject_path,
+            'conflict_mods': conflict_mods
+        }
+    
+    emit(CONFLICT_DETECTED, mod=mod_name,
+         files={rel_path: info['conflict_mods'] for rel_path, info in conflict_analysis.items()})
+    
+    # 完成分析后，创建冲突文件夹并复制文件
+    conflict_dir = os.path.join(os.path.dirname(config_dir), "conflict_files", mod_name)
+    if os.path.exists(conflict_dir):
+        shutil.rmtree(conflict_dir)
+    os.makedirs(conflict_dir, exist_ok=True)
+    
+    # 创建分析结果文件
+    analysis_file = os.path.join(conflict_dir, "conflict_analysis.txt")
+    with open(analysis_file, 'w', encoding='utf-8') as f:
+        f.write(f"MOD: {mod_name} 冲突分析\n")
+        f.write("=" * 50 + "\n\n")
+        
+        for rel_path, info in conflict_analysis.items():
+            f.write(f"文件: {rel_path}\n")
+            if info['conflict_mods']:
+                f.write("可能冲突的MOD:\n")
+                for i, conflict_mod in enumerate(info['conflict_mods'], 1):
+                    f.write(f"  {i}. {conflict_mod}\n")
+            else:
+                f.write("未找到可能冲突的MOD\n")
+            f.write("\n" + "-" * 40 + "\n\n")
+    
+    colored_print(f"\n[信息] 冲突分析已保存到: {analysis_file}", Colors.BLUE)
+    
+    # 复制冲突文件到冲突文件夹
+    for rel_path, info in conflict_analysis.items():
+        reject_path = info['reject_path']
+        
+        # 创建目标目录结构
+        target_dir = os.path.join(conflict_dir, os.path.dirname(rel_path))
+        os.makedirs(target_dir, exist_ok=True)
+        
+        # 复制.rej文件
+        target_rej = os.path.join(conflict_dir, rel_path + '.rej')
+        shutil.copy2(reject_path, target_rej)
+        
+        # 复制原始文件
+        original_file = reject_path[:-4]
+        if os.path.exists(original_file):
+            target_orig = os.path.join(conflict_dir, rel_path)
+            shutil.copy2(original_file, target_orig)
+
+def apply_patch(patch_file, config_dir, mod_name, mod_config, index=None, total=None):
+    """在工作目录中应用补丁文件
+
+    index和total为该MOD在本次安装中的序号和总数，只有调用方提供时才发出进度事件。
+    """
+    if index is not None and total is not None:
+        emit(MOD_STARTED, mod=mod_name, index=index, total=total)
+    start_time = time.perf_counter()
+    if _apply_patch_to_worktree(patch_file, config_dir, mod_name, mod_config):
+        emit(MOD_APPLIED, mod=mod_name, seconds=round(time.perf_counter() - start_time, 3), cached=False)
+        return True
+    emit(MOD_FAILED, mod=mod_name, seconds=round(time.perf_counter() - start_time, 3), branch=None)
+    return False
+
+def _apply_patch_to_worktree(patch_file, config_dir, mod_name, mod_config):
+    colored_print(f"[应用] MOD: {mod_name}", Colors.CYAN)
+    
+    if not os.path.exists(patch_file):
+        colored_print(f"[错误] 补丁文件不存在: {patch_file}", Colors.RED)
+        return False
+    
+    # 尝试修复补丁文件编码
+    patch_file = prepare_patch_file(patch_file)
+    
+    # 准备提交信息
+    commit_msg = build_commit_message(mod_name, mod_config)
     
     # 首先尝试使用git am命令应用补丁
     colored_print(f"[尝试] 使用git am应用补丁...", Colors.CYAN)
@@ -93,110 +204,120 @@ def apply_patch(patch_file, config_dir, mod_name, mod_config):
     colored_print(f"[警告] git am应用补丁失败: {mod_name}", Colors.YELLOW)
     run_git_command(['git', 'am', '--abort'], cwd=config_dir, check=False)
     
-    # 检查是否有.rej文件（冲突文件）
-    has_reject_files = False
-    conflict_files = []
-    for root, dirs, files in os.walk(config_dir):
-        for file in files:
-            if file.endswith('.rej'):
-                has_reject_files = True
-                reject_path = os.path.join(root, file)
-                original_file = reject_path[:-4]  # 移除.rej后缀
-                rel_path = os.path.relpath(original_file, config_dir)
-                conflict_files.append((rel_path, reject_path))
-                
-                colored_print(f"[警告] 发现冲突文件: {rel_path}", Colors.YELLOW)
+    # 只检查补丁涉及的文件，不再遍历整个配置目录
+    patch_paths = get_patch_paths(patch_file)
+    if patch_paths:
+        conflict_files = find_rejects(config_dir, patch_paths)
+    else:
+        conflict_files = list_untracked_rejects(config_dir)
+    for rel_path, reject_path in conflict_files:
+        colored_print(f"[警告] 发现冲突文件: {rel_path}", Colors.YELLOW)
+    has_reject_files = bool(conflict_files)
     
     if has_reject_files:
-        colored_print(f"[错误] 补丁应用存在冲突，无法自动解决", Colors.RED)
-        
-        # 分析冲突文件，查找可能导致冲突的MOD
-        conflict_analysis = {}  # 用于存储分析结果
-        for rel_path, reject_path in conflict_files:
-            colored_print(f"\n[分析] 分析冲突文件: {rel_path}", Colors.MAGENTA)
-            
-            # 查找修改过该文件的提交
-            stdout, stderr, code = run_git_command(
-                ['git', 'log', '--format=%H:%s', '--', rel_path], 
-                cwd=config_dir, 
-                check=False
-            )
-            
-            conflict_mods = []
-            if stdout and code == 0:
-                commits = stdout.strip().split('\n')
-                
-                for commit in commits:
-                    if ':' in commit:
-                        commit_hash, commit_msg = commit.split(':', 1)
-                        if commit_msg.startswith("应用MOD:"):
-                            conflict_mod_name = commit_msg[5:].strip().split('\n')[0]  # 获取MOD名称，去除可能的作者信息
-                            if conflict_mod_name not in conflict_mods:
-                                conflict_mods.append(conflict_mod_name)
-                
-                if conflict_mods:
-                    colored_print(f"[提示] 以下MOD可能与当前MOD({mod_name})在文件 {rel_path} 上存在冲突:", Colors.YELLOW)
-                    for i, conflict_mod in enumerate(conflict_mods, 1):
-                        colored_print(f"  {i}. {conflict_mod}", Colors.YELLOW)
-                    colored_print("[建议] 请检查这些MOD的兼容性，或调整它们的安装顺序", Colors.YELLOW)
-                else:
-                    colored_print(f"[信息] 未找到修改过文件 {rel_path} 的MOD记录", Colors.BLUE)
-            else:
-                colored_print(f"[信息] 无法获取文件 {rel_path} 的修改历史", Colors.BLUE)
-            
-            # 保存分析结果
-            conflict_analysis[rel_path] = {
-                'reject_path': reject_path,
-                'conflict_mods': conflict_mods
-            }
-        
-        # 完成分析后，创建冲突文件夹并复制文件
-        conflict_dir = os.path.join(os.path.dirname(config_dir), "conflict_files", mod_name)
-        if os.path.exists(conflict_dir):
-            shutil.rmtree(conflict_dir)
-        os.makedirs(conflict_dir, exist_ok=True)
-        
-        # 创建分析结果文件
-        analysis_file = os.path.join(conflict_dir, "conflict_analysis.txt")
-        with open(analysis_file, 'w', encoding='utf-8') as f:
-            f.write(f"MOD: {mod_name} 冲突分析\n")
-            f.write("=" * 50 + "\n\n")
-            
-            for rel_path, info in conflict_analysis.items():
-                f.write(f"文件: {rel_path}\n")
-                if info['conflict_mods']:
-                    f.write("可能冲突的MOD:\n")
-                    for i, conflict_mod in enumerate(info['conflict_mods'], 1):
-                        f.write(f"  {i}. {conflict_mod}\n")
-                else:
-                    f.write("未找到可能冲突的MOD\n")
-                f.write("\n" + "-" * 40 + "\n\n")
-        
-        colored_print(f"\n[信息] 冲突分析已保存到: {analysis_file}", Colors.BLUE)
-        
-        # 复制冲突文件到冲突文件夹
-        for rel_path, info in conflict_analysis.items():
-            reject_path = info['reject_path']
-            
-            # 创建目标目录结构
-            target_dir = os.path.join(conflict_dir, os.path.dirname(rel_path))
-            os.makedirs(target_dir, exist_ok=True)
-            
-            # 复制.rej文件
-            target_rej = os.path.join(conflict_dir, rel_path + '.rej')
-            shutil.copy2(reject_path, target_rej)
-            
-            # 复制原始文件
-            original_file = reject_path[:-4]
-            if os.path.exists(original_file):
-                target_orig = os.path.join(conflict_dir, rel_path)
-                shutil.copy2(original_file, target_orig)
-        
-        # 清理工作目录
-        run_git_command(['git', 'reset', '--hard'], cwd=config_dir)
-        # 确保移除所有未跟踪的文件，特别是.rej文件
-        run_git_command(['git', 'clean', '-fd'], cwd=config_dir, check=False)
+        write_conflict_report(config_dir, mod_name, conflict_files)
+    
+    # 清理工作目录（没有.rej文件时git am也可能留下部分修改）
+    run_git_command(['git', 'reset', '--hard'], cwd=config_dir)
+    # 确保移除所有未跟踪的文件，特别是.rej文件
+    run_git_command(['git', 'clean', '-fd'], cwd=config_dir, check=False)
+    return False
+
+def apply_patch_to_index(temp_index, patch_file, config_dir, mod_name, file_mods, merge_base=None, prediction=None,
+                         overlays=None, semantic=None):
+    """将补丁应用到临时索引，失败时在临时目录中生成冲突文件并写入冲突分析
+
+    file_mods为索引所在提交中 {文件路径: [修改过它的MOD名称, ...]}，用于冲突归属；
+    merge_base为补丁所基于的版本，文本补丁失败时以它为基础尝试JSON结构化合并；
+    prediction为预检判定的冲突信息，此时跳过文本补丁直接尝试合并；
+    overlays为MOD中新增和整文件替换的文件 {文件路径: 对象ID}，在补丁之前直接写入索引；
+    semantic为MOD的键路径修改 {文件路径: [修改, ...]}，在当前文件上重放。
+    """
+    colored_print(f"[应用] MOD: {mod_name}", Colors.CYAN)
+    
+    if not os.path.exists(patch_file):
+        colored_print(f"[错误] 补丁文件不存在: {patch_file}", Colors.RED)
         return False
+    
+    # 整文件替换不经过文本补丁，被其他MOD修改过的文件按JSON结构合并
+    if overlays:
+        merged, conflicts = apply_overlays(temp_index, overlays)
+        if not merged:
+            report_file_conflicts(mod_name, conflicts, overlays, file_mods)
+            return False
+        colored_print(f"[成功] 已写入 {len(overlays)} 个整文件替换", Colors.GREEN)
+    
+    # 键路径修改只检查修改过的键，不受其他MOD在同一文件中其他位置的修改影响
+    if semantic:
+        applied, conflicts = apply_semantic_patch(temp_index, semantic)
+        if not applied:
+            report_file_conflicts(mod_name, conflicts, semantic, file_mods)
+            return False
+        colored_print(f"[成功] 已重放 {len(semantic)} 个文件的键路径修改", Colors.GREEN)
+    
+    # 没有局部修改时生成的是空补丁，无需应用；其他补丁即使无法解析也交给git apply报告错误
+    if os.path.basename(patch_file) == EMPTY_PATCH_NAME or os.path.getsize(patch_file) == 0:
+        return True
+    
+    # 尝试修复补丁文件编码
+    patch_file = prepare_patch_file(patch_file)
+    
+    stderr = ""
+    if prediction:
+        # 预检已判定文本补丁会冲突，不再做无用的尝试
+        colored_print(f"[预检] MOD {mod_name} 与已安装的MOD存在冲突", Colors.YELLOW)
+        for other, paths in prediction["conflicts"].items():
+            colored_print(f"[预检] 与 {other} 修改了相同位置: {', '.join(paths)}", Colors.YELLOW)
+        for path in prediction["missing"]:
+            colored_print(f"[预检] 文件状态与补丁不符: {path}", Colors.YELLOW)
+    else:
+        ok, stderr = temp_index.apply(patch_file)
+        if ok:
+            colored_print(f"[成功] 补丁已应用到索引", Colors.GREEN)
+            return True
+        colored_print(f"[警告] 应用补丁失败: {mod_name}", Colors.YELLOW)
+    
+    # 大多数冲突是两个MOD修改了同一JSON对象的不同键，尝试结构化合并
+    if merge_base:
+        merged, conflicts = merge_patch_into_index(temp_index, patch_file, merge_base, get_patch_paths(patch_file))
+        if merged:
+            colored_print(f"[合并] 已通过JSON结构化合并解决冲突", Colors.GREEN)
+            return True
+        for conflict in conflicts:
+            colored_print(f"[合并] 无法自动合并: {conflict}", Colors.YELLOW)
+    
+    report_index_conflicts(temp_index, patch_file, config_dir, mod_name, file_mods, stderr)
+    return False
+
+def report_file_conflicts(mod_name, conflicts, mod_files, file_mods):
+    """整文件替换或键路径修改无法应用时输出冲突归属，mod_files为MOD涉及的文件"""
+    colored_print(f"[错误] MOD文件存在冲突，无法自动解决", Colors.RED)
+    conflict_analysis = {}
+    for conflict in conflicts:
+        colored_print(f"[合并] 无法自动合并: {conflict}", Colors.YELLOW)
+        rel_path = conflict.split(': ', 1)[0]
+        if rel_path not in mod_files:
+            continue
+        conflict_mods = [name for name in file_mods.get(rel_path, []) if name != mod_name]
+        if conflict_mods:
+            colored_print(f"[提示] 以下MOD可能与当前MOD({mod_name})在文件 {rel_path} 上存在冲突: {', '.join(conflict_mods)}", Colors.YELLOW)
+        conflict_analysis[rel_path] = conflict_mods
+    if conflict_analysis:
+        emit(CONFLICT_DETECTED, mod=mod_name, files=conflict_analysis)
+
+def report_index_conflicts(temp_index, patch_file, config_dir, mod_name, file_mods, stderr=""):
+    """在临时目录中生成冲突文件并写入冲突分析"""
+    # 只导出补丁涉及的文件来生成.rej，避免扫描整个配置目录
+    scratch_dir, conflict_files = collect_rejects(temp_index, patch_file, get_patch_paths(patch_file))
+    try:
+        for rel_path, reject_path in conflict_files:
+            colored_print(f"[警告] 发现冲突文件: {rel_path}", Colors.YELLOW)
+        if conflict_files:
+            write_conflict_report(config_dir, mod_name, conflict_files, file_mods)
+        elif stderr.strip():
+            colored_print(f"[错误] {stderr.strip()}", Colors.RED)
+    finally:
+        remove_scratch_dir(scratch_dir)
 
 def install_mods():
     """安装MOD主函数"""
@@ -221,13 +342,12 @@ def install_mods():
             return False
         
         # 获取游戏版本日期
-        game_exe_path = os.path.join(game_path, "Sultan's Game.exe")
-        if not os.path.exists(game_exe_path):
+        game_exe_time = get_game_version_info(game_path)["exe_time"]
+        if not game_exe_time:
             colored_print("[错误] 找不到游戏可执行文件", Colors.RED)
             return False
         
-        game_mod_time = os.path.getmtime(game_exe_path)
-        game_version_date = datetime.fromtimestamp(game_mod_time).strftime("%Y%m%d")
+        game_version_date = game_exe_time.strftime("%Y%m%d")
         colored_print(f"[信息] 当前游戏版本日期: {game_version_date}", Colors.BLUE)
         
         # 切换到master分支
@@ -237,36 +357,20 @@ def install_mods():
             return False
         
         # 获取所有分支
-        stdout, stderr, code = run_git_command(['git', 'branch'], cwd=config_dir)
-        if code != 0:
-            colored_print(f"[错误] 无法获取分支列表: {stderr}", Colors.RED)
-            return False
-        
-        all_branches = stdout.strip().split('\n')
-        existing_branches = [b.strip().replace('* ', '') for b in all_branches if b.strip()]
+        ref_index = get_ref_index(config_dir)
         
-        # 删除所有failed_mod分支
+        # 删除所有failed_mod分支（一次命令删除全部）
         colored_print("[清理] 删除所有失败MOD分支...", Colors.BLUE)
-        failed_branches_count = 0
-        for branch in existing_branches:
-            if branch.startswith('failed_mod_'):
-                run_git_command(['git', 'branch', '-D', branch], cwd=config_dir, check=False)
-                failed_branches_count += 1
-        
-        if failed_branches_count > 0:
-            colored_print(f"[信息] 已删除 {failed_branches_count} 个失败MOD分支", Colors.BLUE)
+        old_failed_branches = ref_index.branches_with_prefix('failed_mod_')
+        if old_failed_branches:
+            run_git_command(['git', 'branch', '-D'] + old_failed_branches, cwd=config_dir, check=False)
+            colored_print(f"[信息] 已删除 {len(old_failed_branches)} 个失败MOD分支", Colors.BLUE)
         
-        # 创建MOD分支
+        # MOD分支，所有补丁先在临时索引中提交，最后只检出一次
         mod_branch = "mods_applied"
-        
-        # 检查是否已存在MOD分支，如果存在则删除
-        if mod_branch in existing_branches:
-            run_git_command(['git', 'branch', '-D', mod_branch], cwd=config_dir, check=False)
-        
-        # 创建新的MOD分支
-        stdout, stderr, code = run_git_command(['git', 'checkout', '-b', mod_branch], cwd=config_dir)
-        if code != 0:
-            colored_print(f"[错误] 无法创建MOD分支: {stderr}", Colors.RED)
+        base_commit = resolve_commit(config_dir, 'master')
+        if not base_commit:
+            colored_print("[错误] 无法获取主分支提交", Colors.RED)
             return False
         
         # 获取Mods目录
@@ -285,26 +389,23 @@ def install_mods():
         # 按照优先级排序MOD
         mod_list = []
         
-        for mod_name in os.listdir(mods_dir):
-            mod_dir = os.path.join(mods_dir, mod_name)
-            if not os.path.isdir(mod_dir):
-                continue
+        scan_phase = phase("scan")
+        for record in get_mod_catalog(mods_dir).refresh():
+            mod_name = record.name
+            mod_dir = record.dir
             
             # 查找modConfig.json文件
-            mod_config_file = os.path.join(mod_dir, "modConfig.json")
-            if not os.path.exists(mod_config_file):
+            if record.signature is None:
                 colored_print(f"[跳过] {mod_name} 没有modConfig.json文件", Colors.YELLOW)
                 continue
             
             # 读取配置文件
-            try:
-                with open(mod_config_file, 'r', encoding='utf-8') as f:
-                    mod_config = json.load(f)
-            except Exception as e:
-                colored_print(f"[错误] 无法读取配置文件 {mod_config_file}: {e}", Colors.RED)
+            if record.error:
+                colored_print(f"[错误] 无法读取配置文件 {record.config_file}: {record.error}", Colors.RED)
                 # 发生错误，执行还原操作
-                prepare_git_environment(game_path)
+                prepare_git_environment(game_path, force=True)
                 return False
+            mod_config = record.config
             
             # 检查是否有补丁文件
             if "patchFile" not in mod_config:
@@ -349,6 +450,8 @@ def install_mods():
         
         # 按优先级排序（数字越小优先级越高）
         mod_list.sort(key=lambda x: x["priority"])
+        scan_phase.finish()
+        emit(INSTALL_STARTED, total=len(mod_list))
         
         # 显示MOD安装顺序
         if mod_list:
@@ -359,171 +462,182 @@ def install_mods():
                              Colors.BLUE if mod_info['recommend'] <= 0 else Colors.GREEN)
         
         # 应用所有MOD补丁
-        current_branch = mod_branch
+        current_commit = base_commit
         failed_branches = []  # 用于记录失败MOD的分支
         failed_mod_sources = {}  # 用于记录失败MOD分支的来源，是否从mod分支签出
         
-        # 重新获取所有分支（可能在前面的操作中有变化）
-        stdout, stderr, code = run_git_command(['git', 'branch'], cwd=config_dir)
-        if code == 0:
-            all_branches = stdout.strip().split('\n')
-            existing_branches = [b.strip().replace('* ', '') for b in all_branches if b.strip()]
-        
         # 创建MOD名称到分支名称的映射
         mod_branch_map = {}
-        for branch in existing_branches:
-            # 查找所有以mod_开头的分支
-            if branch.startswith('mod_'):
-                # 尝试从分支名中提取MOD名称
-                mod_branch_map[branch] = branch[4:]  # 移除'mod_'前缀
-        
-        for i, mod_info in enumerate(mod_list):
-            mod_name = mod_info["name"]
-            mod_dir = mod_info["dir"]
-            mod_config = mod_info["config"]
-            
-            total_count += 1
-            
-            # 获取补丁文件路径
-            patch_file = os.path.join(mod_dir, mod_config["patchFile"])
-            
-            # 应用补丁
-            colored_print(f"\n[应用] MOD ({i+1}/{len(mod_list)}): {mod_name}", Colors.CYAN + Colors.BOLD)
-            
-            # 确保我们在主MOD分支上开始安装
-            stdout, stderr, code = run_git_command(['git', 'checkout', current_branch], cwd=config_dir, check=False)
-            if code != 0:
-                colored_print(f"[警告] 无法切换到主MOD分支 {current_branch}，尝试恢复...", Colors.YELLOW)
-                # 尝试切换到master分支并重新创建MOD分支
-                run_git_command(['git', 'checkout', 'master'], cwd=config_dir, check=False)
-                if mod_branch in run_git_command(['git', 'branch'], cwd=config_dir)[0]:
-                    run_git_command(['git', 'branch', '-D', mod_branch], cwd=config_dir, check=False)
-                run_git_command(['git', 'checkout', '-b', mod_branch], cwd=config_dir, check=False)
-                current_branch = mod_branch
+        for branch in ref_index.branches_with_prefix('mod_'):
+            # 尝试从分支名中提取MOD名称
+            mod_branch_map[branch] = branch[4:]  # 移除'mod_'前缀
+        
+        # 预检：并发解析所有补丁，找出与前面MOD冲突的MOD
+        with phase("precheck"):
+            precheck = precheck_mods(
+                config_dir, base_commit,
+                [(m["name"], os.path.join(m["dir"], m["config"]["patchFile"])) for m in mod_list]
+            )
+        predicted_failures = precheck["failures"]
+        if predicted_failures:
+            colored_print(f"[预检] 预计 {len(predicted_failures)} 个MOD存在冲突: {', '.join(predicted_failures)}", Colors.YELLOW)
+        applied_mods = set()
+        
+        # 记录每个文件被哪些已安装的MOD修改过，用于冲突归属
+        # 主分支是纯净的游戏版本，只需在安装过程中随提交增量记录
+        file_mods = {}
+        
+        # 安装结果缓存，键从基础提交开始逐个补丁滚动计算
+        # 使用提交而不是树：缓存的提交链以基础提交为父提交，树相同的其他提交不能复用
+        install_cache = InstallCache(config_dir)
+        cache_key = base_commit
+        # 上次安装的提交链，相同前缀的MOD直接复用，只重放之后的部分
+        step_commits = load_step_commits(config_dir, mod_branch, base_commit) if ref_index.has_branch(mod_branch) else {}
+        
+        mods_index = TempIndex(config_dir, mod_branch)
+        failed_index = TempIndex(config_dir, "failed_mod")
+        apply_phase = phase("apply")
+        try:
+            if not mods_index.read_tree(base_commit):
+                colored_print("[错误] 无法创建临时索引", Colors.RED)
+                return False
+            index_commit = base_commit
             
-            # 在当前MOD分支上尝试应用补丁
-            if apply_patch(patch_file, config_dir, mod_name, mod_config):
-                success_count += 1
-                colored_print(f"[成功] MOD {mod_name} 应用成功", Colors.GREEN)
-            else:
-                failed_count += 1
-                colored_print(f"[失败] MOD {mod_name} 应用失败，尝试在新分支上安装", Colors.RED)
+            for i, mod_info in enumerate(mod_list):
+                mod_name = mod_info["name"]
+                mod_dir = mod_info["dir"]
+                mod_config = mod_info["config"]
+                
+                total_count += 1
+                
+                # 获取补丁文件路径
+                patch_file = os.path.join(mod_dir, mod_config["patchFile"])
+                
+                # 应用补丁
+                colored_print(f"\n[应用] MOD ({i+1}/{len(mod_list)}): {mod_name}", Colors.CYAN + Colors.BOLD)
+                emit(MOD_STARTED, mod=mod_name, index=i + 1, total=len(mod_list))
+                mod_start = time.perf_counter()
                 
-                # 舍弃所有未提交的更改
-                run_git_command(['git', 'reset', '--hard'], cwd=config_dir, check=False)
+                # 新增和整文件替换的文件以及键路径修改，内容签名一起参与缓存键
+                overlays = load_overlays(config_dir, mod_dir)
+                semantic = load_semantic_patch(mod_dir)
                 
-                # 从主分支切出新分支尝试安装失败的MOD
-                stdout, stderr, code = run_git_command(['git', 'checkout', 'master'], cwd=config_dir)
-                if code != 0:
-                    colored_print(f"[错误] 无法切换到主分支: {stderr}", Colors.RED)
-                    # 尝试切回原MOD分支
-                    run_git_command(['git', 'checkout', current_branch], cwd=config_dir, check=False)
+                # 相同基础和相同补丁序列已安装过时直接复用缓存的提交
+                commit_message = build_commit_message(mod_name, mod_config)
+                step_message = commit_message + overlay_signature(overlays) + semantic_signature(semantic)
+                cache_key = hash_patch_step(cache_key, patch_file, step_message) if cache_key and os.path.exists(patch_file) else None
+                cached_commit = None
+                if cache_key:
+                    cached_commit = step_commits.get(cache_key) or install_cache.lookup(cache_key)
+                if cached_commit:
+                    current_commit = cached_commit
+                    applied_mods.add(mod_name)
+                    record_mod_paths(file_mods, mod_name, get_patch_paths(patch_file) + list(overlays) + list(semantic))
+                    success_count += 1
+                    colored_print(f"[缓存] MOD {mod_name} 使用缓存的安装结果", Colors.GREEN)
+                    emit(MOD_APPLIED, mod=mod_name, seconds=round(time.perf_counter() - mod_start, 3), cached=True)
                     continue
                 
+                # 缓存命中后索引可能落后于当前提交
+                if index_commit != current_commit:
+                    mods_index.read_tree(current_commit)
+                    index_commit = current_commit
+                
+                # 预检结果只在冲突对象确实已安装时成立
+                prediction = predicted_failures.get(mod_name)
+                if prediction and not prediction["missing"] and not applied_mods.intersection(prediction["conflicts"]):
+                    prediction = None
+                
+                # 在MOD索引上尝试应用补丁
+                # 结构化合并需要补丁生成时的游戏版本，游戏更新后它与当前的基础提交不同
+                patch_base = get_patch_base(config_dir, mod_dir) or base_commit
+                if apply_patch_to_index(mods_index, patch_file, config_dir, mod_name, file_mods, patch_base, prediction, overlays, semantic):
+                    tree = mods_index.write_tree()
+                    new_commit = None
+                    if tree:
+                        if cache_key:
+                            commit_message = add_step_trailer(commit_message, cache_key)
+                        new_commit = commit_tree(config_dir, tree, [current_commit], commit_message)
+                    if new_commit:
+                        current_commit = new_commit
+                        index_commit = new_commit
+                        if cache_key:
+                            install_cache.store(cache_key, new_commit)
+                        applied_mods.add(mod_name)
+                        record_mod_paths(file_mods, mod_name, get_patch_paths(patch_file) + list(overlays) + list(semantic))
+                        success_count += 1
+                        colored_print(f"[成功] MOD {mod_name} 应用成功", Colors.GREEN)
+                        emit(MOD_APPLIED, mod=mod_name, seconds=round(time.perf_counter() - mod_start, 3), cached=False)
+                        continue
+                    colored_print(f"[错误] 无法提交MOD {mod_name}", Colors.RED)
+                
+                # 失败时索引可能已被部分修改，下次应用前恢复到当前提交
+                index_commit = None
+                
+                failed_count += 1
+                colored_print(f"[失败] MOD {mod_name} 应用失败，尝试在新分支上安装", Colors.RED)
+                
                 # 创建失败MOD的专用分支，确保分支名称有效
                 safe_mod_name = generate_safe_branch_name(mod_name)
                 failed_branch = f"failed_mod_{safe_mod_name}"
                 
-                # 查找是否有对应的mod分支
+                # 查找是否有对应的mod分支，优先精确匹配
                 mod_branch_found = None
-                for branch, branch_mod_name in mod_branch_map.items():
-                    if safe_mod_name == branch_mod_name or safe_mod_name in branch_mod_name or branch_mod_name in safe_mod_name:
-                        mod_branch_found = branch
-                        break
-                
-                # 记录失败MOD的来源
-                from_mod_branch = False
+                if ref_index.has_branch(f"mod_{safe_mod_name}"):
+                    mod_branch_found = f"mod_{safe_mod_name}"
+                else:
+                    for branch, branch_mod_name in mod_branch_map.items():
+                        if safe_mod_name == branch_mod_name or safe_mod_name in branch_mod_name or branch_mod_name in safe_mod_name:
+                            mod_branch_found = branch
+                            break
                 
-                if mod_branch_found:
+                # 如果mod分支基于当前的主分支，直接作为失败分支
+                if mod_branch_found and is_ancestor(config_dir, base_commit, mod_branch_found):
                     colored_print(f"[信息] 找到对应的MOD分支: {mod_branch_found}", Colors.BLUE)
-                    # 从mod分支签出作为新的failed_mod分支
-                    stdout, stderr, code = run_git_command(['git', 'checkout', mod_branch_found], cwd=config_dir)
-                    if code == 0:
-                        # 创建新的失败分支
-                        stdout, stderr, code = run_git_command(['git', 'checkout', '-b', failed_branch], cwd=config_dir)
-                        if code == 0:
-                            colored_print(f"[信息] 从MOD分支 {mod_branch_found} 创建失败分支 {failed_branch}", Colors.BLUE)
-                            from_mod_branch = True
-                            
-                            # 检查该分支是否已经应用了该MOD
-                            stdout, stderr, code = run_git_command(['git', 'log', '--grep', f"应用MOD: {mod_name}"], cwd=config_dir, check=False)
-                            if stdout and "应用MOD:" in stdout:
-                                colored_print(f"[信息] 分支已经应用了MOD {mod_name}，尝试从master合并代码", Colors.BLUE)
-                                
-                                # 从master合并代码
-                                stdout, stderr, code = run_git_command(['git', 'merge', 'master', '--no-commit'], cwd=config_dir, check=False)
-                                if code == 0:
-                                    colored_print(f"[信息] 成功从master合并代码到 {failed_branch}", Colors.GREEN)
-                                    failed_branches.append(failed_branch)
-                                    failed_mod_sources[failed_branch] = from_mod_branch
-                                    continue
-                                else:
-                                    colored_print(f"[警告] 从master合并代码失败: {stderr}", Colors.YELLOW)
-                                    # 中止合并
-                                    run_git_command(['git', 'merge', '--abort'], cwd=config_dir, check=False)
-                        else:
-                            colored_print(f"[错误] 无法创建失败分支 {failed_branch}: {stderr}", Colors.RED)
-                            # 切回master
-                            run_git_command(['git', 'checkout', 'master'], cwd=config_dir, check=False)
-                    else:
-                        colored_print(f"[错误] 无法切换到MOD分支 {mod_branch_found}: {stderr}", Colors.RED)
-                
-                # 如果没有找到对应的mod分支或者上述操作失败，则从master创建新分支
-                stdout, stderr, code = run_git_command(['git', 'checkout', 'master'], cwd=config_dir)
-                if code != 0:
-                    colored_print(f"[错误] 无法切换到主分支: {stderr}", Colors.RED)
-                    # 尝试切回原MOD分支
-                    run_git_command(['git', 'checkout', current_branch], cwd=config_dir, check=False)
-                    continue
-                
-                # 创建新分支
-                stdout, stderr, code = run_git_command(['git', 'checkout', '-b', failed_branch], cwd=config_dir)
-                if code != 0:
-                    colored_print(f"[错误] 无法创建失败MOD分支 {failed_branch}: {stderr}", Colors.RED)
-                    # 尝试切回原MOD分支
-                    run_git_command(['git', 'checkout', current_branch], cwd=config_dir, check=False)
-                    continue
+                    if run_git_command(['git', 'branch', '-f', failed_branch, mod_branch_found], cwd=config_dir, check=False)[2] == 0:
+                        colored_print(f"[信息] 从MOD分支 {mod_branch_found} 创建失败分支 {failed_branch}", Colors.BLUE)
+                        failed_branches.append(failed_branch)
+                        failed_mod_sources[failed_branch] = True
+                        emit(MOD_FAILED, mod=mod_name, seconds=round(time.perf_counter() - mod_start, 3), branch=failed_branch)
+                        continue
+                    colored_print(f"[错误] 无法创建失败分支 {failed_branch}", Colors.RED)
                 
-                # 在新分支上尝试应用补丁
+                # 否则在主分支的基础上单独应用该MOD
                 colored_print(f"[尝试] 在新分支 {failed_branch} 上安装MOD: {mod_name}", Colors.CYAN)
-                if apply_patch(patch_file, config_dir, mod_name, mod_config):
+                failed_index.read_tree(base_commit)
+                failed_commit = None
+                if apply_patch_to_index(failed_index, patch_file, config_dir, mod_name, {}, overlays=overlays, semantic=semantic):
+                    tree = failed_index.write_tree()
+                    if tree:
+                        failed_commit = commit_tree(config_dir, tree, [base_commit], build_commit_message(mod_name, mod_config))
+                
+                if failed_commit and update_branch(config_dir, failed_branch, failed_commit):
                     colored_print(f"[信息] MOD {mod_name} 在独立分支上安装成功", Colors.GREEN)
                     colored_print(f"[信息] 您可以稍后手动解决冲突并合并此分支", Colors.BLUE)
                     failed_branches.append(failed_branch)
-                    failed_mod_sources[failed_branch] = from_mod_branch
+                    failed_mod_sources[failed_branch] = False
                 else:
                     colored_print(f"[信息] MOD {mod_name} 在独立分支上也安装失败", Colors.RED)
-                
-                # 确保工作目录干净，移除所有未跟踪的文件
-                colored_print(f"[清理] 移除所有未跟踪的文件...", Colors.BLUE)
-                run_git_command(['git', 'clean', '-fd'], cwd=config_dir, check=False)
-                
-                # 切回原MOD分支继续安装其他MOD
-                stdout, stderr, code = run_git_command(['git', 'checkout', current_branch], cwd=config_dir)
-                if code != 0:
-                    colored_print(f"[错误] 无法切回MOD分支 {current_branch}: {stderr}", Colors.RED)
-                    # 再次尝试清理并切换
-                    run_git_command(['git', 'reset', '--hard'], cwd=config_dir, check=False)
-                    run_git_command(['git', 'clean', '-fd'], cwd=config_dir, check=False)
-                    
-                    stdout, stderr, code = run_git_command(['git', 'checkout', current_branch], cwd=config_dir)
-                    if code != 0:
-                        # 这是一个严重错误，但我们尝试恢复
-                        colored_print(f"[错误] 再次尝试切回失败，尝试从主分支重新创建MOD分支", Colors.RED)
-                        stdout, stderr, code = run_git_command(['git', 'checkout', 'master'], cwd=config_dir)
-                        if code == 0:
-                            # 重新创建MOD分支
-                            if mod_branch in run_git_command(['git', 'branch'], cwd=config_dir)[0]:
-                                run_git_command(['git', 'branch', '-D', mod_branch], cwd=config_dir, check=False)
-                            run_git_command(['git', 'checkout', '-b', mod_branch], cwd=config_dir, check=False)
-                            current_branch = mod_branch
-                        else:
-                            return False
-        
-        # 如果至少有一个MOD成功应用，确保我们在主MOD分支上
+                    failed_branch = None
+                emit(MOD_FAILED, mod=mod_name, seconds=round(time.perf_counter() - mod_start, 3), branch=failed_branch)
+        finally:
+            apply_phase.finish()
+            mods_index.close()
+            failed_index.close()
+            install_cache.save()
+        
+        emit(INSTALL_FINISHED, success=success_count, failed=failed_count,
+             skipped=skipped_count, ignored=ignored_count)
+        
+        # 如果至少有一个MOD成功应用，更新MOD分支并检出（工作目录只改动一次）
         if success_count > 0:
-            # 确保我们在主MOD分支上
-            stdout, stderr, code = run_git_command(['git', 'checkout', mod_branch], cwd=config_dir)
+            if not update_branch(config_dir, mod_branch, current_commit):
+                colored_print(f"[错误] 无法更新MOD分支 {mod_branch}", Colors.RED)
+                return False
+            
+            colored_print(f"\n[检出] 正在将安装结果写入游戏目录...", Colors.BLUE)
+            with phase("checkout"):
+                stdout, stderr, code = run_git_command(['git', 'checkout', '-f', mod_branch], cwd=config_dir)
             if code != 0:
                 colored_print(f"[错误] 无法切换到主MOD分支: {stderr}", Colors.RED)
                 return False
@@ -531,30 +645,17 @@ def install_mods():
             colored_print(f"\n[完成] 共处理 {total_count} 个MOD，成功 {success_count} 个，失败 {failed_count} 个，跳过 {skipped_count} 个，忽略 {ignored_count} 个", Colors.GREEN + Colors.BOLD)
             
             # 显示失败MOD的分支信息
+            existing_failed_branches = []
             if failed_count > 0:
                 colored_print("\n[信息] 以下MOD在独立分支上安装，您可以稍后手动解决冲突:", Colors.YELLOW)
                 
-                # 获取当前存在的分支列表
-                stdout, stderr, code = run_git_command(['git', 'branch'], cwd=config_dir)
-                existing_branches = []
-                if code == 0:
-                    all_branches = stdout.strip().split('\n')
-                    existing_branches = [b.strip().replace('* ', '') for b in all_branches]
-                
                 # 检查记录的失败分支是否仍然存在
-                existing_failed_branches = []
                 for branch in failed_branches:
-                    if branch in existing_branches:
+                    if ref_index.has_branch(branch):
                         existing_failed_branches.append(branch)
                     else:
                         colored_print(f"[警告] 分支 {branch} 已不存在，可能在处理过程中被删除", Colors.YELLOW)
                 
-                # 如果没有找到任何失败分支，再次尝试从所有分支中查找
-                if not existing_failed_branches:
-                    existing_failed_branches = [b for b in existing_branches if b.startswith('failed_mod_')]
-                    if existing_failed_branches:
-                        colored_print("[信息] 从现有分支中找到以下失败MOD分支:", Colors.BLUE)
-                
                 # 显示失败分支
                 if existing_failed_branches:
                     for i, branch in enumerate(existing_failed_branches, 1):
@@ -570,39 +671,21 @@ def install_mods():
                             mod_branch_name = f"mod_{mod_name}"
                             
                             # 检查mod分支是否已存在
-                            if mod_branch_name in existing_branches:
+                            if ref_index.has_branch(mod_branch_name):
                                 colored_print(f"[跳过] MOD分支 {mod_branch_name} 已存在", Colors.BLUE)
                                 continue
                             
-                            # 切换到失败分支
-                            stdout, stderr, code = run_git_command(['git', 'checkout', branch], cwd=config_dir)
+                            # 创建mod分支（不需要切换分支）
+                            stdout, stderr, code = run_git_command(['git', 'branch', mod_branch_name, branch], cwd=config_dir, check=False)
                             if code == 0:
-                                # 创建mod分支
-                                stdout, stderr, code = run_git_command(['git', 'checkout', '-b', mod_branch_name], cwd=config_dir)
-                                if code == 0:
-                                    colored_print(f"[成功] 从失败分支 {branch} 创建MOD分支 {mod_branch_name}", Colors.GREEN)
-                                else:
-                                    colored_print(f"[错误] 无法创建MOD分支 {mod_branch_name}: {stderr}", Colors.RED)
+                                colored_print(f"[成功] 从失败分支 {branch} 创建MOD分支 {mod_branch_name}", Colors.GREEN)
                             else:
-                                colored_print(f"[错误] 无法切换到失败分支 {branch}: {stderr}", Colors.RED)
-                    
-                    # 切回主MOD分支
-                    run_git_command(['git', 'checkout', mod_branch], cwd=config_dir, check=False)
+                                colored_print(f"[错误] 无法创建MOD分支 {mod_branch_name}: {stderr}", Colors.RED)
                     
                     colored_print("\n[提示] 您可以使用以下命令查看和合并这些分支:", Colors.CYAN)
                     colored_print("  git checkout <分支名>  # 切换到分支", Colors.CYAN)
                     colored_print("  git checkout mods_applied  # 切回MOD主分支", Colors.CYAN)
                     colored_print("  git merge <分支名>  # 合并分支", Colors.CYAN)
-
-                    colored_print("[检查] 验证失败MOD分支是否存在...", Colors.BLUE)
-                    stdout, stderr, code = run_git_command(['git', 'branch'], cwd=config_dir)
-                    if code == 0:
-                        existing_branches = stdout.strip().split('\n')
-                        existing_branches = [b.strip().replace('* ', '') for b in existing_branches]
-                        
-                        for branch in failed_branches:
-                            if branch not in existing_branches:
-                                colored_print(f"[警告] 失败MOD分支 {branch} 不存在，尝试恢复...", Colors.YELLOW)
                 else:
                     colored_print("[警告] 未找到任何失败MOD的分支，可能在处理过程中被删除", Colors.YELLOW)
             
@@ -610,41 +693,35 @@ def install_mods():
             current_date = datetime.now().strftime("%Y%m%d_%H%M%S")
             history_branch = f"history_{current_date}"
             
-            # 清理未提交的更改
-            run_git_command(['git', 'reset', '--hard'], cwd=config_dir, check=False)
-            
             # 创建历史版本分支
             colored_print(f"\n[历史版本] 正在创建历史版本分支: {history_branch}", Colors.BLUE)
-            stdout, stderr, code = run_git_command(['git', 'checkout', '-b', history_branch], cwd=config_dir)
-            if code == 0:
-                # 添加说明注释
-                commit_msg = f"历史版本 {current_date}\n\n"
-                commit_msg += f"成功安装MOD数量: {success_count}\n"
-                commit_msg += f"跳过MOD数量: {skipped_count}\n"
-                commit_msg += f"失败MOD数量: {failed_count}\n"
-                
-                # 如果有失败的MOD，添加到注释中
-                if failed_count > 0 and existing_failed_branches:
-                    commit_msg += "\n失败MOD分支:\n"
-                    for branch in existing_failed_branches:
-                        commit_msg += f"- {branch}\n"
-                
-                # 创建空提交，添加说明信息
-                stdout, stderr, code = run_git_command(['git', 'commit', '--allow-empty', '-m', commit_msg], cwd=config_dir)
-                if code == 0:
-                    colored_print(f"[成功] 已创建历史版本分支: {history_branch}", Colors.GREEN)
-                else:
-                    colored_print(f"[警告] 创建历史版本提交失败: {stderr}", Colors.YELLOW)
-                
-                # 切回MOD分支
-                run_git_command(['git', 'checkout', mod_branch], cwd=config_dir, check=False)
+            
+            # 添加说明注释
+            commit_msg = f"历史版本 {current_date}\n\n"
+            commit_msg += f"成功安装MOD数量: {success_count}\n"
+            commit_msg += f"跳过MOD数量: {skipped_count}\n"
+            commit_msg += f"失败MOD数量: {failed_count}\n"
+            
+            # 如果有失败的MOD，添加到注释中
+            if failed_count > 0 and existing_failed_branches:
+                commit_msg += "\n失败MOD分支:\n"
+                for branch in existing_failed_branches:
+                    commit_msg += f"- {branch}\n"
+            
+            # 创建空提交，添加说明信息
+            history_commit = commit_tree(config_dir, f"{current_commit}^{{tree}}", [current_commit], commit_msg)
+            if history_commit and update_branch(config_dir, history_branch, history_commit):
+                colored_print(f"[成功] 已创建历史版本分支: {history_branch}", Colors.GREEN)
             else:
-                colored_print(f"[警告] 创建历史版本分支失败: {stderr}", Colors.YELLOW)
+                colored_print(f"[警告] 创建历史版本分支失败", Colors.YELLOW)
             
             return True
         else:
             colored_print("\n[警告] 没有成功安装任何MOD", Colors.YELLOW)
-            prepare_git_environment(game_path)
+            # MOD分支可能还是上次的安装结果，重置到游戏版本，避免之后检出过时的内容
+            if ref_index.has_branch(mod_branch) and not update_branch(config_dir, mod_branch, base_commit):
+                colored_print(f"[警告] 无法重置MOD分支 {mod_branch}", Colors.YELLOW)
+            prepare_git_environment(game_path, force=True)
             return False
             
     except Exception as e:
@@ -653,7 +730,7 @@ def install_mods():
         try:
             game_path = get_game_path()
             if game_path:
-                prepare_git_environment(game_path)
+                prepare_git_environment(game_path, force=True)
         except:
             colored_print("[错误] 还原操作失败", Colors.RED)
         return False
@@ -664,6 +741,15 @@ def main():
     
     # 初始化安装状态变量
     install_success = True
+    
+    # 控制台输出各阶段耗时，完整事件写入程序目录下的JSONL文件
+    add_listener(console_listener)
+    event_writer = JsonlEventWriter(os.path.join(get_application_path(), INSTALL_EVENTS_FILE))
+    add_listener(event_writer)
+    
+    # 使用 --profile 参数或设置环境变量时生成性能报告
+    if "--profile" in sys.argv[1:]:
+        enable_profiling()
 
     try:
         # 获取游戏路径
@@ -673,18 +759,21 @@ def main():
             input("按任意键继续...")
             return
         
-        # 先检查并准备MOD配置
-        colored_print("[准备阶段] 检查MOD配置和补丁文件...", Colors.CYAN)
-        check_mod_configs()
+        with profile_session(get_application_path()):
+            # 先检查并准备MOD配置
+            colored_print("[准备阶段] 检查MOD配置和补丁文件...", Colors.CYAN)
+            check_mod_configs()
+            
+            # 安装MOD
+            colored_print("\n[安装阶段] 开始处理MOD文件...\n", Colors.CYAN)
+            install_ok = install_mods()
         
-        # 安装MOD
-        colored_print("\n[安装阶段] 开始处理MOD文件...\n", Colors.CYAN)
-        if install_mods():
+        if install_ok:
             colored_print("\n[完成] MOD安装成功", Colors.GREEN + Colors.BOLD)
         else:
             colored_print("\n[警告] MOD安装过程中出现问题，执行还原操作", Colors.YELLOW)
             if game_path:
-                prepare_git_environment(game_path)
+                prepare_git_environment(game_path, force=True)
     
     except Exception as e:
         colored_print(f"\n[错误] 发生异常: {e}", Colors.RED)
@@ -692,10 +781,13 @@ def main():
         try:
             game_path = get_game_path()
             if game_path:
-                prepare_git_environment(game_path)
+                prepare_git_environment(game_path, force=True)
         except:
             colored_print("[错误] 还原操作失败", Colors.RED)
         install_success = False
+    finally:
+        remove_listener(event_writer)
+        event_writer.close()
     
     # 询问用户是否要启动Git工具
     # if install_success:
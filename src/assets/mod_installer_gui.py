@@ -1,4 +1,5 @@
 import os
+import re
 import sys
 import json
 import threading
@@ -18,6 +19,15 @@ from common_utils import (
     Colors, colored_print, get_application_path
 )
 
+# 导入MOD列表
+from mod_catalog import get_mod_catalog
+
+# 导入安装事件
+import install_events
+from install_events import add_listener, remove_listener, console_listener, JsonlEventWriter
+from install_profile import profile_session
+from mod_installer import INSTALL_EVENTS_FILE
+
 # 创建一个自定义的输出重定向类，用于捕获控制台输出并显示在GUI中
 class TextRedirector:
     def __init__(self, text_widget, queue, tag=""):
@@ -39,6 +49,58 @@ class TextRedirector:
         """处理输入请求，避免打包后的stdin错误"""
         return ""  # 返回空字符串作为默认输入
 
+class ConfigWriter:
+    """在后台线程中延迟写入modConfig.json
+
+    同一个配置文件在延迟时间内的多次修改只写入最后一次，
+    延迟期间只保留一个定时器，到期后一次写入期间登记的所有修改。
+    写入时先写临时文件再替换，中途崩溃不会留下不完整的配置文件。
+    """
+
+    def __init__(self, delay=0.5):
+        self.delay = delay
+        self._pending = {}  # 配置文件路径 -> 配置内容
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._timer = None
+
+    def schedule(self, config_file, config):
+        """登记一次配置修改，延迟一段时间后统一写入"""
+        with self._lock:
+            # 保存副本，避免写入时界面线程继续修改
+            self._pending[config_file] = dict(config)
+            if self._timer is not None:
+                # 已有等待中的写入，到期时会一并写入本次修改
+                return
+            self._timer = threading.Timer(self.delay, self.flush)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def flush(self):
+        """立即写入所有未保存的修改"""
+        with self._flush_lock:
+            with self._lock:
+                pending = self._pending
+                self._pending = {}
+                if self._timer is not None:
+                    self._timer.cancel()
+                    self._timer = None
+            for config_file, config in pending.items():
+                try:
+                    write_json_atomic(config_file, config)
+                except Exception as e:
+                    colored_print(f"[错误] 无法更新MOD配置文件 {config_file}: {e}", Colors.RED)
+
+
+def write_json_atomic(path, data):
+    """先写入同目录下的临时文件，再替换目标文件"""
+    temp_file = path + ".tmp"
+    with open(temp_file, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp_file, path)
+
 # 颜色映射，将原来的控制台颜色映射到Tkinter标签
 COLOR_TAGS = {
     Colors.RED: "red",
@@ -56,6 +118,111 @@ COLOR_TAGS = {
     Colors.CYAN + Colors.BOLD: "cyan_bold",
 }
 
+# ANSI颜色代码 -> 文本标签（预先编译，避免逐条消息查找）
+ANSI_PATTERN = re.compile(r'\033\[([0-9;]*)m')
+ANSI_COLOR_CODES = {
+    color[2:-1]: tag_name for color, tag_name in COLOR_TAGS.items()
+    if color != Colors.BOLD and Colors.BOLD not in color
+}
+ANSI_BOLD_CODE = Colors.BOLD[2:-1]
+
+# 每次刷新最多处理的输出片段数，日志框最多保留的行数
+LOG_FRAGMENTS_PER_TICK = 2000
+LOG_MAX_LINES = 5000
+LOG_FILE_NAME = "mod_installer_gui.log"
+
+
+class LogSink:
+    """把标准输出批量写入日志文本框
+
+    每次刷新把队列中的片段合并后一次性插入，按ANSI颜色代码拆分为带标签的文本段。
+    日志框只保留最近的LOG_MAX_LINES行，完整日志同时写入日志文件。
+    """
+
+    def __init__(self, text_widget, msg_queue, log_path=None):
+        self.text_widget = text_widget
+        self.queue = msg_queue
+        self.color = ""
+        self.bold = False
+        self.log_file = None
+        if log_path:
+            try:
+                self.log_file = open(log_path, 'w', encoding='utf-8')
+            except OSError:
+                self.log_file = None
+
+    def _current_tag(self):
+        if self.color:
+            return f"{self.color}_bold" if self.bold else self.color
+        return "bold" if self.bold else ""
+
+    def _apply_codes(self, codes):
+        for code in (codes.split(';') if codes else ['0']):
+            if code in ('', '0'):
+                self.color = ""
+                self.bold = False
+            elif code == ANSI_BOLD_CODE:
+                self.bold = True
+            elif code in ANSI_COLOR_CODES:
+                self.color = ANSI_COLOR_CODES[code]
+
+    def split(self, text):
+        """按ANSI代码把文本拆分为 [文本, 标签, 文本, 标签, ...]，颜色状态跨片段保留"""
+        segments = []
+        position = 0
+        for match in ANSI_PATTERN.finditer(text):
+            if match.start() > position:
+                self._append(segments, text[position:match.start()])
+            self._apply_codes(match.group(1))
+            position = match.end()
+        if position < len(text):
+            self._append(segments, text[position:])
+        return segments
+
+    def _append(self, segments, chunk):
+        tag = self._current_tag()
+        # 相邻的同色文本合并为一段
+        if segments and segments[-1] == tag:
+            segments[-2] += chunk
+        else:
+            segments.extend((chunk, tag))
+
+    def drain(self):
+        """处理队列中的输出，返回队列中是否还有剩余"""
+        fragments = []
+        try:
+            while len(fragments) < LOG_FRAGMENTS_PER_TICK:
+                message, _ = self.queue.get_nowait()
+                fragments.append(message)
+        except queue.Empty:
+            pass
+        if not fragments:
+            return False
+
+        segments = self.split(''.join(fragments))
+        if self.log_file:
+            try:
+                self.log_file.write(''.join(segments[0::2]))
+                self.log_file.flush()
+            except OSError:
+                pass
+        if segments:
+            self.text_widget.insert(tk.END, *segments)
+            self.trim()
+            self.text_widget.see(tk.END)
+        return not self.queue.empty()
+
+    def trim(self):
+        """删除超出上限的旧日志行"""
+        line_count = int(self.text_widget.index('end-1c').split('.')[0])
+        if line_count > LOG_MAX_LINES:
+            self.text_widget.delete('1.0', f'{line_count - LOG_MAX_LINES + 1}.0')
+
+    def close(self):
+        if self.log_file:
+            self.log_file.close()
+            self.log_file = None
+
 # 在导入部分添加
 from tkinter import filedialog
 
@@ -161,7 +328,7 @@ class ModInstallerGUI:
         # 创建MOD列表视图 - 修改为支持编辑
         self.mod_tree = ttk.Treeview(
             mods_frame, 
-            columns=("name", "author", "version", "priority", "recommend"),
+            columns=("name", "author", "version", "priority", "recommend", "time"),
             show="tree headings",  # 修改为显示树形结构和表头
             selectmode="extended"
         )
@@ -173,6 +340,7 @@ class ModInstallerGUI:
         self.mod_tree.heading("version", text="版本")
         self.mod_tree.heading("priority", text="安装顺序")
         self.mod_tree.heading("recommend", text="推荐度")
+        self.mod_tree.heading("time", text="耗时")
         
         self.mod_tree.column("#0", width=50, stretch=False)  # 设置勾选列宽度
         self.mod_tree.column("name", width=250)
@@ -180,9 +348,10 @@ class ModInstallerGUI:
         self.mod_tree.column("version", width=80)
         self.mod_tree.column("priority", width=70)
         self.mod_tree.column("recommend", width=70)
+        self.mod_tree.column("time", width=70)
 
         # 在创建树形视图后添加列排序功能
-        for col in ("name", "author", "version", "priority", "recommend"):
+        for col in ("name", "author", "version", "priority", "recommend", "time"):
             self.mod_tree.heading(col, text=self.mod_tree.heading(col)["text"],
                                 command=lambda c=col: self.sort_treeview(c))
         
@@ -259,6 +428,11 @@ class ModInstallerGUI:
                 font=("TkDefaultFont", 10, "bold")
             )
         
+        # 创建安装进度条
+        self.progress = ttk.Progressbar(self.main_frame, mode="determinate")
+        self.progress.pack(fill=tk.X, pady=2)
+        self.event_queue = queue.Queue()
+        
         # 创建状态栏
         self.status_var = tk.StringVar()
         self.status_var.set("就绪")
@@ -267,10 +441,15 @@ class ModInstallerGUI:
         
         # 初始化数据
         self.mods = []
+        self.mod_items = {}  # 树项ID -> MOD
+        self.config_writer = ConfigWriter()
+        self.checked_count = 0
         self.selected_mods = set()
         
-        # 重定向标准输出
+        # 重定向标准输出（完整日志同时写入程序目录下的日志文件）
         self.old_stdout = sys.stdout
+        self.log_sink = LogSink(self.log_text, self.msg_queue,
+                                os.path.join(get_application_path(), LOG_FILE_NAME))
         sys.stdout = TextRedirector(self.log_text, self.msg_queue)
         
         # 设置周期性检查消息队列的任务
@@ -281,26 +460,45 @@ class ModInstallerGUI:
         self.load_mods()
     
     def check_queue(self):
-        """检查消息队列，更新日志文本框"""
+        """检查消息队列，批量更新日志文本框"""
+        backlog = False
+        try:
+            self.process_install_events()
+            backlog = self.log_sink.drain()
+        finally:
+            # 每100毫秒检查一次队列，输出积压时尽快继续处理
+            self.root.after(10 if backlog else 100, self.check_queue)
+    
+    def process_install_events(self):
+        """根据安装事件更新进度条、状态栏和MOD耗时列"""
         try:
             while True:
-                message, tag = self.msg_queue.get_nowait()
-                
-                # 处理颜色标签
-                current_tag = ""
-                for color, tag_name in COLOR_TAGS.items():
-                    if color in tag:
-                        current_tag = tag_name
-                        break
-                
-                self.log_text.insert(tk.END, message, current_tag)
-                self.log_text.see(tk.END)
-                self.msg_queue.task_done()
+                event = self.event_queue.get_nowait()
+                event_type = event["type"]
+                if event_type == install_events.INSTALL_STARTED:
+                    self.progress.configure(maximum=max(event["total"], 1), value=0)
+                elif event_type == install_events.MOD_STARTED:
+                    self.status_var.set(f"正在安装 ({event['index']}/{event['total']}): {event['mod']}")
+                elif event_type in (install_events.MOD_APPLIED, install_events.MOD_FAILED):
+                    self.progress.step(1)
+                    mod = self.mod_items.get(event["mod"])
+                    if mod:
+                        mod["seconds"] = event["seconds"]
+                        text = f"{event['seconds']:.2f}秒"
+                        if event_type == install_events.MOD_FAILED:
+                            text += " 失败"
+                        self.mod_tree.set(mod["item_id"], "time", text)
+                elif event_type == install_events.PHASE_STARTED:
+                    name = install_events.PHASE_NAMES.get(event["phase"], event["phase"])
+                    self.status_var.set(f"正在{name}...")
+                elif event_type == "status":
+                    self.status_var.set(event["text"])
         except queue.Empty:
             pass
-        finally:
-            # 每100毫秒检查一次队列
-            self.root.after(100, self.check_queue)
+    
+    def _post_status(self, text):
+        """从后台线程更新状态栏，与安装事件按顺序在界面线程中处理"""
+        self.event_queue.put({"type": "status", "text": text})
     
     def refresh_game_path(self):
         """刷新游戏路径"""
@@ -314,159 +512,167 @@ class ModInstallerGUI:
             messagebox.showerror("错误", "无法找到游戏路径，请确保游戏已安装。")
     
     def load_mods(self):
-        """加载可用的MOD列表"""
+        """加载可用的MOD列表：先用缓存立即显示，再在后台重新扫描Mods目录"""
+        # 获取应用程序路径
+        app_path = get_application_path()
+        mods_dir = os.path.join(app_path, "Mods")
+        
+        if not os.path.exists(mods_dir):
+            self.log_text.insert(tk.END, "[错误] Mods目录不存在\n", "red")
+            return
+        
+        catalog = get_mod_catalog(mods_dir)
+        
+        # 首次加载时先显示上次缓存的结果
+        if not self.mods:
+            cached_records = catalog.load_cached()
+            if cached_records:
+                self._populate_mods(cached_records, log_errors=False)
+                self.status_var.set(f"已加载 {len(self.mods)} 个MOD（正在检查更新...）")
+        
+        threading.Thread(target=self._refresh_catalog_thread, args=(catalog,), daemon=True).start()
+    
+    def _refresh_catalog_thread(self, catalog):
+        """在后台重新扫描Mods目录，完成后回到界面线程更新列表"""
         try:
-            # 清空现有列表
-            for item in self.mod_tree.get_children():
-                self.mod_tree.delete(item)
-            
-            self.mods = []
-            self.selected_mods = set()
-            
-            # 获取应用程序路径
-            app_path = get_application_path()
-            mods_dir = os.path.join(app_path, "Mods")
-            
-            if not os.path.exists(mods_dir):
-                self.log_text.insert(tk.END, "[错误] Mods目录不存在\n", "red")
-                return
-            
-            # 遍历Mods目录
-            for mod_name in os.listdir(mods_dir):
-                mod_dir = os.path.join(mods_dir, mod_name)
-                if not os.path.isdir(mod_dir):
+            # 先写入未保存的修改，避免扫描到旧的配置
+            self.config_writer.flush()
+            records = catalog.refresh()
+        except Exception as e:
+            self.root.after(0, self._on_load_mods_error, e)
+            return
+        self.root.after(0, self._populate_mods, records)
+    
+    def _on_load_mods_error(self, error):
+        self.log_text.insert(tk.END, f"[错误] 加载MOD列表时出错: {error}\n", "red")
+        self.status_var.set("加载MOD列表失败")
+    
+    def _populate_mods(self, records, log_errors=True):
+        """根据MOD记录刷新列表，只更新发生变化的行"""
+        try:
+            mods = []
+            for record in records:
+                # 没有modConfig.json文件
+                if record.signature is None:
                     continue
                 
-                # 查找modConfig.json文件
-                mod_config_file = os.path.join(mod_dir, "modConfig.json")
-                if not os.path.exists(mod_config_file):
+                if record.error:
+                    if log_errors:
+                        self.log_text.insert(tk.END, f"[错误] 无法读取配置文件 {record.config_file}: {record.error}\n", "red")
                     continue
                 
-                # 读取配置文件
-                try:
-                    with open(mod_config_file, 'r', encoding='utf-8') as f:
-                        mod_config = json.load(f)
-                    
-                    # 检查是否有补丁文件
-                    if "patchFile" not in mod_config:
-                        continue
-                    
-                    # 获取MOD信息
-                    author = mod_config.get("author", "未知")
-                    version = mod_config.get("version", "")
-                    priority = mod_config.get("priority", 100)
-                    recommend = mod_config.get("recommend", 3)  # 默认推荐度为3
-                    ignore = mod_config.get("ignore", False)
-                    
-                    # 添加到MOD列表
-                    self.mods.append({
-                        "name": mod_name,
-                        "dir": mod_dir,
-                        "config": mod_config,
-                        "config_file": mod_config_file,
-                        "author": author,
-                        "version": version,
-                        "priority": priority,
-                        "recommend": recommend,
-                        "ignore": ignore
-                    })
-                    
-                except Exception as e:
-                    self.log_text.insert(tk.END, f"[错误] 无法读取配置文件 {mod_config_file}: {e}\n", "red")
+                mod_config = record.config
+                
+                # 检查是否有补丁文件
+                if "patchFile" not in mod_config:
+                    continue
+                
+                # 添加到MOD列表（以MOD名称作为树项ID，刷新时可以直接找到原来的行）
+                mods.append({
+                    "name": record.name,
+                    "item_id": record.name,
+                    "dir": record.dir,
+                    "config": mod_config,
+                    "config_file": record.config_file,
+                    "author": mod_config.get("author", "未知"),
+                    "version": mod_config.get("version", ""),
+                    "priority": mod_config.get("priority", 100),
+                    "recommend": mod_config.get("recommend", 3),  # 默认推荐度为3
+                    "ignore": mod_config.get("ignore", False)
+                })
+            
+            # 删除已经不存在的MOD
+            new_ids = {mod["item_id"] for mod in mods}
+            removed = [item_id for item_id in self.mod_items if item_id not in new_ids]
+            if removed:
+                self.mod_tree.delete(*removed)
+            
+            # 更新或插入行 - 根据ignore字段决定是否选中
+            for mod in mods:
+                item_id = mod["item_id"]
+                text, values = self._row_of(mod)
+                old_mod = self.mod_items.get(item_id)
+                if old_mod is None:
+                    self.mod_tree.insert("", tk.END, iid=item_id, text=text, values=values, open=True)
+                elif self._row_of(old_mod) != (text, values):
+                    self.mod_tree.item(item_id, text=text, values=values)
             
-            # 按优先级排序，优先级相同时按推荐度逆序排序
-            self.mods.sort(key=lambda x: (x["priority"], -x["recommend"]))
+            self.mod_items = {mod["item_id"]: mod for mod in mods}
+            self.mods = mods
+            self.checked_count = sum(1 for mod in mods if not mod["ignore"])
             
-            # 更新树形视图 - 根据ignore字段决定是否选中
-            for mod in self.mods:
-                # 如果ignore为False，则选中
-                checked = "✓" if not mod["ignore"] else ""
-                
-                item_id = self.mod_tree.insert(
-                    "", 
-                    tk.END,
-                    text=checked,
-                    values=(mod["name"], mod["author"], mod["version"], mod["priority"], mod["recommend"]),
-                    open=True  # 默认展开
-                )
-                # 存储MOD名称和对应的树项ID的映射
-                mod["item_id"] = item_id
+            # 按优先级排序，优先级相同时按推荐度逆序排序
+            self._apply_default_order()
             
             # 添加点击事件绑定
             self.mod_tree.bind("<ButtonRelease-1>", self.on_tree_click)
             # 添加双击事件绑定
             self.mod_tree.bind("<Double-1>", self.on_tree_double_click)
             
+            self.update_select_all_state()
             self.status_var.set(f"已加载 {len(self.mods)} 个MOD")
             
         except Exception as e:
-            self.log_text.insert(tk.END, f"[错误] 加载MOD列表时出错: {e}\n", "red")
-            self.status_var.set("加载MOD列表失败")
+            self._on_load_mods_error(e)
+    
+    @staticmethod
+    def _row_of(mod):
+        """MOD在树形视图中显示的勾选标记和各列的值"""
+        checked = "✓" if not mod["ignore"] else ""
+        return checked, (mod["name"], mod["author"], mod["version"], mod["priority"], mod["recommend"])
+    
+    def _reorder_rows(self, ordered_ids):
+        """按给定顺序排列树形视图，只移动位置不对的行"""
+        current = list(self.mod_tree.get_children(''))
+        if current == ordered_ids:
+            return
+        for index, item_id in enumerate(ordered_ids):
+            if current[index] != item_id:
+                self.mod_tree.move(item_id, '', index)
+                current.remove(item_id)
+                current.insert(index, item_id)
+    
+    def _apply_default_order(self):
+        """按优先级排序，优先级相同时按推荐度逆序排序"""
+        self.mods.sort(key=lambda x: (x["priority"], -x["recommend"]))
+        self._reorder_rows([mod["item_id"] for mod in self.mods])
+    
+    def _save_mod_config(self, mod):
+        """把MOD的配置交给后台写入modConfig.json"""
+        self.config_writer.schedule(mod["config_file"], mod["config"])
+    
+    def _set_mod_checked(self, mod, checked):
+        """设置MOD的勾选状态并更新配置文件，状态未变化时返回False"""
+        if mod["ignore"] != checked:
+            return False
+        mod["ignore"] = not checked
+        self.checked_count += 1 if checked else -1
+        self.mod_tree.item(mod["item_id"], text="✓" if checked else "")
+        
+        # 更新配置文件
+        mod["config"]["ignore"] = mod["ignore"]
+        self._save_mod_config(mod)
+        return True
     
     def on_tree_click(self, event):
         """处理树形视图的点击事件，实现勾选/取消勾选功能并更新配置文件"""
         region = self.mod_tree.identify_region(event.x, event.y)
         if region == "tree":  # 点击在树形图标区域
             item_id = self.mod_tree.identify_row(event.y)
-            if item_id:  # 确保点击在有效行上
-                # 获取当前项的值
-                current_text = self.mod_tree.item(item_id, "text")
-                
-                # 切换勾选状态
-                new_state = "" if current_text == "✓" else "✓"
-                self.mod_tree.item(item_id, text=new_state)
-                
-                # 更新MOD配置文件中的ignore字段
-                for mod in self.mods:
-                    if mod["item_id"] == item_id:
-                        # 更新ignore字段（选中时ignore为False）
-                        mod["ignore"] = (new_state != "✓")
-                        
-                        # 更新配置文件
-                        try:
-                            mod["config"]["ignore"] = mod["ignore"]
-                            with open(mod["config_file"], 'w', encoding='utf-8') as f:
-                                json.dump(mod["config"], f, ensure_ascii=False, indent=2)
-                            
-                            colored_print(f"[更新] 已更新MOD '{mod['name']}' 的安装状态为: {'不安装' if mod['ignore'] else '安装'}", Colors.BLUE)
-                        except Exception as e:
-                            colored_print(f"[错误] 无法更新MOD配置文件: {e}", Colors.RED)
-                        break
+            mod = self.mod_items.get(item_id)
+            if mod:  # 确保点击在有效行上
+                # 切换勾选状态（选中时ignore为False）
+                self._set_mod_checked(mod, mod["ignore"])
+                colored_print(f"[更新] 已更新MOD '{mod['name']}' 的安装状态为: {'不安装' if mod['ignore'] else '安装'}", Colors.BLUE)
                 
                 # 更新全选状态
                 self.update_select_all_state()
     
     def update_select_all_state(self):
         """更新全选复选框的状态"""
-        all_items = self.mod_tree.get_children()
-        if not all_items:
-            self.select_all_var.set(False)
-            return
-            
-        # 检查是否所有项目都被选中
-        all_selected = all(self.mod_tree.item(item, "text") == "✓" for item in all_items)
-        
-        # 如果状态发生变化，则更新复选框状态
-        current_state = self.select_all_var.get()
-        if current_state != all_selected:
+        all_selected = bool(self.mod_items) and self.checked_count == len(self.mod_items)
+        if self.select_all_var.get() != all_selected:
             self.select_all_var.set(all_selected)
-            
-            # 更新所有MOD的配置文件
-            for mod in self.mods:
-                item_id = mod["item_id"]
-                is_selected = self.mod_tree.item(item_id, "text") == "✓"
-                
-                # 如果配置中的ignore状态与当前选中状态不一致，则更新配置文件
-                if mod["ignore"] == is_selected:  # ignore为True表示不选中
-                    mod["ignore"] = not is_selected
-                    
-                    # 更新配置文件
-                    try:
-                        mod["config"]["ignore"] = mod["ignore"]
-                        with open(mod["config_file"], 'w', encoding='utf-8') as f:
-                            json.dump(mod["config"], f, ensure_ascii=False, indent=2)
-                    except Exception as e:
-                        colored_print(f"[错误] 无法更新MOD配置文件: {e}", Colors.RED)
         
     def on_tree_double_click(self, event):
         """处理树形视图的双击事件，允许编辑字段"""
@@ -534,21 +740,16 @@ class ModInstallerGUI:
         self.mod_tree.item(item_id, values=current_values)
         
         # 更新MOD配置
-        for mod in self.mods:
-            if mod["item_id"] == item_id:
-                # 更新内存中的值
-                mod[column_name] = new_value
-                
-                # 更新配置文件
-                try:
-                    mod["config"][column_name] = new_value
-                    with open(mod["config_file"], 'w', encoding='utf-8') as f:
-                        json.dump(mod["config"], f, ensure_ascii=False, indent=2)
-                    
-                    colored_print(f"[更新] 已更新MOD '{mod['name']}' 的 {column_name} 为: {new_value}", Colors.BLUE)
-                except Exception as e:
-                    colored_print(f"[错误] 无法更新MOD配置文件: {e}", Colors.RED)
-                break
+        mod = self.mod_items.get(item_id)
+        if mod:
+            # 更新内存中的值
+            mod[column_name] = new_value
+            
+            # 更新配置文件
+            mod["config"][column_name] = new_value
+            self._save_mod_config(mod)
+            
+            colored_print(f"[更新] 已更新MOD '{mod['name']}' 的 {column_name} 为: {new_value}", Colors.BLUE)
         
         # 如果修改了优先级，重新排序
         if column_name == "priority":
@@ -568,78 +769,44 @@ class ModInstallerGUI:
         else:
             self.sort_reverse[col] = not self.sort_reverse[col]
         
-        # 获取所有项目
-        items = [(self.mod_tree.set(item, col), item) for item in self.mod_tree.get_children('')]
+        # 使用内存中的MOD数据排序，不逐行读取树形视图
+        def to_int(value):
+            try:
+                return int(value)
+            except (TypeError, ValueError):
+                return 0
+        
+        mods = list(self.mods)
         
         # 根据列类型进行排序
         if col == "priority":
             # 优先级排序，相同时按推荐度逆序
-            items.sort(key=lambda x: (
-                int(x[0]) if x[0].isdigit() else 0,
-                -int(self.mod_tree.set(x[1], "recommend")) if self.mod_tree.set(x[1], "recommend").isdigit() else 0
-            ), reverse=self.sort_reverse[col])
+            mods.sort(key=lambda mod: (to_int(mod["priority"]), -to_int(mod["recommend"])),
+                      reverse=self.sort_reverse[col])
         elif col == "recommend":
             # 推荐度排序
-            items.sort(key=lambda x: int(x[0]) if x[0].isdigit() else 0, 
+            mods.sort(key=lambda mod: to_int(mod["recommend"]),
                       reverse=not self.sort_reverse[col])  # 推荐度默认降序
+        elif col == "time":
+            # 耗时排序，未安装的MOD排在最后
+            mods.sort(key=lambda mod: mod.get("seconds", float("inf")), reverse=self.sort_reverse[col])
         else:
             # 字符串排序
-            items.sort(key=lambda x: x[0].lower(), reverse=self.sort_reverse[col])
+            mods.sort(key=lambda mod: str(mod[col]).lower(), reverse=self.sort_reverse[col])
         
-        # 重新排列项目
-        for index, (val, item) in enumerate(items):
-            self.mod_tree.move(item, '', index)
+        # 只移动位置发生变化的行
+        self._reorder_rows([mod["item_id"] for mod in mods])
             
     def reload_mods_with_sort(self):
-        """重新加载MOD列表并排序"""
-        # 保存当前选中状态
-        selected_mods = {}
-        for mod in self.mods:
-            item_id = mod["item_id"]
-            selected_mods[mod["name"]] = self.mod_tree.item(item_id, "text") == "✓"
-        
-        # 重新加载MOD列表
-        self.load_mods()
+        """按优先级重新排序MOD列表（只移动行，不重新加载）"""
+        self._apply_default_order()
     
     def toggle_select_all(self):
         """切换全选/取消全选并更新配置文件"""
-        all_items = self.mod_tree.get_children()
-        if self.select_all_var.get():
-            # 全选
-            for item in all_items:
-                self.mod_tree.item(item, text="✓")
-                
-                # 更新MOD配置
-                for mod in self.mods:
-                    if mod["item_id"] == item:
-                        mod["ignore"] = False
-                        
-                        # 更新配置文件
-                        try:
-                            mod["config"]["ignore"] = False
-                            with open(mod["config_file"], 'w', encoding='utf-8') as f:
-                                json.dump(mod["config"], f, ensure_ascii=False, indent=2)
-                        except Exception as e:
-                            colored_print(f"[错误] 无法更新MOD配置文件: {e}", Colors.RED)
-                        break
-        else:
-            # 取消全选
-            for item in all_items:
-                self.mod_tree.item(item, text="")
-                
-                # 更新MOD配置
-                for mod in self.mods:
-                    if mod["item_id"] == item:
-                        mod["ignore"] = True
-                        
-                        # 更新配置文件
-                        try:
-                            mod["config"]["ignore"] = True
-                            with open(mod["config_file"], 'w', encoding='utf-8') as f:
-                                json.dump(mod["config"], f, ensure_ascii=False, indent=2)
-                        except Exception as e:
-                            colored_print(f"[错误] 无法更新MOD配置文件: {e}", Colors.RED)
-                        break
+        checked = bool(self.select_all_var.get())
+        # 只更新状态发生变化的MOD
+        for mod in self.mods:
+            self._set_mod_checked(mod, checked)
     
     def install_selected_mods(self):
         """安装选中的MOD"""
@@ -674,18 +841,30 @@ class ModInstallerGUI:
     
     def _install_mods_thread(self):
         """在新线程中执行MOD安装"""
+        # 安装事件：进度条和耗时列、控制台阶段耗时、JSONL记录文件
+        event_writer = JsonlEventWriter(os.path.join(get_application_path(), INSTALL_EVENTS_FILE))
+        listeners = [self.event_queue.put, console_listener, event_writer]
+        for listener in listeners:
+            add_listener(listener)
         try:
-            self.status_var.set("正在安装MOD...")
+            self._post_status("正在安装MOD...")
             
-            # 检查并准备MOD配置
-            colored_print("[准备阶段] 检查MOD配置和补丁文件...", Colors.CYAN)
-            check_mod_configs()
+            # 安装前写入所有未保存的配置修改
+            self.config_writer.flush()
             
-            # 安装MOD
-            colored_print("\n[安装阶段] 开始处理MOD文件...\n", Colors.CYAN)
-            if install_mods():
+            # 设置环境变量 SULTAN_MOD_PROFILE=1 时生成性能报告
+            with profile_session(get_application_path()):
+                # 检查并准备MOD配置
+                colored_print("[准备阶段] 检查MOD配置和补丁文件...", Colors.CYAN)
+                check_mod_configs()
+                
+                # 安装MOD
+                colored_print("\n[安装阶段] 开始处理MOD文件...\n", Colors.CYAN)
+                install_ok = install_mods()
+            
+            if install_ok:
                 colored_print("\n[完成] MOD安装成功", Colors.GREEN + Colors.BOLD)
-                self.status_var.set("MOD安装成功")
+                self._post_status("MOD安装成功")
                 
                 # 在主线程中显示成功消息
                 self.root.after(0, lambda: messagebox.showinfo("安装完成", "MOD安装成功！"))
@@ -696,8 +875,8 @@ class ModInstallerGUI:
                 colored_print("\n[警告] MOD安装过程中出现问题，执行还原操作", Colors.YELLOW)
                 game_path = get_game_path()
                 if game_path:
-                    prepare_git_environment(game_path)
-                self.status_var.set("MOD安装失败")
+                    prepare_git_environment(game_path, force=True)
+                self._post_status("MOD安装失败")
                 
                 # 在主线程中显示失败消息
                 self.root.after(0, lambda: messagebox.showwarning("安装失败", "MOD安装过程中出现问题，已执行还原操作。"))
@@ -708,14 +887,18 @@ class ModInstallerGUI:
             try:
                 game_path = get_game_path()
                 if game_path:
-                    prepare_git_environment(game_path)
+                    prepare_git_environment(game_path, force=True)
             except:
                 colored_print("[错误] 还原操作失败", Colors.RED)
             
-            self.status_var.set("安装过程中发生错误")
+            self._post_status("安装过程中发生错误")
             
             # 在主线程中显示错误消息
             self.root.after(0, lambda: messagebox.showerror("错误", f"安装过程中发生异常: {e}"))
+        finally:
+            for listener in listeners:
+                remove_listener(listener)
+            event_writer.close()
     
     def _ask_open_git_tools(self):
         """询问是否打开Git工具"""
@@ -742,26 +925,26 @@ class ModInstallerGUI:
     def _reset_config_thread(self):
         """在新线程中执行配置重置"""
         try:
-            self.status_var.set("正在重置游戏配置...")
+            self._post_status("正在重置游戏配置...")
             
             game_path = get_game_path()
             if not game_path:
                 colored_print("[错误] 无法确定游戏路径", Colors.RED)
-                self.status_var.set("重置失败: 无法确定游戏路径")
+                self._post_status("重置失败: 无法确定游戏路径")
                 return
             
             colored_print("[重置] 正在重置游戏配置...", Colors.CYAN)
-            prepare_git_environment(game_path)
+            prepare_git_environment(game_path, force=True)
             
             colored_print("[完成] 游戏配置已重置", Colors.GREEN)
-            self.status_var.set("游戏配置已重置")
+            self._post_status("游戏配置已重置")
             
             # 在主线程中显示成功消息
             self.root.after(0, lambda: messagebox.showinfo("重置完成", "游戏配置已重置为初始状态。"))
             
         except Exception as e:
             colored_print(f"[错误] 重置过程中发生异常: {e}", Colors.RED)
-            self.status_var.set("重置过程中发生错误")
+            self._post_status("重置过程中发生错误")
             
             # 在主线程中显示错误消息
             self.root.after(0, lambda: messagebox.showerror("错误", f"重置过程中发生异常: {e}"))
@@ -786,6 +969,9 @@ class ModInstallerGUI:
     
     def on_closing(self):
         """窗口关闭时的处理"""
+        # 写入未保存的配置修改
+        self.config_writer.flush()
+        self.log_sink.close()
         # 恢复标准输入输出
         sys.stdout = self.old_stdout
         if hasattr(self, 'old_stdin'):
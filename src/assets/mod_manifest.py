@@ -0,0 +1,275 @@
+import os
+import json
+
+from common_utils import run_git_command
+from git_backend import get_cat_file
+from install_engine import hash_files, list_tree_entries, resolve_commit
+from json_merge import diff_json_text
+
+# 文件清单保存在补丁目录中（不能使用.json/.txt扩展名，否则会被当作MOD文件或说明）
+MANIFEST_NAME = "files.manifest"
+MANIFEST_VERSION = 4
+
+# 文件分类：新增、整文件替换、局部修改、键路径修改、与游戏文件相同
+KIND_NEW = "new"
+KIND_REPLACE = "replace"
+KIND_EDIT = "edit"
+KIND_SEMANTIC = "semantic"
+KIND_SAME = "same"
+
+# 新增和整文件替换的文件直接写入索引，不放进补丁
+OVERLAY_KINDS = (KIND_NEW, KIND_REPLACE)
+
+# 删除的行数达到原文件的这个比例时视为整文件替换
+REPLACE_RATIO = 0.5
+
+# 没有局部修改时写入的空补丁
+EMPTY_PATCH_NAME = "no_edits.patch"
+
+# 键路径修改（同样不能使用.json扩展名）
+SEMANTIC_PATCH_NAME = "semantic.jsonpatch"
+SEMANTIC_PATCH_VERSION = 1
+
+
+def find_mod_json_files(mod_dir):
+    """查找MOD中的所有json文件（不含modConfig.json），返回 [(相对路径, 完整路径), ...]"""
+    json_files = []
+    for root, _, files in os.walk(mod_dir):
+        for file in files:
+            if file.lower().endswith('.json') and file != "modConfig.json":
+                json_path = os.path.join(root, file)
+                json_files.append((os.path.relpath(json_path, mod_dir).replace(os.sep, '/'), json_path))
+    return json_files
+
+
+def get_manifest_path(mod_dir):
+    return os.path.join(mod_dir, "patches", MANIFEST_NAME)
+
+
+def load_manifest(mod_dir):
+    """读取MOD的文件清单，不存在或格式不对时返回None"""
+    try:
+        with open(get_manifest_path(mod_dir), 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+        if manifest.get("version") != MANIFEST_VERSION or not isinstance(manifest.get("files"), dict):
+            return None
+        return manifest
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def save_manifest(mod_dir, manifest):
+    """先写临时文件再替换，避免留下不完整的清单"""
+    path = get_manifest_path(mod_dir)
+    temp_file = path + ".tmp"
+    with open(temp_file, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=1, sort_keys=True)
+    os.replace(temp_file, path)
+
+
+def _file_stat(path):
+    stat = os.stat(path)
+    return stat.st_size, stat.st_mtime_ns
+
+
+def build_manifest(json_files, oids, kinds, commit, patch_name, base_entries):
+    """根据文件、对象ID和文件分类生成清单
+
+    base_entries为生成时游戏中的 {路径: (模式, 对象ID)}，整文件替换记录所基于的游戏文件，
+    安装时游戏文件已更新的话以它为基础合并，而不是直接覆盖。
+    """
+    files = {}
+    for (rel_path, json_path), oid in zip(json_files, oids):
+        size, mtime_ns = _file_stat(json_path)
+        files[rel_path] = {"oid": oid, "kind": kinds[rel_path], "size": size, "mtime_ns": mtime_ns}
+        if kinds[rel_path] in OVERLAY_KINDS:
+            base_entry = base_entries.get(rel_path)
+            files[rel_path]["base"] = base_entry[1] if base_entry else None
+    return {"version": MANIFEST_VERSION, "commit": commit, "patch": patch_name, "files": files}
+
+
+def classify_mod_files(config_dir, base_commit, commit, rel_paths):
+    """按与游戏文件的差异对MOD文件分类，返回 {相对路径: 分类}
+
+    游戏中没有的文件为新增；删除的行数达到原文件REPLACE_RATIO的为整文件替换，
+    这类补丁与整个文件一样大，又几乎不可能与其他MOD的修改按行合并；其余为局部修改。
+    """
+    base_entries = list_tree_entries(config_dir, base_commit, rel_paths)
+    stdout, stderr, code = run_git_command(
+        ['git', 'diff', '--numstat', '-z', '--no-renames', base_commit, commit, '--'] + list(rel_paths),
+        cwd=config_dir, check=False
+    )
+    deleted_lines = {}
+    for record in stdout.split('\0'):
+        fields = record.split('\t', 2)
+        if len(fields) == 3:
+            deleted_lines[fields[2]] = int(fields[1]) if fields[1].isdigit() else None
+
+    kinds = {}
+    cat_file = get_cat_file(config_dir)
+    for rel_path in rel_paths:
+        if rel_path not in base_entries:
+            kinds[rel_path] = KIND_NEW
+        elif rel_path not in deleted_lines:
+            kinds[rel_path] = KIND_SAME
+        else:
+            deleted = deleted_lines[rel_path]
+            blob = cat_file.read(base_entries[rel_path][1])
+            base_lines = (blob[2].count(b'\n') if blob else 0) or 1
+            # 二进制差异（deleted为None）也按整文件处理
+            if deleted is None or deleted >= base_lines * REPLACE_RATIO:
+                kinds[rel_path] = KIND_REPLACE
+            else:
+                kinds[rel_path] = KIND_EDIT
+    return kinds
+
+
+def build_semantic_patch(config_dir, base_commit, kinds, file_oids):
+    """把整文件替换改为键路径修改，返回 {相对路径: [修改, ...]}，同时更新kinds
+
+    MOD通常复制整个游戏文件再修改，格式或键顺序不同就会变成整文件替换。解析两边的JSON后
+    只保留实际修改的键，安装时在当前文件上重放；内容与游戏文件相同的局部修改和整文件替换改为相同。
+    无法解析的文件保持原来的分类。
+    """
+    paths = [path for path, kind in kinds.items() if kind in (KIND_REPLACE, KIND_EDIT)]
+    if not paths:
+        return {}
+    base_entries = list_tree_entries(config_dir, base_commit, paths)
+    cat_file = get_cat_file(config_dir)
+    semantic = {}
+    for path in paths:
+        base_blob = cat_file.read(base_entries[path][1]) if path in base_entries else None
+        mod_blob = cat_file.read(file_oids[path])
+        if not base_blob or not mod_blob:
+            continue
+        try:
+            ops = diff_json_text(base_blob[2].decode('utf-8'), mod_blob[2].decode('utf-8'))
+        except UnicodeDecodeError:
+            ops = None
+        if ops is None:
+            continue
+        if not ops:
+            kinds[path] = KIND_SAME
+        elif kinds[path] == KIND_REPLACE:
+            kinds[path] = KIND_SEMANTIC
+            semantic[path] = ops
+    return semantic
+
+
+def get_semantic_patch_path(mod_dir):
+    return os.path.join(mod_dir, "patches", SEMANTIC_PATCH_NAME)
+
+
+def save_semantic_patch(mod_dir, semantic):
+    """保存键路径修改，没有修改时删除旧文件"""
+    path = get_semantic_patch_path(mod_dir)
+    if not semantic:
+        if os.path.exists(path):
+            os.remove(path)
+        return
+    temp_file = path + ".tmp"
+    with open(temp_file, 'w', encoding='utf-8') as f:
+        json.dump({"version": SEMANTIC_PATCH_VERSION, "files": semantic}, f, ensure_ascii=False, indent=1)
+    os.replace(temp_file, path)
+
+
+def load_semantic_patch(mod_dir):
+    """读取MOD的键路径修改 {相对路径: [修改, ...]}，没有时返回空字典"""
+    try:
+        with open(get_semantic_patch_path(mod_dir), 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        if data.get("version") != SEMANTIC_PATCH_VERSION or not isinstance(data.get("files"), dict):
+            return {}
+        return data["files"]
+    except (OSError, ValueError, AttributeError):
+        return {}
+
+
+def has_semantic_patch(mod_dir, manifest):
+    """清单中有键路径修改时检查对应的文件是否存在"""
+    if not any(info.get("kind") == KIND_SEMANTIC for info in manifest["files"].values()):
+        return True
+    return os.path.exists(get_semantic_patch_path(mod_dir))
+
+
+def semantic_signature(semantic):
+    """键路径修改的内容签名，参与安装缓存的键计算"""
+    return '\n' + json.dumps(semantic, ensure_ascii=False, sort_keys=True) if semantic else ''
+
+
+def load_overlays(config_dir, mod_dir):
+    """读取MOD中需要直接写入索引的文件，返回 {相对路径: (对象ID, 所基于的游戏文件对象ID)}
+
+    新增的文件没有基础版本，记为None。对象库中缺少清单记录的MOD文件时（例如仓库被重新下载），
+    从MOD文件重新写入。
+    """
+    manifest = load_manifest(mod_dir)
+    if manifest is None:
+        return {}
+    overlays = {path: (info["oid"], info.get("base")) for path, info in manifest["files"].items()
+                if info.get("kind") in OVERLAY_KINDS}
+    cat_file = get_cat_file(config_dir)
+    missing = [path for path, (oid, _) in overlays.items() if cat_file.info(oid) is None]
+    if missing:
+        oids = hash_files(config_dir, [os.path.join(mod_dir, *path.split('/')) for path in missing])
+        for path, oid in zip(missing, oids or []):
+            overlays[path] = (oid, overlays[path][1])
+    return overlays
+
+
+def overlay_signature(overlays):
+    """整文件替换的内容签名，参与安装缓存的键计算"""
+    return ''.join(f"\n{path}:{oid}:{base_oid}" for path, (oid, base_oid) in sorted(overlays.items()))
+
+
+def get_patch_base(config_dir, mod_dir):
+    """补丁生成时所基于的游戏版本提交（MOD提交的父提交），没有清单或提交已不存在时返回None"""
+    manifest = load_manifest(mod_dir)
+    if manifest is None or not manifest.get("commit"):
+        return None
+    return resolve_commit(config_dir, f"{manifest['commit']}^")
+
+
+def manifest_oids(manifest):
+    """清单中的 {相对路径: 对象ID}"""
+    return {path: info["oid"] for path, info in manifest["files"].items()}
+
+
+def check_manifest(config_dir, mod_dir, manifest):
+    """检查MOD文件是否与清单一致
+
+    文件集合不同时直接判定为已修改；大小和修改时间都未变化的文件不再计算哈希，
+    只对时间变化的文件重新计算对象ID。内容未变时顺带更新清单中的时间，下次检查更快。
+    """
+    json_files = find_mod_json_files(mod_dir)
+    files = manifest["files"]
+    if {rel_path for rel_path, _ in json_files} != set(files):
+        return False
+
+    touched = []
+    for rel_path, json_path in json_files:
+        try:
+            size, mtime_ns = _file_stat(json_path)
+        except OSError:
+            return False
+        info = files[rel_path]
+        if info.get("size") != size:
+            return False
+        if info.get("mtime_ns") != mtime_ns:
+            touched.append((rel_path, json_path, mtime_ns))
+
+    if not touched:
+        return True
+
+    oids = hash_files(config_dir, [json_path for _, json_path, _ in touched], write=False)
+    if oids is None:
+        return False
+    for (rel_path, _, mtime_ns), oid in zip(touched, oids):
+        if files[rel_path]["oid"] != oid:
+            return False
+        files[rel_path]["mtime_ns"] = mtime_ns
+    try:
+        save_manifest(mod_dir, manifest)
+    except OSError:
+        pass
+    return True
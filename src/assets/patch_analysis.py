@@ -0,0 +1,375 @@
+import os
+import re
+import json
+import codecs
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# 导入公共工具
+from common_utils import run_git_command, get_application_path
+
+# 解析补丁时使用的线程数
+PRECHECK_WORKERS = min(8, (os.cpu_count() or 2) * 2)
+
+# 判断编码时读取的字节数
+ENCODING_PROBE_SIZE = 64 * 1024
+PATCH_ENCODINGS = ('utf-8', 'gbk')
+
+# 补丁索引格式版本，格式变化时使旧缓存失效
+PATCH_INDEX_VERSION = 1
+
+# 二进制补丁视为覆盖整个文件的位置
+WHOLE_FILE = 2 ** 62
+
+_index_dir = None
+
+HUNK_HEADER = re.compile(r'^@@ -(\d+)(?:,(\d+))? \+(\d+)(?:,(\d+))? @@')
+
+
+def unquote_git_path(path):
+    """还原git对非ASCII路径的引号转义（core.quotepath）"""
+    if not (path.startswith('"') and path.endswith('"')):
+        return path
+    raw = path[1:-1].encode('latin-1', errors='backslashreplace')
+    result = bytearray()
+    i = 0
+    escapes = {ord('n'): 10, ord('t'): 9, ord('"'): 34, ord('\\'): 92, ord('a'): 7,
+               ord('b'): 8, ord('f'): 12, ord('r'): 13, ord('v'): 11}
+    while i < len(raw):
+        c = raw[i]
+        if c == 92 and i + 1 < len(raw):
+            nxt = raw[i + 1]
+            if 48 <= nxt <= 55 and i + 3 < len(raw):
+                result.append(int(raw[i + 1:i + 4], 8))
+                i += 4
+                continue
+            result.append(escapes.get(nxt, nxt))
+            i += 2
+            continue
+        result.append(c)
+        i += 1
+    return result.decode('utf-8', errors='replace')
+
+
+def _strip_prefix(path):
+    path = unquote_git_path(path)
+    if path.startswith('a/') or path.startswith('b/'):
+        return path[2:]
+    return path
+
+
+def _parse_diff_header(line):
+    """从 diff --git 行中取出目标路径"""
+    rest = line[len('diff --git '):].rstrip('\r\n')
+    if rest.startswith('"'):
+        # 带引号的路径: "a/..." "b/..."
+        end = rest.index('"', 1)
+        while rest[end - 1] == '\\':
+            end = rest.index('"', end + 1)
+        return _strip_prefix(rest[end + 1:].strip())
+    parts = rest.split(' b/', 1)
+    return parts[1] if len(parts) == 2 else _strip_prefix(rest)
+
+
+def detect_patch_encoding(patch_file):
+    """只读取补丁开头的一部分来判断编码"""
+    with open(patch_file, 'rb') as f:
+        prefix = f.read(ENCODING_PROBE_SIZE)
+    for encoding in PATCH_ENCODINGS:
+        try:
+            # 前缀可能在多字节字符中间截断，使用增量解码器容忍末尾不完整
+            codecs.getincrementaldecoder(encoding)().decode(prefix, final=False)
+            return encoding
+        except UnicodeDecodeError:
+            continue
+    return 'latin-1'
+
+
+def decode_patch_line(raw_line, encoding):
+    """解码一行，返回 (文本, 是否为UTF-8)
+
+    补丁头部通常由git以UTF-8写出，而文件内容可能是GBK，所以每行先尝试UTF-8，
+    再使用从文件开头检测到的编码。
+    """
+    for candidate in ('utf-8', encoding) + PATCH_ENCODINGS:
+        try:
+            return raw_line.decode(candidate), candidate == 'utf-8'
+        except UnicodeDecodeError:
+            continue
+    return raw_line.decode('latin-1'), False
+
+
+def iter_patch_lines(patch_file, encoding=None):
+    """逐行读取并解码补丁，不把整个文件读入内存"""
+    encoding = encoding or detect_patch_encoding(patch_file)
+    with open(patch_file, 'rb') as f:
+        for raw_line in f:
+            yield decode_patch_line(raw_line, encoding)
+
+
+def _add_change(changes, pos):
+    """把改动位置合并为连续区间 [起始, 结束]"""
+    if changes and changes[-1][1] + 1 >= pos:
+        changes[-1][1] = max(changes[-1][1], pos)
+    else:
+        changes.append([pos, pos])
+
+
+def iter_patch_records(lines):
+    """从补丁文本行中惰性产出记录
+
+    ("file", 路径) 表示进入新的文件，("status", 路径, add/delete) 表示文件状态，
+    ("hunk", 路径, 上下文起始, 上下文结束, [[改动起始, 改动结束], ...]) 表示一个hunk。
+    位置使用旧文件的“双倍行号”：2*n 表示第n行本身，2*n+1 表示第n行之后的插入点，
+    便于判断改动是否落在其他补丁的上下文中。
+    """
+    path = None
+    hunk = None
+    old_line = 0
+    old_remaining = new_remaining = 0
+
+    for line in lines:
+        if old_remaining > 0 or new_remaining > 0:
+            tag = line[:1]
+            if tag == ' ':
+                old_line += 1
+                old_remaining -= 1
+                new_remaining -= 1
+            elif tag == '-':
+                old_line += 1
+                _add_change(hunk[4], 2 * old_line)
+                old_remaining -= 1
+            elif tag == '+':
+                # 插入在当前旧行之后
+                _add_change(hunk[4], 2 * old_line + 1)
+                new_remaining -= 1
+            elif tag == '\\':
+                pass
+            else:
+                old_remaining = new_remaining = 0
+            if old_remaining <= 0 and new_remaining <= 0:
+                yield hunk
+                hunk = None
+            continue
+
+        if line.startswith('diff --git '):
+            path = _parse_diff_header(line)
+            yield ("file", path)
+        elif path is None:
+            continue
+        elif line.startswith('new file mode'):
+            yield ("status", path, "add")
+        elif line.startswith('deleted file mode'):
+            yield ("status", path, "delete")
+        elif line.startswith('GIT binary patch') or line.startswith('Binary files'):
+            # 二进制补丁视为改动整个文件
+            yield ("hunk", path, 0, WHOLE_FILE, [[0, WHOLE_FILE]])
+        elif line.startswith('@@'):
+            match = HUNK_HEADER.match(line)
+            if not match:
+                continue
+            old_start = int(match.group(1))
+            old_len = int(match.group(2)) if match.group(2) is not None else 1
+            new_len = int(match.group(4)) if match.group(4) is not None else 1
+            if old_len > 0:
+                hunk = ("hunk", path, 2 * old_start, 2 * (old_start + old_len - 1), [])
+                old_line = old_start - 1
+            else:
+                hunk = ("hunk", path, 2 * old_start + 1, 2 * old_start + 1, [])
+                old_line = old_start
+            old_remaining, new_remaining = old_len, new_len
+
+    if hunk is not None:
+        yield hunk
+
+
+def scan_patch(patch_file):
+    """流式解析补丁文件，返回 {"encoding": 编码, "utf8": 是否全部为UTF-8, "files": {...}}
+
+    files 为 {路径: {"status": add/modify/delete, "hunks": [(上下文起始, 上下文结束, 改动区间), ...]}}
+    """
+    encoding = detect_patch_encoding(patch_file)
+    state = {"utf8": True}
+
+    def lines():
+        for text, is_utf8 in iter_patch_lines(patch_file, encoding):
+            if not is_utf8:
+                state["utf8"] = False
+            yield text
+
+    files = {}
+    for record in iter_patch_records(lines()):
+        if record[0] == "file":
+            files.setdefault(record[1], {"status": "modify", "hunks": []})
+        elif record[0] == "status":
+            files[record[1]]["status"] = record[2]
+        else:
+            files[record[1]]["hunks"].append(list(record[2:]))
+    return {"encoding": encoding, "utf8": state["utf8"], "files": files}
+
+
+def get_index_dir():
+    """补丁索引缓存目录"""
+    global _index_dir
+    if _index_dir is None:
+        _index_dir = os.path.join(get_application_path(), "cache", "patch_index")
+    return _index_dir
+
+
+def load_patch_index(patch_file):
+    """读取补丁的hunk索引，补丁未变化时直接使用磁盘上的缓存"""
+    patch_file = os.path.abspath(patch_file)
+    stat = os.stat(patch_file)
+    signature = [stat.st_size, stat.st_mtime_ns]
+    key = hashlib.sha1(os.path.normcase(patch_file).encode('utf-8')).hexdigest()
+    index_file = os.path.join(get_index_dir(), key + ".json")
+
+    try:
+        with open(index_file, 'r', encoding='utf-8') as f:
+            index = json.load(f)
+        if index.get("version") == PATCH_INDEX_VERSION and index.get("signature") == signature:
+            return index
+    except (OSError, ValueError):
+        pass
+
+    index = scan_patch(patch_file)
+    index["version"] = PATCH_INDEX_VERSION
+    index["signature"] = signature
+    try:
+        os.makedirs(get_index_dir(), exist_ok=True)
+        temp_file = f"{index_file}.{threading.get_ident()}.tmp"
+        with open(temp_file, 'w', encoding='utf-8') as f:
+            json.dump(index, f, ensure_ascii=False)
+        os.replace(temp_file, index_file)
+    except OSError:
+        pass
+    return index
+
+
+def parse_patch(patch_file):
+    """解析补丁文件，返回 {路径: {"status": ..., "hunks": [...]}}"""
+    return load_patch_index(patch_file)["files"]
+
+
+def get_patch_paths(patch_file):
+    """读取补丁涉及的文件路径（相对于配置目录）"""
+    return list(parse_patch(patch_file).keys())
+
+
+def ensure_utf8_patch(patch_file):
+    """补丁含非UTF-8内容时逐行转码为UTF-8副本，返回 (实际使用的补丁路径, 是否转码)"""
+    index = load_patch_index(patch_file)
+    if index["utf8"]:
+        return patch_file, False
+
+    utf8_file = patch_file + ".utf8"
+    # 副本比补丁新时无需重新转码
+    if os.path.exists(utf8_file) and os.path.getmtime(utf8_file) >= os.path.getmtime(patch_file):
+        return utf8_file, True
+
+    temp_file = utf8_file + ".tmp"
+    with open(temp_file, 'w', encoding='utf-8', newline='') as f:
+        for text, _ in iter_patch_lines(patch_file, index["encoding"]):
+            f.write(text)
+    os.replace(temp_file, utf8_file)
+    return utf8_file, True
+
+
+def _changes_hit_context(changes_patch, context_patch):
+    """判断一个补丁的改动是否落在另一个补丁的上下文范围内"""
+    for _, _, changes in changes_patch["hunks"]:
+        for start, end, _ in context_patch["hunks"]:
+            for change_start, change_end in changes:
+                if change_start <= end and start <= change_end:
+                    return True
+    return False
+
+
+def files_overlap(first, second):
+    """判断两个补丁对同一文件的修改是否重叠"""
+    if first["status"] != "modify" or second["status"] != "modify":
+        return True
+    return _changes_hit_context(first, second) or _changes_hit_context(second, first)
+
+
+def build_overlap_matrix(parsed_patches):
+    """构建MOD两两之间的重叠矩阵: {mod: {other_mod: [路径...]}}"""
+    # 先按文件分组，只比较修改了同一文件的MOD
+    by_path = {}
+    for mod_name, files in parsed_patches.items():
+        for path in files:
+            by_path.setdefault(path, []).append(mod_name)
+
+    matrix = {mod_name: {} for mod_name in parsed_patches}
+    for path, mods in by_path.items():
+        for i, first in enumerate(mods):
+            for second in mods[i + 1:]:
+                if files_overlap(parsed_patches[first][path], parsed_patches[second][path]):
+                    matrix[first].setdefault(second, []).append(path)
+                    matrix[second].setdefault(first, []).append(path)
+    return matrix
+
+
+def list_tree_paths(config_dir, rev):
+    """列出提交中的所有文件路径"""
+    stdout, stderr, code = run_git_command(
+        ['git', '-c', 'core.quotepath=false', 'ls-tree', '-r', '--name-only', rev],
+        cwd=config_dir, check=False
+    )
+    return set(stdout.splitlines()) if code == 0 else None
+
+
+def _parse_mod_patch(item):
+    mod_name, patch_file = item
+    try:
+        return mod_name, parse_patch(patch_file)
+    except Exception:
+        return mod_name, None
+
+
+def precheck_mods(config_dir, base_rev, mod_patches):
+    """安装前并发解析所有补丁，预测哪些MOD会应用失败
+
+    mod_patches为按安装顺序排列的 [(MOD名称, 补丁路径), ...]。
+    返回 {"patches": {MOD: 解析结果}, "overlaps": 重叠矩阵,
+          "failures": {MOD: {"conflicts": {其他MOD: [路径]}, "missing": [路径]}}}
+    """
+    with ThreadPoolExecutor(max_workers=PRECHECK_WORKERS) as executor:
+        results = list(executor.map(_parse_mod_patch, mod_patches))
+
+    parsed = {mod_name: files for mod_name, files in results if files is not None}
+    overlaps = build_overlap_matrix(parsed)
+    base_paths = list_tree_paths(config_dir, base_rev)
+
+    # 按安装顺序模拟：与已接受的MOD重叠、或修改基础版本中不存在的文件，都会失败
+    failures = {}
+    accepted = []
+    added_paths = set()
+    for mod_name, _ in mod_patches:
+        files = parsed.get(mod_name)
+        if files is None:
+            continue
+
+        missing = []
+        if base_paths is not None:
+            for path, info in files.items():
+                exists = path in base_paths or path in added_paths
+                if (info["status"] == "add") == exists:
+                    missing.append(path)
+
+        conflicts = {}
+        for other in accepted:
+            if other in overlaps[mod_name]:
+                conflicts[other] = overlaps[mod_name][other]
+
+        if missing or conflicts:
+            failures[mod_name] = {"conflicts": conflicts, "missing": missing}
+            continue
+
+        accepted.append(mod_name)
+        for path, info in files.items():
+            if info["status"] == "add":
+                added_paths.add(path)
+
+    return {"patches": parsed, "overlaps": overlaps, "failures": failures}